@@ -0,0 +1,236 @@
+"""Approximate distance/duration matrices from straight-line distances.
+
+Road distance is modeled as haversine distance times a detour factor, and
+duration as road distance over a typical driving speed. Both factors are
+learned per straight-line distance band from real ORS matrix cells and
+shrunk towards city-wide priors while a band has little data. Completed
+routes that recorded their driven distance also teach the detour factor
+(their durations include traffic and stops, so they do not teach speed).
+
+A 500-stop matrix is a handful of NumPy operations.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Straight-line distance bands (km): <1, 1-3, 3-7, 7-15, 15-30, >30
+BAND_EDGES_KM = np.array([1.0, 3.0, 7.0, 15.0, 30.0])
+NUM_BANDS = len(BAND_EDGES_KM) + 1
+PRIOR_DETOUR = 1.35
+PRIOR_SPEED_KMH = 24.0
+# Weight of the priors, in km of observed straight-line distance per band
+PRIOR_WEIGHT_KM = 10.0
+# Pairs closer than this are dominated by snapping noise
+MIN_OBSERVED_KM = 0.05
+SAVE_INTERVAL_SECONDS = 60.0
+ROUTE_DISTANCE_KEYS = ("total_distance_km", "distance_km", "driven_distance_km")
+
+SOURCE_MATRIX = 0
+SOURCE_ROUTES = 1
+# Per band: straight-line km, road km, road km that had a duration, seconds
+_HAV, _ROAD, _TIMED_ROAD, _SECONDS = range(4)
+
+
+def haversine_matrix(coords_latlon: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """All-pairs great-circle distances in km."""
+    pts = np.radians(np.asarray(coords_latlon, dtype=np.float64).reshape(-1, 2))
+    lat, lon = pts[:, 0], pts[:, 1]
+    dlat = lat[None, :] - lat[:, None]
+    dlon = lon[None, :] - lon[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_pairs(src: Sequence[Tuple[float, float]], dst: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """len(src) x len(dst) great-circle distances in km."""
+    a_pts = np.radians(np.asarray(src, dtype=np.float64).reshape(-1, 2))
+    b_pts = np.radians(np.asarray(dst, dtype=np.float64).reshape(-1, 2))
+    dlat = b_pts[None, :, 0] - a_pts[:, None, 0]
+    dlon = b_pts[None, :, 1] - a_pts[:, None, 1]
+    a = (np.sin(dlat / 2) ** 2
+         + np.cos(a_pts[:, 0])[:, None] * np.cos(b_pts[:, 0])[None, :] * np.sin(dlon / 2) ** 2)
+    return 6371.0 * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _bands(hav_km: np.ndarray) -> np.ndarray:
+    return np.searchsorted(BAND_EDGES_KM, hav_km, side="right")
+
+
+class DetourModel:
+    def __init__(self, db_path: Optional[str] = None, prior_detour: float = PRIOR_DETOUR,
+                 prior_speed_kmh: float = PRIOR_SPEED_KMH, prior_weight_km: float = PRIOR_WEIGHT_KM):
+        self.db_path = db_path
+        self.prior_detour = prior_detour
+        self.prior_speed_kmh = prior_speed_kmh
+        self.prior_weight_km = prior_weight_km
+        # [source, band, statistic]; only matrix-learned sums are persisted
+        self._sums = np.zeros((2, NUM_BANDS, 4))
+        self._samples = np.zeros((2, NUM_BANDS), dtype=np.int64)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        if db_path:
+            self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _load(self) -> None:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS detour_stats (
+                    band INTEGER PRIMARY KEY,
+                    hav_km REAL NOT NULL,
+                    road_km REAL NOT NULL,
+                    timed_road_km REAL NOT NULL,
+                    seconds REAL NOT NULL,
+                    samples INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+            for band, hav, road, timed, seconds, samples in conn.execute("SELECT * FROM detour_stats"):
+                if 0 <= band < NUM_BANDS:
+                    self._sums[SOURCE_MATRIX, band] = (hav, road, timed, seconds)
+                    self._samples[SOURCE_MATRIX, band] = samples
+        finally:
+            conn.close()
+
+    def save(self) -> None:
+        if not self.db_path:
+            return
+        with self._lock:
+            rows = [(band, *self._sums[SOURCE_MATRIX, band].tolist(), int(self._samples[SOURCE_MATRIX, band]))
+                    for band in range(NUM_BANDS)]
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            conn = self._connect()
+            try:
+                conn.executemany("INSERT OR REPLACE INTO detour_stats VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def observe(self, hav_km: np.ndarray, road_km: np.ndarray, seconds: Optional[np.ndarray] = None,
+                source: int = SOURCE_MATRIX) -> int:
+        """Add observed (straight-line, road) distances and optionally durations; returns pairs used."""
+        hav = np.asarray(hav_km, dtype=np.float64).ravel()
+        road = np.asarray(road_km, dtype=np.float64).ravel()
+        secs = np.full_like(hav, np.nan) if seconds is None else np.asarray(seconds, dtype=np.float64).ravel()
+        valid = np.isfinite(hav) & np.isfinite(road) & (hav >= MIN_OBSERVED_KM) & (road >= hav * 0.9)
+        if not valid.any():
+            return 0
+        hav, road, secs = hav[valid], road[valid], secs[valid]
+        timed = np.isfinite(secs) & (secs > 0)
+        bands = _bands(hav)
+        with self._lock:
+            sums = self._sums[source]
+            np.add.at(sums[:, _HAV], bands, hav)
+            np.add.at(sums[:, _ROAD], bands, road)
+            np.add.at(sums[:, _TIMED_ROAD], bands[timed], road[timed])
+            np.add.at(sums[:, _SECONDS], bands[timed], secs[timed])
+            np.add.at(self._samples[source], bands, 1)
+            if source == SOURCE_MATRIX:
+                self._dirty = True
+            due = self._dirty and time.time() - self._last_save > SAVE_INTERVAL_SECONDS
+        if due:
+            self.save()
+        return int(valid.sum())
+
+    def observe_route(self, coords_latlon: Sequence[Tuple[float, float]], driven_km: float) -> bool:
+        """Learn the detour factor from one completed route and its driven distance."""
+        if len(coords_latlon) < 2 or not driven_km or driven_km <= 0:
+            return False
+        pts = np.asarray(coords_latlon, dtype=np.float64)
+        legs = np.diag(haversine_pairs(pts[:-1], pts[1:]))
+        hav = float(legs.sum())
+        if hav < MIN_OBSERVED_KM:
+            return False
+        # Only the route total was driven-measured; split it over legs by straight-line share
+        road = legs * (driven_km / hav)
+        return self.observe(legs, road, source=SOURCE_ROUTES) > 0
+
+    def factors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(detour factor, speed km/h) per distance band."""
+        with self._lock:
+            sums = self._sums.sum(axis=0)
+            matrix_sums = self._sums[SOURCE_MATRIX].copy()
+        w = self.prior_weight_km
+        detour = (sums[:, _ROAD] + w * self.prior_detour) / (sums[:, _HAV] + w)
+        speed_kmh = ((matrix_sums[:, _TIMED_ROAD] + w * self.prior_detour)
+                     / (matrix_sums[:, _SECONDS] / 3600.0 + w * self.prior_detour / self.prior_speed_kmh))
+        return detour, speed_kmh
+
+    def estimate(self, coords_latlon: Sequence[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(road km, seconds) n x n arrays."""
+        hav = haversine_matrix(coords_latlon)
+        detour, speed_kmh = self.factors()
+        bands = _bands(hav)
+        road = hav * detour[bands]
+        seconds = road / speed_kmh[bands] * 3600.0
+        np.fill_diagonal(road, 0.0)
+        np.fill_diagonal(seconds, 0.0)
+        return road, seconds
+
+    def matrix(self, coords_latlon: Sequence[Tuple[float, float]]) -> Dict[str, Any]:
+        """Approximate matrix in the ORS response shape (km / seconds)."""
+        road, seconds = self.estimate(coords_latlon)
+        return {"distances": road.tolist(), "durations": seconds.tolist(), "approximate": True}
+
+    def stats(self) -> Dict[str, Any]:
+        detour, speed_kmh = self.factors()
+        with self._lock:
+            samples = self._samples.copy()
+        return {
+            "bands_km": [f"<{BAND_EDGES_KM[0]:g}"]
+                        + [f"{a:g}-{b:g}" for a, b in zip(BAND_EDGES_KM, BAND_EDGES_KM[1:])]
+                        + [f">{BAND_EDGES_KM[-1]:g}"],
+            "detour_factor": [round(float(x), 3) for x in detour],
+            "speed_kmh": [round(float(x), 1) for x in speed_kmh],
+            "matrix_samples": samples[SOURCE_MATRIX].tolist(),
+            "route_samples": samples[SOURCE_ROUTES].tolist(),
+        }
+
+
+def route_distance_km(metadata: Dict[str, Any]) -> Optional[float]:
+    """Driven distance recorded in a completed route's metadata, if any."""
+    for key in ROUTE_DISTANCE_KEYS:
+        value = metadata.get(key)
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+    return None
+
+
+def load_route_observations(db_path: str) -> List[Tuple[List[Tuple[float, float]], float]]:
+    """(coordinates, driven km) for training routes whose metadata records a driven distance."""
+    routes: List[Tuple[List[Tuple[float, float]], float]] = []
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            records = conn.execute("SELECT coordinates, route_metadata FROM training_data").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return routes
+    for coords_json, metadata_json in records:
+        try:
+            coords = [(float(p[0]), float(p[1])) for p in json.loads(coords_json) if len(p) >= 2]
+            metadata = json.loads(metadata_json) or {}
+        except (TypeError, ValueError):
+            continue
+        driven = route_distance_km(metadata) if isinstance(metadata, dict) else None
+        if driven and len(coords) >= 2:
+            routes.append((coords, driven))
+    return routes
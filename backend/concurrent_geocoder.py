@@ -0,0 +1,167 @@
+"""Bounded-concurrency geocoding stage used by route planning."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from geocode_cache import normalize_address
+
+GeocodeFn = Callable[[str], Tuple[Optional[Tuple[float, float]], str]]
+AsyncGeocodeFn = Callable[[str], Awaitable[Tuple[Optional[Tuple[float, float]], str]]]
+
+
+@dataclass
+class GeocodeOutcome:
+    index: int
+    address: str
+    coords: Optional[Tuple[float, float]]
+    source: str  # provider name, "not_found", "error" or "cancelled"
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.coords is not None
+
+    @property
+    def permanent_failure(self) -> bool:
+        """Every provider answered and none matched; retrying will not help."""
+        return self.coords is None and self.source == "not_found"
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "index": self.index,
+            "address": self.address,
+            "coordinates": list(self.coords) if self.coords else None,
+            "source": self.source,
+            "error": self.error,
+        }
+
+
+def _run(geocode_fn: GeocodeFn, address: str) -> Tuple[Optional[Tuple[float, float]], str, Optional[str]]:
+    try:
+        coords, source = geocode_fn(address)
+        return coords, source, None
+    except Exception as e:
+        return None, "error", str(e)
+
+
+async def _run_async(geocode_fn: AsyncGeocodeFn, address: str,
+                     semaphore: asyncio.Semaphore) -> Tuple[Optional[Tuple[float, float]], str, Optional[str]]:
+    async with semaphore:
+        try:
+            coords, source = await geocode_fn(address)
+            return coords, source, None
+        except Exception as e:
+            return None, "error", str(e)
+
+
+def dedupe_addresses(addresses: List[str]) -> Dict[str, Tuple[str, List[int]]]:
+    """Group input positions by normalized address: key -> (first spelling, indices)."""
+    groups: Dict[str, Tuple[str, List[int]]] = {}
+    for i, addr in enumerate(addresses):
+        key = normalize_address(addr) or addr
+        if key not in groups:
+            groups[key] = (addr, [])
+        groups[key][1].append(i)
+    return groups
+
+
+def iter_geocode_as_completed(addresses: List[str], geocode_fn: GeocodeFn,
+                              max_workers: int = 8) -> Iterator[Tuple[str, List[int], GeocodeOutcome]]:
+    """Yield (key, input indices, outcome) for each unique address as soon as it resolves."""
+    groups = dedupe_addresses(addresses)
+    if not groups:
+        return
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups))))
+    try:
+        futures = {executor.submit(_run, geocode_fn, addr): key for key, (addr, _) in groups.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            addr, indices = groups[key]
+            coords, source, error = future.result()
+            yield key, indices, GeocodeOutcome(index=indices[0], address=addr, coords=coords,
+                                               source=source, error=error)
+    finally:
+        # Also runs when a streaming client disconnects mid-batch
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def geocode_concurrently(addresses: List[str], geocode_fn: GeocodeFn, max_workers: int = 8,
+                         fail_fast: bool = True) -> List[GeocodeOutcome]:
+    """Geocode addresses on a bounded thread pool, preserving input order.
+
+    Duplicate addresses (after normalization) are looked up once. With
+    fail_fast, the first permanent failure cancels queued lookups and stops
+    waiting on running ones; those come back with source "cancelled".
+    """
+    if not addresses:
+        return []
+
+    unique = {key: addr for key, (addr, _) in dedupe_addresses(addresses).items()}
+
+    results: Dict[str, Tuple[Optional[Tuple[float, float]], str, Optional[str]]] = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique))))
+    try:
+        futures = {executor.submit(_run, geocode_fn, addr): key for key, addr in unique.items()}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            stop = False
+            for future in done:
+                coords, source, error = future.result()
+                results[futures[future]] = (coords, source, error)
+                if fail_fast and coords is None and source == "not_found":
+                    stop = True
+            if stop:
+                for future in pending:
+                    future.cancel()
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return _ordered_outcomes(addresses, results)
+
+
+async def geocode_concurrently_async(addresses: List[str], geocode_fn: AsyncGeocodeFn, max_concurrency: int = 32,
+                                     fail_fast: bool = True) -> List[GeocodeOutcome]:
+    """geocode_concurrently for coroutines: lookups are tasks, not threads.
+
+    With fail_fast, the first permanent failure cancels every lookup that
+    is still running.
+    """
+    if not addresses:
+        return []
+
+    unique = {key: addr for key, (addr, _) in dedupe_addresses(addresses).items()}
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    tasks = {asyncio.ensure_future(_run_async(geocode_fn, addr, semaphore)): key for key, addr in unique.items()}
+
+    results: Dict[str, Tuple[Optional[Tuple[float, float]], str, Optional[str]]] = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            stop = False
+            for task in done:
+                coords, source, error = task.result()
+                results[tasks[task]] = (coords, source, error)
+                if fail_fast and coords is None and source == "not_found":
+                    stop = True
+            if stop:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return _ordered_outcomes(addresses, results)
+
+
+def _ordered_outcomes(addresses: List[str],
+                      results: Dict[str, Tuple[Optional[Tuple[float, float]], str, Optional[str]]]) -> List[GeocodeOutcome]:
+    outcomes = []
+    for i, addr in enumerate(addresses):
+        key = normalize_address(addr) or addr
+        coords, source, error = results.get(key, (None, "cancelled", None))
+        outcomes.append(GeocodeOutcome(index=i, address=addr, coords=coords, source=source, error=error))
+    return outcomes
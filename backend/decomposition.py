@@ -0,0 +1,226 @@
+"""Cluster-first ordering for routes with hundreds of stops.
+
+Stops are grouped with k-means on projected coordinates, clusters are
+visited in the order of a tour over their centroids, and each cluster is
+solved on its own as a path from an entry stop to an exit stop chosen
+where it meets its neighbours. The stitched route is then polished around
+the joins. hilbert_order is the instant O(n log n) answer: stops in the
+order a Hilbert curve passes them.
+"""
+
+import logging
+import math
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from route_optimizer import (CostMatrix, OrderResult, chained_local_search, finite_costs, local_improvement,
+                             optimize_order, start_pool, _path_cost, _to_start_copy)
+
+logger = logging.getLogger(__name__)
+
+# Stops per cluster; small enough that each solves well within its budget share
+DECOMPOSE_CLUSTER_SIZE = 75
+KMEANS_ITERATIONS = 25
+HILBERT_BITS = 16
+# Positions either side of a join that the boundary pass starts from
+BOUNDARY_WINDOW = 8
+KM_PER_DEGREE = 111.2
+
+
+def _project_km(coords_latlon: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """Equirectangular (x, y) in km around the points' mean latitude; fine at city scale."""
+    pts = np.asarray(coords_latlon, dtype=np.float64).reshape(-1, 2)
+    lat0 = math.radians(float(pts[:, 0].mean())) if len(pts) else 0.0
+    return np.column_stack((pts[:, 1] * KM_PER_DEGREE * math.cos(lat0), pts[:, 0] * KM_PER_DEGREE))
+
+
+def _hilbert_index(xy: np.ndarray, bits: int = HILBERT_BITS) -> np.ndarray:
+    """Position of each point along a Hilbert curve over the points' bounding box."""
+    lo, hi = xy.min(axis=0), xy.max(axis=0)
+    side = (1 << bits) - 1
+    scaled = ((xy - lo) / np.maximum(hi - lo, 1e-12) * side).astype(np.int64)
+    x, y = scaled[:, 0].copy(), scaled[:, 1].copy()
+    d = np.zeros(len(xy), dtype=np.int64)
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rotate the quadrant so the sub-curve is in standard orientation
+        flip = ~ry & rx
+        x = np.where(flip, side - x, x)
+        y = np.where(flip, side - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+
+def hilbert_order(coords_latlon: Sequence[Tuple[float, float]], start: int = 0, end: Optional[int] = None) -> List[int]:
+    """Stops in Hilbert-curve order, read as a loop from start (end, if given, moved last)."""
+    n = len(coords_latlon)
+    if n <= 2:
+        order = [start] + [i for i in range(n) if i != start]
+    else:
+        curve = np.argsort(_hilbert_index(_project_km(coords_latlon)), kind="stable").tolist()
+        at = curve.index(start)
+        order = curve[at:] + curve[:at]
+    if end is not None and end != start:
+        order.remove(end)
+        order.append(end)
+    return order
+
+
+def instant_order(matrix: CostMatrix, coords_latlon: Sequence[Tuple[float, float]], start: int,
+                  end: Optional[int] = None) -> OrderResult:
+    """hilbert_order priced on matrix, without any search."""
+    order = hilbert_order(coords_latlon, start, end)
+    return OrderResult(order, _path_cost(finite_costs(matrix), order, end == start), "hilbert", False)
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Cluster label per point: k-means++ seeding, then vectorized Lloyd iterations."""
+    n = len(points)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    centers = [points[rng.integers(n)]]
+    nearest = np.full(n, np.inf)
+    for _ in range(1, k):
+        nearest = np.minimum(nearest, ((points - centers[-1]) ** 2).sum(axis=1))
+        total = nearest.sum()
+        pick = rng.choice(n, p=nearest / total) if total > 0 else rng.integers(n)
+        centers.append(points[pick])
+    centers = np.array(centers)
+    labels = np.zeros(n, dtype=np.int64)
+    for iteration in range(iterations):
+        dist = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = dist.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        filled = counts > 0
+        centers[filled] = sums[filled] / counts[filled][:, None]
+    # Drop clusters that ended up empty
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def _cluster_sequence(costs: np.ndarray, clusters: List[np.ndarray], first: int,
+                      last: Optional[int]) -> List[int]:
+    """Visiting order of clusters by a tour over average inter-cluster costs, from first (to last)."""
+    between = np.array([[costs[np.ix_(a, b)].mean() if i != j else 0.0 for j, b in enumerate(clusters)]
+                        for i, a in enumerate(clusters)])
+    return optimize_order(between, first, last, time_budget_s=0.1).order
+
+
+def _joins(costs: np.ndarray, clusters: List[np.ndarray], sequence: List[int],
+           entry: int, exit_: Optional[int]) -> List[Tuple[int, Optional[int]]]:
+    """(entry, exit) stop of each cluster in sequence: the cheapest link between consecutive clusters.
+
+    A cluster with more than one stop never enters and leaves at the same stop.
+    """
+    ends: List[List[Optional[int]]] = [[None, None] for _ in sequence]
+    ends[0][0] = entry
+    ends[-1][1] = exit_
+    for pos in range(len(sequence) - 1):
+        a, b = clusters[sequence[pos]], clusters[sequence[pos + 1]]
+        link = costs[np.ix_(a, b)].copy()
+        if len(a) > 1 and ends[pos][0] is not None:
+            link[a == ends[pos][0], :] = np.inf
+        if len(b) > 1 and pos + 1 == len(sequence) - 1 and exit_ is not None:
+            link[:, b == exit_] = np.inf
+        i, j = np.unravel_index(int(np.argmin(link)), link.shape)
+        ends[pos][1] = int(a[i])
+        ends[pos + 1][0] = int(b[j])
+    return [(int(e[0]), e[1]) for e in ends]
+
+
+def _solve_cluster(sub: np.ndarray, entry: int, exit_: Optional[int], time_budget_s: Optional[float]) -> List[int]:
+    """Order one cluster on its own sub-matrix; process pool entry point."""
+    return optimize_order(sub, entry, exit_, time_budget_s=time_budget_s).order
+
+
+def _solve_clusters(costs: np.ndarray, members: List[np.ndarray], ends: List[Tuple[int, Optional[int]]],
+                    time_budget_s: Optional[float], workers: int) -> List[List[int]]:
+    """Every cluster's path (as stop indices), across the process pool when workers > 1."""
+    tasks = []
+    for nodes, (entry, exit_) in zip(members, ends):
+        local = {int(node): p for p, node in enumerate(nodes)}
+        tasks.append((costs[np.ix_(nodes, nodes)], local[entry], None if exit_ is None else local[exit_]))
+    budget = None
+    if time_budget_s is not None:
+        # Clusters run workers at a time, so each gets its share of the wall-clock budget
+        budget = time_budget_s * min(workers, len(tasks)) / len(tasks)
+    results = None
+    if workers > 1 and len(tasks) > 1:
+        try:
+            pool = start_pool(workers)
+            futures = [pool.submit(_solve_cluster, sub, entry, exit_, budget) for sub, entry, exit_ in tasks]
+            results = [future.result() for future in futures]
+        except Exception as e:
+            logger.warning(f"⚠️ Parallel cluster solve failed ({e}); running in-process")
+    if results is None:
+        results = [_solve_cluster(sub, entry, exit_, budget) for sub, entry, exit_ in tasks]
+    return [[int(nodes[p]) for p in order] for nodes, order in zip(members, results)]
+
+
+def decompose_order(matrix: CostMatrix, coords_latlon: Sequence[Tuple[float, float]], start: int,
+                    end: Optional[int] = None, time_budget_s: Optional[float] = None, workers: int = 1,
+                    cluster_size: int = DECOMPOSE_CLUSTER_SIZE, seed: int = 0) -> OrderResult:
+    """Cluster, solve clusters (in parallel), stitch, then improve around the joins.
+
+    The start and a fixed end are clusters of their own at either end of
+    the cluster sequence (end == start makes the cluster tour closed).
+    Whatever budget is left after the boundary pass goes to chained local
+    search over the whole route. The Hilbert order is priced as the
+    heuristic baseline. Routes that fit in one cluster go to optimize_order.
+    """
+    started = time.monotonic()
+    deadline = None if time_budget_s is None else started + time_budget_s
+    costs = finite_costs(matrix)
+    n = len(costs)
+    closed = end == start
+    fixed_end = end is not None and not closed
+    free = np.array([i for i in range(n) if i != start and not (fixed_end and i == end)], dtype=np.int64)
+    if len(free) <= cluster_size:
+        return optimize_order(costs, start, end, time_budget_s=time_budget_s, workers=workers)
+    hilbert = hilbert_order(coords_latlon, start, end)
+    hilbert_cost = _path_cost(costs, hilbert, closed)
+    labels = kmeans(_project_km([coords_latlon[i] for i in free]), math.ceil(len(free) / cluster_size), seed=seed)
+    clusters = [np.array([start])] + [free[labels == c] for c in range(labels.max() + 1)]
+    last = 0 if closed else None
+    if fixed_end:
+        clusters.append(np.array([end]))
+        last = len(clusters) - 1
+    sequence = _cluster_sequence(costs, clusters, 0, last)
+    ends = _joins(costs, clusters, sequence, start, end if fixed_end else None)
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic()) / 2
+    paths = _solve_clusters(costs, [clusters[c] for c in sequence], ends, remaining, workers)
+    order = [stop for path in paths for stop in path]
+
+    # Boundary pass: local search seeded from the stops around every join
+    joins, position = [], 0
+    for path in paths[:-1]:
+        position += len(path)
+        joins.extend(order[max(0, position - BOUNDARY_WINDOW):position + BOUNDARY_WINDOW])
+    search_costs = costs
+    if closed:
+        # Search a path to a copy of start instead: same cost, and the copy is a fixed end
+        search_costs = _to_start_copy(costs, start)
+        order = order + [n]
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    order = local_improvement(search_costs, order, joins, fixed_end or closed, remaining)
+    if deadline is not None and deadline - time.monotonic() > 0.05:
+        order = chained_local_search(search_costs, order, time_budget_s=deadline - time.monotonic(),
+                                     fixed_end=fixed_end or closed)
+    if closed:
+        order = order[:-1]
+    cost = _path_cost(costs, order, closed)
+    gap = 100.0 * (hilbert_cost - cost) / cost if cost > 0 else 0.0
+    logger.info(f"🧩 Decomposition: {len(clusters)} clusters, cost {cost:.1f} "
+                f"(Hilbert {hilbert_cost:.1f}) in {time.monotonic() - started:.2f}s")
+    return OrderResult(order, cost, "decomposition", False, hilbert_cost, gap)
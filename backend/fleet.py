@@ -0,0 +1,248 @@
+"""Multi-vehicle routing with capacities.
+
+Every vehicle leaves from its own start (and may have to finish at its own
+end); each stop has a demand and each vehicle a capacity. Stops are
+clustered onto vehicles by parallel regret insertion, routes then trade
+stops through relocate and swap moves, and finally every route's order is
+solved on its own (exactly when small, see optimize_order), across the
+optimizer process pool when there are workers to spare.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from route_optimizer import CostMatrix, IMPROVEMENT_EPS, finite_costs, optimize_order, start_pool
+
+logger = logging.getLogger(__name__)
+
+# Rounds of (inter-route moves, per-route ordering); stops early once routes stop trading stops
+FLEET_ROUNDS = 3
+CAPACITY_EPS = 1e-9
+
+
+@dataclass
+class FleetPlan:
+    routes: List[List[int]]  # per vehicle: location indices from its start (to its end, if it has one)
+    loads: List[float]
+    costs: List[float]
+    methods: List[str]       # per-route ordering method (see OrderResult)
+    unassigned: List[int] = field(default_factory=list)  # stops no vehicle had room for
+
+    @property
+    def total_cost(self) -> float:
+        return float(sum(self.costs))
+
+
+def _link(costs: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """costs[a, b], with 0 where b is -1 (the open end of a route)."""
+    return np.where(b >= 0, costs[a, np.maximum(b, 0)], 0.0)
+
+
+def _best_insertions(costs: np.ndarray, path: Sequence[int], fixed_end: bool,
+                     stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Cheapest added cost and slot for each stop in path; slot p inserts after path[p]."""
+    p = np.asarray(path)
+    added = costs[p[:-1]][:, stops] + costs[stops][:, p[1:]].T - costs[p[:-1], p[1:]][:, None]
+    if not fixed_end:
+        added = np.vstack((added, costs[p[-1], stops][None, :]))
+    if len(added) == 0:
+        return np.full(len(stops), np.inf), np.zeros(len(stops), dtype=np.int64)
+    slot = np.argmin(added, axis=0)
+    return added[slot, np.arange(len(stops))], slot
+
+
+def _route_arrays(path: Sequence[int], fixed_end: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(stops, previous node, next node or -1) for every movable position of path."""
+    p = np.asarray(path)
+    if fixed_end:
+        return p[1:-1], p[:-2], p[2:]
+    return p[1:], p[:-1], np.append(p[2:], -1)
+
+
+def _path_cost(costs: np.ndarray, path: Sequence[int]) -> float:
+    return float(costs[path[:-1], path[1:]].sum()) if len(path) > 1 else 0.0
+
+
+def _insert_stops(costs: np.ndarray, paths: List[List[int]], fixed_ends: List[bool], capacities: np.ndarray,
+                  loads: np.ndarray, demands: np.ndarray, stops: Sequence[int]) -> List[int]:
+    """Parallel regret insertion; fills paths and loads in place and returns the stops that did not fit.
+
+    Stops only one vehicle can still take go first, then the stop that
+    would lose most by waiting for its second-best vehicle.
+    """
+    pending = np.asarray(list(stops), dtype=np.int64)
+    unassigned: List[int] = []
+    if len(pending) == 0:
+        return unassigned
+    # Best insertion of every pending stop into every route; only the changed route is recomputed
+    added = np.empty((len(paths), len(pending)))
+    slots = np.empty((len(paths), len(pending)), dtype=np.int64)
+    for v, path in enumerate(paths):
+        added[v], slots[v] = _best_insertions(costs, path, fixed_ends[v], pending)
+    while len(pending):
+        fits = loads[:, None] + demands[pending][None, :] <= capacities[:, None] + CAPACITY_EPS
+        masked = np.where(fits, added, np.inf)
+        if len(paths) > 1:
+            two = np.partition(masked, 1, axis=0)[:2]
+        else:
+            two = np.vstack((masked, np.full((1, len(pending)), np.inf)))
+        stuck = ~np.isfinite(two[0])
+        if stuck.any():
+            unassigned.extend(int(s) for s in pending[stuck])
+            pending, added, slots = pending[~stuck], added[:, ~stuck], slots[:, ~stuck]
+            continue
+        urgent = ~np.isfinite(two[1])
+        if urgent.any():
+            u = int(np.flatnonzero(urgent)[np.argmin(two[0][urgent])])
+        else:
+            u = int(np.argmax((two[1] - two[0]) - 1e-9 * two[0]))
+        v = int(np.argmin(masked[:, u]))
+        stop = int(pending[u])
+        paths[v].insert(int(slots[v, u]) + 1, stop)
+        loads[v] += demands[stop]
+        pending = np.delete(pending, u)
+        added, slots = np.delete(added, u, axis=1), np.delete(slots, u, axis=1)
+        if len(pending):
+            added[v], slots[v] = _best_insertions(costs, paths[v], fixed_ends[v], pending)
+    return unassigned
+
+
+def _best_move(costs: np.ndarray, paths: List[List[int]], fixed_ends: List[bool], capacities: np.ndarray,
+               loads: np.ndarray, demands: np.ndarray, v: int, w: int) -> Optional[Tuple[float, tuple]]:
+    """Most improving relocate (a stop of v into w) or swap (a stop of v with one of w), if any."""
+    a, a_prev, a_next = _route_arrays(paths[v], fixed_ends[v])
+    if len(a) == 0:
+        return None
+    removal = _link(costs, a_prev, a_next) - costs[a_prev, a] - _link(costs, a, a_next)
+    best = None
+    fits = loads[w] + demands[a] <= capacities[w] + CAPACITY_EPS
+    if fits.any():
+        added, slot = _best_insertions(costs, paths[w], fixed_ends[w], a)
+        gain = np.where(fits, removal + added, np.inf)
+        i = int(np.argmin(gain))
+        if gain[i] < -IMPROVEMENT_EPS:
+            best = (float(gain[i]), ("relocate", v, w, i + 1, int(slot[i]) + 1))
+    b, b_prev, b_next = _route_arrays(paths[w], fixed_ends[w])
+    if v < w and len(b):
+        # Only v < w, so each unordered pair of routes is priced once
+        into_v = (costs[a_prev][:, b] + _link(costs, b[None, :], a_next[:, None])
+                  - (costs[a_prev, a] + _link(costs, a, a_next))[:, None])
+        into_w = (costs[b_prev][:, a] + _link(costs, a[None, :], b_next[:, None])
+                  - (costs[b_prev, b] + _link(costs, b, b_next))[:, None])
+        swing = demands[b][None, :] - demands[a][:, None]
+        fits = ((loads[v] + swing <= capacities[v] + CAPACITY_EPS)
+                & (loads[w] - swing <= capacities[w] + CAPACITY_EPS))
+        gain = np.where(fits, into_v + into_w.T, np.inf)
+        i, j = np.unravel_index(int(np.argmin(gain)), gain.shape)
+        if gain[i, j] < -IMPROVEMENT_EPS and (best is None or gain[i, j] < best[0]):
+            best = (float(gain[i, j]), ("swap", v, w, int(i) + 1, int(j) + 1))
+    return best
+
+
+def _improve_between(costs: np.ndarray, paths: List[List[int]], fixed_ends: List[bool], capacities: np.ndarray,
+                     loads: np.ndarray, demands: np.ndarray, deadline: Optional[float]) -> int:
+    """Apply the best relocate/swap between routes until none improves; returns the number of moves.
+
+    The best move of every route pair is cached and only pairs touching a
+    changed route are re-priced.
+    """
+    count = len(paths)
+    cache: Dict[Tuple[int, int], Optional[Tuple[float, tuple]]] = {}
+    moves = 0
+    while deadline is None or time.monotonic() < deadline:
+        for v in range(count):
+            for w in range(count):
+                if v != w and (v, w) not in cache:
+                    cache[(v, w)] = _best_move(costs, paths, fixed_ends, capacities, loads, demands, v, w)
+        found = [m for m in cache.values() if m is not None]
+        if not found:
+            break
+        _, move = min(found, key=lambda m: m[0])
+        kind, v, w, i, j = move
+        if kind == "relocate":
+            stop = paths[v].pop(i)
+            paths[w].insert(j, stop)
+            loads[v] -= demands[stop]
+            loads[w] += demands[stop]
+        else:
+            paths[v][i], paths[w][j] = paths[w][j], paths[v][i]
+            swing = demands[paths[v][i]] - demands[paths[w][j]]
+            loads[v] += swing
+            loads[w] -= swing
+        moves += 1
+        for key in [k for k in cache if v in k or w in k]:
+            del cache[key]
+    return moves
+
+
+def _order_one(sub: np.ndarray, fixed_end: bool, time_budget_s: Optional[float]) -> Tuple[List[int], str]:
+    """Order one route on its own sub-matrix (start first); process pool entry point."""
+    result = optimize_order(sub, 0, len(sub) - 1 if fixed_end else None, time_budget_s=time_budget_s)
+    return result.order, result.method
+
+
+def _order_routes(costs: np.ndarray, paths: List[List[int]], fixed_ends: List[bool],
+                  time_budget_s: Optional[float], workers: int) -> List[str]:
+    """Re-solve every route's stop order in place; routes run across the process pool when workers > 1."""
+    todo = [v for v, path in enumerate(paths) if len(path) - (2 if fixed_ends[v] else 1) >= 2]
+    methods = ["sequential"] * len(paths)
+    budget = None
+    if time_budget_s is not None and todo:
+        # Routes run workers at a time, so each gets its share of the wall-clock budget
+        budget = time_budget_s * min(workers, len(todo)) / len(todo)
+    subs = [costs[np.ix_(paths[v], paths[v])] for v in todo]
+    results = None
+    if workers > 1 and len(todo) > 1:
+        try:
+            pool = start_pool(workers)
+            futures = [pool.submit(_order_one, sub, fixed_ends[v], budget) for v, sub in zip(todo, subs)]
+            results = [future.result() for future in futures]
+        except Exception as e:
+            logger.warning(f"⚠️ Parallel route ordering failed ({e}); running in-process")
+    if results is None:
+        results = [_order_one(sub, fixed_ends[v], budget) for v, sub in zip(todo, subs)]
+    for v, (order, method) in zip(todo, results):
+        paths[v] = [paths[v][i] for i in order]
+        methods[v] = method
+    return methods
+
+
+def plan_fleet(matrix: CostMatrix, starts: Sequence[int], ends: Sequence[Optional[int]],
+               capacities: Sequence[float], demands: Sequence[float], stops: Sequence[int],
+               time_budget_s: Optional[float] = None, workers: int = 1) -> FleetPlan:
+    """Assign stops to vehicles within capacity and order each vehicle's route.
+
+    matrix covers every location (vehicle starts and ends, and stops);
+    starts/ends/capacities are per vehicle (end None: the route finishes at
+    its last stop), demands per location. Stops that fit no vehicle are
+    returned in unassigned.
+    """
+    costs = finite_costs(matrix)
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    capacities = np.asarray(capacities, dtype=float)
+    demands = np.asarray(demands, dtype=float)
+    fixed_ends = [end is not None for end in ends]
+    paths = [[start] + ([end] if end is not None else []) for start, end in zip(starts, ends)]
+    loads = np.zeros(len(paths))
+    unassigned = _insert_stops(costs, paths, fixed_ends, capacities, loads, demands, stops)
+    methods = ["sequential"] * len(paths)
+    ordered = False
+    for _ in range(FLEET_ROUNDS):
+        # Leave at least half of what is left for ordering the routes
+        between = None if deadline is None else time.monotonic() + max(0.0, deadline - time.monotonic()) / 2
+        moves = _improve_between(costs, paths, fixed_ends, capacities, loads, demands, between)
+        if ordered and moves == 0:
+            break
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        methods = _order_routes(costs, paths, fixed_ends, remaining, workers)
+        ordered = True
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+    route_costs = [_path_cost(costs, path) for path in paths]
+    logger.info(f"🚛 Fleet: {len(paths)} vehicle(s), {len(stops) - len(unassigned)} stop(s) assigned, "
+                f"{len(unassigned)} unassigned, total cost {sum(route_costs):.1f}")
+    return FleetPlan(paths, [float(x) for x in loads], route_costs, methods, sorted(unassigned))
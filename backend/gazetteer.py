@@ -0,0 +1,441 @@
+"""Offline gazetteer geocoder built from a CSV of places/PIN codes or an OSM XML extract.
+
+Build an index once:
+
+    python gazetteer.py build --csv pincodes.csv --osm bengaluru.osm --out db/gazetteer.npz
+
+The index is a single .npz file: coordinates and ranks live in flat arrays,
+entry names in one UTF-8 blob with offsets, and the token inverted index in
+CSR form (sorted vocabulary + posting offsets + postings). Unknown query
+tokens are matched through a character-trigram index over the vocabulary.
+"""
+
+import argparse
+import csv
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+PIN_RE = re.compile(r"\b([1-9][0-9]{5})\b")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Entry kinds, stored as uint8
+KIND_PLACE = 0
+KIND_PINCODE = 1
+KIND_POI = 2
+KIND_STREET = 3
+
+# OSM place=* values, from most to least prominent
+PLACE_RANKS = {
+    "city": 1.0, "town": 0.9, "suburb": 0.8, "borough": 0.8, "quarter": 0.7,
+    "neighbourhood": 0.6, "village": 0.6, "hamlet": 0.4, "locality": 0.5,
+}
+
+# Common CSV header aliases (data.gov.in PIN directory, GeoNames-style exports)
+CSV_NAME_COLUMNS = ("name", "officename", "office_name", "place", "locality", "area")
+CSV_LAT_COLUMNS = ("lat", "latitude")
+CSV_LON_COLUMNS = ("lon", "lng", "long", "longitude")
+CSV_PIN_COLUMNS = ("pincode", "pin", "postcode", "postal_code", "zip")
+CSV_CONTEXT_COLUMNS = ("taluk", "districtname", "district", "city", "statename", "state")
+
+TRIGRAM_MIN_OVERLAP = 0.5
+MAX_CANDIDATES = 20000
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def trigrams(token: str) -> List[str]:
+    padded = f"  {token} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+@dataclass
+class GazetteerEntry:
+    name: str
+    lat: float
+    lon: float
+    context: str = ""
+    pincode: Optional[int] = None
+    kind: int = KIND_PLACE
+    rank: float = 0.5
+
+
+@dataclass
+class GazetteerMatch:
+    name: str
+    lat: float
+    lon: float
+    score: float
+    kind: int
+    pincode: Optional[int] = None
+
+
+# -------------------- Importers --------------------
+
+def _pick(row: Dict[str, str], columns: Iterable[str]) -> Optional[str]:
+    for col in columns:
+        value = row.get(col)
+        if value not in (None, "", "NA", "na"):
+            return value
+    return None
+
+
+def read_csv_entries(path: str) -> Iterator[GazetteerEntry]:
+    """Read places or PIN-code centroids from a CSV with lat/lon columns.
+
+    Rows sharing a PIN code are also averaged into one PIN centroid entry.
+    """
+    pin_sums: Dict[int, List[float]] = defaultdict(lambda: [0.0, 0.0, 0, ""])
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        for raw in reader:
+            row = {k.strip().lower(): (v or "").strip() for k, v in raw.items() if k}
+            try:
+                lat = float(_pick(row, CSV_LAT_COLUMNS))
+                lon = float(_pick(row, CSV_LON_COLUMNS))
+            except (TypeError, ValueError):
+                continue
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+                continue
+            pin_raw = _pick(row, CSV_PIN_COLUMNS)
+            pincode = int(pin_raw) if pin_raw and pin_raw.isdigit() and len(pin_raw) == 6 else None
+            context = ", ".join(row[c] for c in CSV_CONTEXT_COLUMNS if row.get(c))
+            name = _pick(row, CSV_NAME_COLUMNS)
+            if name:
+                # PIN directory office names carry suffixes like "B.O"/"S.O"
+                name = re.sub(r"\s+[BSH]\.?O\.?$", "", name, flags=re.IGNORECASE)
+                yield GazetteerEntry(name=name, lat=lat, lon=lon, context=context,
+                                     pincode=pincode, kind=KIND_PLACE, rank=0.5)
+            if pincode is not None:
+                acc = pin_sums[pincode]
+                acc[0] += lat
+                acc[1] += lon
+                acc[2] += 1
+                acc[3] = acc[3] or context
+    for pincode, (lat_sum, lon_sum, count, context) in pin_sums.items():
+        yield GazetteerEntry(name=str(pincode), lat=lat_sum / count, lon=lon_sum / count,
+                             context=context, pincode=pincode, kind=KIND_PINCODE, rank=0.7)
+
+
+def _osm_entry(tags: Dict[str, str], lat: float, lon: float) -> Optional[GazetteerEntry]:
+    name = tags.get("name:en") or tags.get("name")
+    postcode = tags.get("addr:postcode", "").replace(" ", "")
+    pincode = int(postcode) if postcode.isdigit() and len(postcode) == 6 else None
+    context = ", ".join(tags[k] for k in ("addr:street", "addr:suburb", "addr:city") if tags.get(k))
+    if not name:
+        street = tags.get("addr:street")
+        if not (street and tags.get("addr:housenumber")):
+            return None
+        name = f"{tags['addr:housenumber']} {street}"
+    if "place" in tags:
+        kind, rank = KIND_PLACE, PLACE_RANKS.get(tags["place"], 0.4)
+    elif "highway" in tags:
+        kind, rank = KIND_STREET, 0.3
+    else:
+        kind, rank = KIND_POI, 0.35
+    return GazetteerEntry(name=name, lat=lat, lon=lon, context=context, pincode=pincode, kind=kind, rank=rank)
+
+
+def read_osm_entries(path: str) -> Iterator[GazetteerEntry]:
+    """Read named nodes and ways (as centroids) from an OSM XML extract.
+
+    PBF extracts are not parsed directly; convert them first with
+    `osmium cat extract.osm.pbf -o extract.osm`.
+    """
+    if path.endswith(".pbf"):
+        raise ValueError("PBF extracts are not supported; convert with `osmium cat in.osm.pbf -o out.osm`")
+    node_coords: Dict[int, Tuple[float, float]] = {}
+    tags: Dict[str, str] = {}
+    refs: List[int] = []
+    for event, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "tag":
+            tags[elem.get("k")] = elem.get("v")
+        elif elem.tag == "nd":
+            refs.append(int(elem.get("ref")))
+        elif elem.tag == "node":
+            lat, lon = float(elem.get("lat")), float(elem.get("lon"))
+            node_coords[int(elem.get("id"))] = (lat, lon)
+            if tags:
+                entry = _osm_entry(tags, lat, lon)
+                if entry:
+                    yield entry
+            tags, refs = {}, []
+            elem.clear()
+        elif elem.tag == "way":
+            points = [node_coords[r] for r in refs if r in node_coords]
+            if tags and points:
+                lat = sum(p[0] for p in points) / len(points)
+                lon = sum(p[1] for p in points) / len(points)
+                entry = _osm_entry(tags, lat, lon)
+                if entry:
+                    yield entry
+            tags, refs = {}, []
+            elem.clear()
+        elif elem.tag == "relation":
+            tags, refs = {}, []
+            elem.clear()
+
+
+# -------------------- Index --------------------
+
+def _pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+    return blob, offsets
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def _csr(keys: List[str], postings: Dict[str, List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[k]) for k in keys])
+    flat = np.fromiter((i for k in keys for i in postings[k]), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, flat
+
+
+def build_index(entries: Iterable[GazetteerEntry], out_path: str) -> int:
+    """Deduplicate entries, build the inverted indexes and write them to out_path."""
+    seen = set()
+    names: List[str] = []
+    lats: List[float] = []
+    lons: List[float] = []
+    ranks: List[float] = []
+    kinds: List[int] = []
+    pins: List[int] = []
+    token_postings: Dict[str, List[int]] = defaultdict(list)
+    entry_token_counts: List[int] = []
+
+    for entry in entries:
+        key = (entry.name.lower(), round(entry.lat, 4), round(entry.lon, 4))
+        if key in seen:
+            continue
+        seen.add(key)
+        idx = len(names)
+        label = f"{entry.name}, {entry.context}" if entry.context else entry.name
+        names.append(label)
+        lats.append(entry.lat)
+        lons.append(entry.lon)
+        ranks.append(entry.rank)
+        kinds.append(entry.kind)
+        pins.append(entry.pincode or 0)
+        tokens = set(tokenize(label))
+        if entry.pincode:
+            tokens.add(str(entry.pincode))
+        entry_token_counts.append(len(tokens))
+        for tok in tokens:
+            token_postings[tok].append(idx)
+
+    vocab = sorted(token_postings)
+    tok_offsets, postings = _csr(vocab, token_postings)
+
+    trigram_postings: Dict[str, List[int]] = defaultdict(list)
+    for tid, tok in enumerate(vocab):
+        if not tok.isdigit():
+            for tg in set(trigrams(tok)):
+                trigram_postings[tg].append(tid)
+    tri_keys = sorted(trigram_postings)
+    tri_offsets, tri_postings = _csr(tri_keys, trigram_postings)
+
+    name_blob, name_offsets = _pack_strings(names)
+    vocab_blob, vocab_offsets = _pack_strings(vocab)
+    tri_blob, tri_key_offsets = _pack_strings(tri_keys)
+
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(
+        out_path,
+        lat=np.asarray(lats, dtype=np.float32),
+        lon=np.asarray(lons, dtype=np.float32),
+        rank=np.asarray(ranks, dtype=np.float32),
+        kind=np.asarray(kinds, dtype=np.uint8),
+        pincode=np.asarray(pins, dtype=np.int32),
+        entry_tokens=np.asarray(entry_token_counts, dtype=np.uint16),
+        name_blob=name_blob, name_offsets=name_offsets,
+        vocab_blob=vocab_blob, vocab_offsets=vocab_offsets,
+        tok_offsets=tok_offsets, postings=postings,
+        tri_blob=tri_blob, tri_key_offsets=tri_key_offsets,
+        tri_offsets=tri_offsets, tri_postings=tri_postings,
+    )
+    return len(names)
+
+
+class Gazetteer:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.lat = arrays["lat"]
+        self.lon = arrays["lon"]
+        self.rank = arrays["rank"]
+        self.kind = arrays["kind"]
+        self.pincode = arrays["pincode"]
+        self.entry_tokens = arrays["entry_tokens"].astype(np.float32)
+        self._name_blob = arrays["name_blob"]
+        self._name_offsets = arrays["name_offsets"]
+        self.tok_offsets = arrays["tok_offsets"]
+        self.postings = arrays["postings"]
+        self.tri_offsets = arrays["tri_offsets"]
+        self.tri_postings = arrays["tri_postings"]
+        vocab = _unpack_strings(arrays["vocab_blob"], arrays["vocab_offsets"])
+        self.vocab = vocab
+        self.token_ids = {tok: i for i, tok in enumerate(vocab)}
+        self.trigram_ids = {tg: i for i, tg in enumerate(_unpack_strings(arrays["tri_blob"], arrays["tri_key_offsets"]))}
+        df = np.diff(self.tok_offsets).astype(np.float32)
+        self.idf = np.log1p(len(self.lat) / np.maximum(df, 1.0)).astype(np.float32)
+        # PIN code -> index of its centroid entry
+        pin_rows = np.nonzero(self.kind == KIND_PINCODE)[0]
+        self.pin_entries = {int(self.pincode[i]): int(i) for i in pin_rows}
+
+    @classmethod
+    def load(cls, path: str) -> "Gazetteer":
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def name(self, idx: int) -> str:
+        return self._name_blob[self._name_offsets[idx]:self._name_offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def _postings(self, tid: int) -> np.ndarray:
+        return self.postings[self.tok_offsets[tid]:self.tok_offsets[tid + 1]]
+
+    def _fuzzy_token(self, token: str) -> Optional[Tuple[int, float]]:
+        """Closest vocabulary token by trigram overlap, with its similarity."""
+        grams = set(trigrams(token))
+        counts: Dict[int, int] = defaultdict(int)
+        for tg in grams:
+            gid = self.trigram_ids.get(tg)
+            if gid is None:
+                continue
+            for tid in self.tri_postings[self.tri_offsets[gid]:self.tri_offsets[gid + 1]]:
+                counts[int(tid)] += 1
+        best, best_sim = None, 0.0
+        for tid, shared in counts.items():
+            other = len(set(trigrams(self.vocab[tid])))
+            sim = shared / (len(grams) + other - shared)
+            if sim > best_sim:
+                best, best_sim = tid, sim
+        if best is None or best_sim < TRIGRAM_MIN_OVERLAP:
+            return None
+        return best, best_sim
+
+    def _match(self, idx: int, score: float) -> GazetteerMatch:
+        pin = int(self.pincode[idx])
+        return GazetteerMatch(name=self.name(idx), lat=round(float(self.lat[idx]), 6), lon=round(float(self.lon[idx]), 6),
+                              score=round(float(score), 4), kind=int(self.kind[idx]), pincode=pin or None)
+
+    def lookup(self, query: str, min_score: float = 0.5, limit: int = 1) -> List[GazetteerMatch]:
+        """Rank entries by the IDF-weighted share of query tokens they contain."""
+        pin_match = PIN_RE.search(query or "")
+        pin = int(pin_match.group(1)) if pin_match else None
+        tokens = [t for t in dict.fromkeys(tokenize(query)) if not (pin and t == str(pin))]
+
+        # Resolve query tokens to vocabulary ids (exact first, then trigram-fuzzy)
+        resolved: List[Tuple[int, float]] = []
+        query_weight = 0.0
+        for tok in tokens:
+            tid = self.token_ids.get(tok)
+            if tid is not None:
+                resolved.append((tid, 1.0))
+                query_weight += float(self.idf[tid])
+                continue
+            if tok.isdigit() or len(tok) < 4:
+                # House numbers and short fragments: not indexed, no penalty
+                continue
+            fuzzy = self._fuzzy_token(tok)
+            if fuzzy:
+                resolved.append(fuzzy)
+                query_weight += float(self.idf[fuzzy[0]])
+            else:
+                query_weight += float(self.idf.max()) * 0.5
+
+        if not resolved:
+            if pin is not None and pin in self.pin_entries:
+                return [self._match(self.pin_entries[pin], 1.0)]
+            return []
+
+        # Candidates come from the rarer tokens so common ones ("road", city) stay cheap
+        resolved.sort(key=lambda r: self.tok_offsets[r[0] + 1] - self.tok_offsets[r[0]])
+        candidate_lists = []
+        total = 0
+        for tid, _ in resolved:
+            plist = self._postings(tid)
+            if candidate_lists and total + len(plist) > MAX_CANDIDATES:
+                break
+            candidate_lists.append(plist)
+            total += len(plist)
+        candidates = np.unique(np.concatenate(candidate_lists)) if len(candidate_lists) > 1 else candidate_lists[0]
+        if len(candidates) > MAX_CANDIDATES:
+            candidates = candidates[np.argsort(-self.rank[candidates])[:MAX_CANDIDATES]]
+
+        matched_weight = np.zeros(len(candidates), dtype=np.float32)
+        matched_count = np.zeros(len(candidates), dtype=np.float32)
+        for tid, sim in resolved:
+            hit = np.isin(candidates, self._postings(tid), assume_unique=True)
+            matched_weight += hit * float(self.idf[tid]) * sim
+            matched_count += hit
+        if pin is not None:
+            same_pin = self.pincode[candidates] == pin
+            matched_weight += same_pin * float(self.idf.max())
+            matched_count += same_pin
+            query_weight += float(self.idf.max())
+
+        query_cov = matched_weight / max(query_weight, 1e-6)
+        entry_cov = matched_count / np.maximum(self.entry_tokens[candidates], 1.0)
+        scores = 0.75 * query_cov + 0.15 * np.minimum(entry_cov, 1.0) + 0.1 * self.rank[candidates]
+
+        order = np.argsort(-scores)[:max(1, limit)]
+        matches = [self._match(int(candidates[i]), scores[i]) for i in order if scores[i] >= min_score]
+        if not matches and pin is not None and pin in self.pin_entries:
+            return [self._match(self.pin_entries[pin], min_score)]
+        return matches
+
+    def geocode(self, query: str, min_score: float = 0.5) -> Optional[Tuple[float, float]]:
+        matches = self.lookup(query, min_score=min_score, limit=1)
+        if not matches:
+            return None
+        return (matches[0].lat, matches[0].lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline gazetteer index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Import CSV/OSM sources into an index file")
+    build.add_argument("--csv", action="append", default=[], help="CSV of places or PIN-code centroids")
+    build.add_argument("--osm", action="append", default=[], help="OSM XML extract (.osm)")
+    build.add_argument("--out", default="db/gazetteer.npz")
+    query = sub.add_parser("query", help="Look up an address in an index file")
+    query.add_argument("text")
+    query.add_argument("--index", default="db/gazetteer.npz")
+    query.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        def entries():
+            for path in args.csv:
+                print(f"📥 Reading CSV {path}")
+                yield from read_csv_entries(path)
+            for path in args.osm:
+                print(f"📥 Reading OSM extract {path}")
+                yield from read_osm_entries(path)
+        count = build_index(entries(), args.out)
+        print(f"✅ Wrote {count} gazetteer entries to {args.out}")
+    else:
+        gaz = Gazetteer.load(args.index)
+        for m in gaz.lookup(args.text, min_score=0.0, limit=args.limit):
+            print(f"{m.score:.3f}  [{m.lat:.5f}, {m.lon:.5f}]  {m.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Two-tier geocode cache: an in-process LRU in front of a SQLite table under db/."""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+
+# How long a successful lookup stays valid, per provider that produced it (seconds)
+DEFAULT_PROVIDER_TTLS: Dict[str, float] = {
+    "ors": 30 * 24 * 3600,
+    "nominatim": 30 * 24 * 3600,
+    "gazetteer": 7 * 24 * 3600,
+    "gazetteer_fallback": 6 * 3600,  # providers were down or empty; retry them soon
+    "city_fallback": 6 * 3600,  # coarse city centers; retry providers soon
+}
+DEFAULT_TTL = 24 * 3600
+# Failed lookups ("no results anywhere") are cached for a shorter time
+NEGATIVE_TTL = 6 * 3600
+
+
+def normalize_address(address: str) -> str:
+    """Canonical cache key: NFKC, lowercase, single spaces, tidy commas."""
+    text = unicodedata.normalize("NFKC", address or "").lower()
+    text = re.sub(r"[\"'`]", "", text)
+    text = re.sub(r"[;|/]+", ",", text)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*,\s*", ", ", text)
+    text = re.sub(r"(, )+", ", ", text)
+    return text.strip(" ,.")
+
+
+@dataclass
+class CachedGeocode:
+    coords: Optional[Tuple[float, float]]  # None means a cached failure
+    provider: str
+    expires_at: float
+
+
+class GeocodeCache:
+    def __init__(self, db_path: str = "db/geocode_cache.db", lru_size: int = 2048,
+                 provider_ttls: Optional[Dict[str, float]] = None,
+                 negative_ttl: float = NEGATIVE_TTL):
+        self.db_path = db_path
+        self.lru_size = lru_size
+        self.provider_ttls = dict(DEFAULT_PROVIDER_TTLS)
+        if provider_ttls:
+            self.provider_ttls.update(provider_ttls)
+        self.negative_ttl = negative_ttl
+        self._lru: "OrderedDict[str, CachedGeocode]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "lru_hits": 0,
+            "db_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "writes": 0,
+        }
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    address_key TEXT PRIMARY KEY,
+                    lat REAL,
+                    lon REAL,
+                    provider TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(geocode_cache)")}
+            if "address" not in columns:
+                # Original spelling, used for display (e.g. autocomplete suggestions)
+                conn.execute("ALTER TABLE geocode_cache ADD COLUMN address TEXT")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key: str, entry: CachedGeocode) -> None:
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get(self, address: str) -> Optional[CachedGeocode]:
+        """Return the cached entry for an address, or None on a miss/expiry."""
+        key = normalize_address(address)
+        if not key:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._lru.move_to_end(key)
+                    self._counters["negative_hits" if entry.coords is None else "lru_hits"] += 1
+                    return entry
+                del self._lru[key]
+                self._counters["expired"] += 1
+
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT lat, lon, provider, expires_at FROM geocode_cache WHERE address_key = ?",
+                    (key,)
+                ).fetchone()
+                if row and row[3] > now:
+                    conn.execute("UPDATE geocode_cache SET hit_count = hit_count + 1 WHERE address_key = ?", (key,))
+                    conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            row = None
+
+        if not row:
+            self._count("misses")
+            return None
+        lat, lon, provider, expires_at = row
+        if expires_at <= now:
+            self._count("expired")
+            self._count("misses")
+            return None
+
+        entry = CachedGeocode(
+            coords=(lat, lon) if lat is not None and lon is not None else None,
+            provider=provider,
+            expires_at=expires_at,
+        )
+        self._remember(key, entry)
+        self._count("negative_hits" if entry.coords is None else "db_hits")
+        return entry
+
+    def _store(self, address: str, coords: Optional[Tuple[float, float]], provider: str, ttl: float) -> None:
+        key = normalize_address(address)
+        if not key:
+            return
+        entry = CachedGeocode(coords=coords, provider=provider, expires_at=time.time() + ttl)
+        self._remember(key, entry)
+        lat, lon = coords if coords is not None else (None, None)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('''
+                    INSERT OR REPLACE INTO geocode_cache (address_key, address, lat, lon, provider, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (key, address.strip(), lat, lon, provider, entry.expires_at))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # The LRU tier still holds the entry; losing persistence is not fatal
+            pass
+        self._count("writes")
+
+    def put(self, address: str, coords: Tuple[float, float], provider: str) -> None:
+        self._store(address, coords, provider, self.provider_ttls.get(provider, DEFAULT_TTL))
+
+    def put_negative(self, address: str, provider: str = "not_found") -> None:
+        self._store(address, None, provider, self.negative_ttl)
+
+    def iter_positive(self) -> Iterator[Tuple[str, float, float, int]]:
+        """Yield (address, lat, lon, hit_count) for every unexpired successful lookup."""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT COALESCE(address, address_key), lat, lon, hit_count FROM geocode_cache
+                WHERE lat IS NOT NULL AND lon IS NOT NULL AND expires_at > ?
+            ''', (time.time(),)).fetchall()
+        finally:
+            conn.close()
+        yield from rows
+
+    def invalidate(self, address: str) -> None:
+        key = normalize_address(address)
+        with self._lock:
+            self._lru.pop(key, None)
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM geocode_cache WHERE address_key = ?", (key,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def purge_expired(self) -> int:
+        conn = self._connect()
+        try:
+            cursor = conn.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["lru_entries"] = len(self._lru)
+        hits = counters["lru_hits"] + counters["db_hits"] + counters["negative_hits"]
+        lookups = hits + counters["misses"]
+        counters["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        try:
+            conn = self._connect()
+            try:
+                counters["db_entries"] = conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            counters["db_entries"] = None
+        return counters
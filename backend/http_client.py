@@ -0,0 +1,205 @@
+"""Shared HTTP clients for upstream services (ORS, Nominatim, Overpass).
+
+One requests.Session per host keeps TCP/TLS connections alive across calls.
+Idempotent failures (connection errors, 429/5xx) are retried with
+exponential backoff plus jitter, and each host gets latency/error counters.
+AsyncUpstreamClient does the same on httpx for code running on the event loop.
+"""
+
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+LATENCY_WINDOW = 500
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.statuses: Dict[int, int] = {}
+        self.latencies_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.total_ms = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        window = sorted(self.latencies_ms)
+        def pct(p: float) -> Optional[float]:
+            if not window:
+                return None
+            return round(window[min(len(window) - 1, int(p * len(window)))], 1)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "statuses": dict(self.statuses),
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else None,
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+        }
+
+
+class _StatsRecorder:
+    def __init__(self):
+        self._stats: Dict[str, _HostStats] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, host: str, started: float, status: Optional[int]) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats.setdefault(host, _HostStats())
+            stats.requests += 1
+            stats.total_ms += elapsed_ms
+            stats.latencies_ms.append(elapsed_ms)
+            if status is None or status >= 500 or status == 429:
+                stats.errors += 1
+            if status is not None:
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {host: s.snapshot() for host, s in self._stats.items()}
+
+
+class UpstreamClient(_StatsRecorder):
+    def __init__(self, pool_maxsize: int = 20, max_retries: int = 2, backoff_factor: float = 0.3,
+                 backoff_jitter: float = 0.3, default_timeout: float = 30.0):
+        super().__init__()
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.default_timeout = default_timeout
+        self._sessions: Dict[str, requests.Session] = {}
+
+    def _retry(self) -> Retry:
+        kwargs = dict(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            # ORS matrix/directions and Overpass POSTs are read-only queries
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        try:
+            return Retry(backoff_jitter=self.backoff_jitter, **kwargs)
+        except TypeError:
+            # urllib3 < 2 has no backoff_jitter
+            return Retry(**kwargs)
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=self._retry())
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        host = urlparse(url).netloc
+        session = self._session(host)
+        kwargs.setdefault("timeout", self.default_timeout)
+        started = time.perf_counter()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except Exception:
+            self._record(host, started, None)
+            raise
+        self._record(host, started, resp.status_code)
+        return resp
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+class AsyncUpstreamClient(_StatsRecorder):
+    """httpx.AsyncClient wrapper with the same retry policy and per-host counters.
+
+    httpx clients are bound to the event loop they were first used on, so
+    one client is created lazily per running loop.
+    """
+
+    def __init__(self, max_connections: int = 200, max_keepalive: int = 40, max_retries: int = 2,
+                 backoff_factor: float = 0.3, backoff_jitter: float = 0.3, default_timeout: float = 30.0):
+        super().__init__()
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.default_timeout = default_timeout
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_keepalive)
+            client = httpx.AsyncClient(limits=limits, timeout=self.default_timeout)
+            self._clients[loop] = client
+        return client
+
+    def _backoff(self, attempt: int, resp: Optional[httpx.Response]) -> float:
+        if resp is not None:
+            retry_after = resp.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    pass
+        return self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_jitter)
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        host = urlparse(url).netloc
+        client = self._client()
+        kwargs.setdefault("timeout", self.default_timeout)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                resp = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self._record(host, started, None)
+                    raise
+                await asyncio.sleep(self._backoff(attempt, None))
+                attempt += 1
+                continue
+            if resp.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, resp))
+                attempt += 1
+                continue
+            self._record(host, started, resp.status_code)
+            return resp
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        """Close the client belonging to the running loop (call on app shutdown)."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
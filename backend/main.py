@@ -1,13 +1,16 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import joblib
 import pandas as pd
 from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Request as FastAPIRequest
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr, constr
 from paddleocr import PaddleOCR
 import shutil
 import os
+import sys
 import uuid
 import cv2
 import numpy as np
@@ -16,18 +19,46 @@ import logging
 from typing import List, Optional, Tuple, Dict, Any
 import hashlib
 import secrets
-import requests
 import json
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import base64
+import csv
+import io
+import time
+import asyncio
+import threading
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+# Make sibling modules importable whether the app runs as `main:app` or `backend.main:app`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from geocode_cache import GeocodeCache
+from rate_limiter import RateLimiter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent_geocoder import geocode_concurrently, geocode_concurrently_async, iter_geocode_as_completed, dedupe_addresses
+from gazetteer import Gazetteer
+from suggest_index import SuggestionIndex, load_training_addresses
+from singleflight import SingleFlight, AsyncSingleFlight
+from geocode_cache import normalize_address
+from matrix_cache import MatrixCellCache, plan_missing_blocks, tile_blocks
+from http_client import UpstreamClient, AsyncUpstreamClient
+from road_graph import RoadGraph
+from approx_matrix import DetourModel, haversine_pairs, load_route_observations, route_distance_km
+from sparse_matrix import MAX_OVERFETCH, build_sparse, knn_candidates, needed_cells, plan_sparse_blocks
+from route_optimizer import (OrderResult, anytime_search, as_cost_array, build_best_order,
+                             build_best_order_multistart, nearest_neighbor_order, two_opt_improvement, start_pool,
+                             shutdown_pool)
+from time_windows import schedule_report, solve_time_windows
+from fleet import plan_fleet
+from time_dependent import TimeDependentCosts, optimize_time_dependent
+from route_sessions import RouteSession, RouteSessionStore, insert_stop, remove_stop
+from decomposition import decompose_order, instant_order
+
 # Set up logging first
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -289,10 +320,20 @@ class CompletedRoute(BaseModel):
     total_distance_km: float
     num_stops: int
 
+class TimeWindow(BaseModel):
+    earliest: Optional[str] = None  # "HH:MM" on the start day, or ISO8601; if omitted, any time
+    latest: Optional[str] = None
+
 class PlanRouteRequest(BaseModel):
     addresses: List[str]
     start_time: Optional[str] = None  # ISO8601 string; if omitted, uses now
     vehicle_start_address: Optional[str] = None  # if omitted, uses first address as start
+    vehicle_end_address: Optional[str] = None  # optimized routes finish here; if omitted, anywhere
+    debug: bool = False  # also probe reverse-direction durations per leg (extra ORS calls)
+    time_dependent: Optional[bool] = None  # order by traffic at projected arrival times; default OPTIMIZER_TIME_DEPENDENT
+    time_windows: Optional[List[Optional[TimeWindow]]] = None  # one per address (null = open); stops get reordered
+    service_minutes: Optional[List[float]] = None  # one per address: time spent at the stop
+    instant: bool = False  # skip the search: stops in space-filling curve order (any route size)
 
 class TrainingDataRequest(BaseModel):
     route_id: str
@@ -332,6 +373,47 @@ class PlannedRouteResponse(BaseModel):
     num_stops: int
     predicted_eta_minutes: Optional[float] = None
     route_geometry_geojson: Optional[Dict[str, Any]] = None
+    failed_addresses: Optional[List[Dict[str, Any]]] = None  # per-address geocoding failures
+    optimizer: Optional[Dict[str, Any]] = None  # method, optimality and heuristic gap of the stop order
+    route_id: Optional[str] = None  # live route session for /routes/{route_id}/insert-stop and remove-stop
+    stop_schedule: Optional[List[Dict[str, Any]]] = None  # time-window plans: arrival/wait/service per stop
+    infeasible_stops: Optional[List[Dict[str, Any]]] = None  # time-window plans: stops reached after their window
+
+class RouteStopRequest(BaseModel):
+    address: str
+
+class FleetVehicle(BaseModel):
+    start_address: str
+    capacity: float  # same unit as stop demands
+    end_address: Optional[str] = None  # if omitted, the route ends at its last stop
+    vehicle_id: Optional[str] = None  # if omitted, the vehicle's position in the request
+
+class FleetStop(BaseModel):
+    address: str
+    demand: float = 1.0
+
+class PlanFleetRequest(BaseModel):
+    vehicles: List[FleetVehicle]
+    stops: List[FleetStop]
+    start_time: Optional[str] = None  # ISO8601 string; if omitted, uses now
+
+class FleetRouteResponse(BaseModel):
+    vehicle_id: str
+    ordered_addresses: List[str]
+    ordered_coordinates: List[Tuple[float, float]]  # (lat, lon)
+    ors_duration_minutes: float
+    total_distance_km: float
+    num_stops: int
+    load: float
+    capacity: float
+    predicted_eta_minutes: Optional[float] = None
+    route_geometry_geojson: Optional[Dict[str, Any]] = None
+    optimizer_method: Optional[str] = None
+
+class PlannedFleetResponse(BaseModel):
+    routes: List[FleetRouteResponse]
+    unassigned_stops: List[Dict[str, Any]]  # stops no vehicle had capacity left for
+    failed_addresses: Optional[List[Dict[str, Any]]] = None
 
 # --- Geocoding and ORS Utilities ---
 # Load API keys from environment variables
@@ -347,10 +429,39 @@ NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 ORS_DIRECTIONS_URL = "https://api.openrouteservice.org/v2/directions/driving-car/geojson"
 ORS_MATRIX_URL = "https://api.openrouteservice.org/v2/matrix/driving-car"
 
-def geocode_address(address: str) -> Optional[Tuple[float, float]]:
-    """Geocode address using OpenRouteService first (free), then Nominatim as fallback."""
-    
-    # Check if address is already coordinates (lat,lon format)
+# Shared keep-alive connection pools (one per upstream host) with retries and per-host counters
+upstream = UpstreamClient(
+    pool_maxsize=int(os.environ.get("HTTP_POOL_MAXSIZE", "20")),
+    max_retries=int(os.environ.get("HTTP_MAX_RETRIES", "2")),
+    backoff_factor=float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.3")),
+    backoff_jitter=float(os.environ.get("HTTP_BACKOFF_JITTER", "0.3")),
+)
+# Event-loop counterpart used by async endpoints; one process can hold
+# hundreds of in-flight upstream calls without a thread per call
+upstream_async = AsyncUpstreamClient(
+    max_connections=int(os.environ.get("HTTP_ASYNC_MAX_CONNECTIONS", "200")),
+    max_keepalive=int(os.environ.get("HTTP_POOL_MAXSIZE", "20")),
+    max_retries=int(os.environ.get("HTTP_MAX_RETRIES", "2")),
+    backoff_factor=float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.3")),
+    backoff_jitter=float(os.environ.get("HTTP_BACKOFF_JITTER", "0.3")),
+)
+
+@app.on_event("shutdown")
+async def close_upstream_async():
+    await upstream_async.aclose()
+
+@app.on_event("startup")
+async def warm_optimizer_pool():
+    # Spawning workers takes a moment; do it before the first large plan needs them
+    if OPTIMIZER_WORKERS > 1:
+        asyncio.get_running_loop().run_in_executor(None, start_pool, OPTIMIZER_WORKERS)
+
+@app.on_event("shutdown")
+async def close_optimizer_pool():
+    shutdown_pool()
+
+def parse_coordinates(address: str) -> Optional[Tuple[float, float]]:
+    """Return (lat, lon) if the address is already a 'lat,lon' pair."""
     if ',' in address and address.count(',') == 1:
         try:
             parts = address.strip().split(',')
@@ -358,82 +469,385 @@ def geocode_address(address: str) -> Optional[Tuple[float, float]]:
             lon = float(parts[1].strip())
             # Validate coordinate ranges
             if -90 <= lat <= 90 and -180 <= lon <= 180:
-                logger.info(f"✅ Using provided coordinates '{address}' -> [{lat}, {lon}]")
                 return (lat, lon)
         except ValueError:
             pass  # Not valid coordinates, continue with geocoding
+    return None
+
+# Geocode cache (in-process LRU + SQLite under db/) shared by every geocoding caller
+geocode_cache = GeocodeCache(
+    os.environ.get("GEOCODE_CACHE_DB", "db/geocode_cache.db"),
+    lru_size=int(os.environ.get("GEOCODE_CACHE_LRU_SIZE", "2048")),
+)
+
+# Local autocomplete index, seeded from cached geocodes and past training routes
+SUGGESTION_LIMIT = 5
+SUGGEST_MIN_LOCAL_RESULTS = int(os.environ.get("SUGGEST_MIN_LOCAL_RESULTS", "3"))
+suggestion_index = SuggestionIndex()
+try:
+    suggestion_index.add_many(
+        row for row in list(geocode_cache.iter_positive()) + load_training_addresses('db/training_data.db')
+        if parse_coordinates(row[0]) is None
+    )
+    logger.info(f"Suggestion index built with {len(suggestion_index)} addresses")
+except Exception as e:
+    logger.warning(f"Could not build suggestion index: {e}")
+
+# Concurrent identical upstream requests share one in-flight call
+geocode_flight = SingleFlight("geocode")
+suggestion_flight = SingleFlight("suggestions")
+matrix_flight = SingleFlight("matrix")
+geocode_flight_async = AsyncSingleFlight("geocode_async")
+matrix_flight_async = AsyncSingleFlight("matrix_async")
+
+# Matrix cells are reused across plans; only missing rows/columns are fetched
+matrix_cache = MatrixCellCache(
+    ttl_seconds=float(os.environ.get("MATRIX_CACHE_TTL_SECONDS", str(12 * 3600))),
+    max_cells=int(os.environ.get("MATRIX_CACHE_MAX_CELLS", "500000")),
+)
+# Provider limits per matrix request (ORS public API: 3500 sources x destinations
+# cells, no separate cap on locations), and how many tiles run at once
+ORS_MATRIX_MAX_LOCATIONS = int(os.environ.get("ORS_MATRIX_MAX_LOCATIONS", "3500"))
+ORS_MATRIX_MAX_ELEMENTS = int(os.environ.get("ORS_MATRIX_MAX_ELEMENTS", "3500"))
+ORS_MATRIX_MAX_PARALLEL = int(os.environ.get("ORS_MATRIX_MAX_PARALLEL", "16"))
+# The ORS free tier allows 40 matrix requests/minute; burst + rate*60 stays under it
+ors_matrix_limiter = RateLimiter(float(os.environ.get("ORS_MATRIX_RATE_PER_SEC", "0.6")),
+                                 burst=int(os.environ.get("ORS_MATRIX_BURST", "4")))
+
+# Per-provider request rates. Nominatim's usage policy allows at most 1 req/s;
+# the ORS free tier allows 100 geocode requests/minute.
+GEOCODE_MAX_WORKERS = int(os.environ.get("GEOCODE_MAX_WORKERS", "8"))
+GEOCODE_MAX_CONCURRENCY = int(os.environ.get("GEOCODE_MAX_CONCURRENCY", "32"))
+MAX_BATCH_GEOCODE = int(os.environ.get("MAX_BATCH_GEOCODE", "1000"))
+ors_geocode_limiter = RateLimiter(float(os.environ.get("ORS_GEOCODE_RATE_PER_SEC", "1.6")), burst=5)
+nominatim_limiter = RateLimiter(float(os.environ.get("NOMINATIM_RATE_PER_SEC", "1.0")), burst=1)
+
+# Offline gazetteer (built with `python gazetteer.py build ...`).
+# GAZETTEER_MODE: "first" answers confident matches before calling providers,
+# "fallback" only answers when providers fail, "off" disables it.
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", "db/gazetteer.npz")
+GAZETTEER_MODE = os.environ.get("GAZETTEER_MODE", "fallback").lower()
+GAZETTEER_FIRST_MIN_SCORE = float(os.environ.get("GAZETTEER_FIRST_MIN_SCORE", "0.8"))
+GAZETTEER_FALLBACK_MIN_SCORE = float(os.environ.get("GAZETTEER_FALLBACK_MIN_SCORE", "0.35"))
+gazetteer: Optional[Gazetteer] = None
+if GAZETTEER_MODE != "off" and os.path.exists(GAZETTEER_PATH):
+    try:
+        gazetteer = Gazetteer.load(GAZETTEER_PATH)
+        logger.info(f"Gazetteer loaded with {len(gazetteer)} entries from {GAZETTEER_PATH}")
+    except Exception as e:
+        logger.warning(f"Could not load gazetteer from {GAZETTEER_PATH}: {e}")
+
+# Local routing engine (built with `python road_graph.py build ...`).
+# ROUTING_BACKEND: "ors" uses the ORS API; "local" answers matrix/directions
+# from the road graph and uses ORS only for points the graph does not cover.
+ROUTING_BACKEND = os.environ.get("ROUTING_BACKEND", "ors").lower()
+ROAD_GRAPH_PATH = os.environ.get("ROAD_GRAPH_PATH", "db/road_graph.npz")
+ROAD_GRAPH_MAX_SNAP_KM = float(os.environ.get("ROAD_GRAPH_MAX_SNAP_KM", "1.0"))
+road_graph: Optional[RoadGraph] = None
+if ROUTING_BACKEND == "local":
+    if os.path.exists(ROAD_GRAPH_PATH):
+        try:
+            road_graph = RoadGraph.load(ROAD_GRAPH_PATH)
+            logger.info(f"Road graph loaded with {len(road_graph)} nodes from {ROAD_GRAPH_PATH}")
+        except Exception as e:
+            logger.warning(f"Could not load road graph from {ROAD_GRAPH_PATH}: {e}")
+    else:
+        logger.warning(f"ROUTING_BACKEND=local but {ROAD_GRAPH_PATH} does not exist; using ORS")
+
+# Approximate matrices: haversine distance scaled by detour/speed factors learned
+# from ORS matrix cells and completed routes. MATRIX_MODE "ors" fetches real
+# matrices and falls back to the approximation when ORS fails or is slower than
+# ORS_MATRIX_TIMEOUT_SECONDS plus the time ors_matrix_limiter spaces the route's
+# tiles over; "approx" orders stops on the approximation alone and
+# reserves ORS for the final directions call; "sparse" fetches only each stop's
+# MATRIX_SPARSE_K nearest candidates and estimates the rest. "ors" switches to
+# sparse for routes with at least MATRIX_SPARSE_MIN_STOPS stops (0 disables).
+MATRIX_MODE = os.environ.get("MATRIX_MODE", "ors").lower()
+ORS_MATRIX_TIMEOUT_SECONDS = float(os.environ.get("ORS_MATRIX_TIMEOUT_SECONDS", "15"))
+MATRIX_SPARSE_K = int(os.environ.get("MATRIX_SPARSE_K", "8"))
+MATRIX_SPARSE_MIN_STOPS = int(os.environ.get("MATRIX_SPARSE_MIN_STOPS", "100"))
+# Wall-clock budget for local search when ordering stops. Routes with at least
+# OPTIMIZER_PARALLEL_MIN_STOPS stops spread multistart search over
+# OPTIMIZER_WORKERS processes (1 keeps everything in-process).
+OPTIMIZER_TIME_BUDGET_SECONDS = float(os.environ.get("OPTIMIZER_TIME_BUDGET_SECONDS", "2.0"))
+OPTIMIZER_WORKERS = int(os.environ.get("OPTIMIZER_WORKERS", str(os.cpu_count() or 1)))
+OPTIMIZER_PARALLEL_MIN_STOPS = int(os.environ.get("OPTIMIZER_PARALLEL_MIN_STOPS", "40"))
+# Order optimized routes by projected duration under the hourly traffic multipliers,
+# departing at the planned start_time (requests can override with time_dependent)
+OPTIMIZER_TIME_DEPENDENT = os.environ.get("OPTIMIZER_TIME_DEPENDENT", "true").lower() in ("1", "true", "yes")
+# Routes with at least DECOMPOSE_MIN_STOPS stops are clustered, solved per cluster and stitched
+# (see decomposition.py) instead of searched whole
+DECOMPOSE_MIN_STOPS = int(os.environ.get("DECOMPOSE_MIN_STOPS", "300"))
+# /plan-full-route/stream sends an improved order at most every STREAM_UPDATE_INTERVAL_SECONDS
+STREAM_UPDATE_INTERVAL_SECONDS = float(os.environ.get("STREAM_UPDATE_INTERVAL_SECONDS", "0.25"))
+# Planned routes stay editable (insert-stop/remove-stop) for ROUTE_SESSION_TTL_SECONDS idle,
+# at most ROUTE_SESSION_MAX at a time and ROUTE_SESSION_MAX_CELLS matrix cells in total
+# (8 bytes each); each edit improves the route for up to ROUTE_SESSION_TIME_BUDGET_SECONDS
+# around the change
+ROUTE_SESSION_TTL_SECONDS = float(os.environ.get("ROUTE_SESSION_TTL_SECONDS", str(12 * 3600)))
+ROUTE_SESSION_MAX = int(os.environ.get("ROUTE_SESSION_MAX", "1000"))
+ROUTE_SESSION_MAX_CELLS = int(os.environ.get("ROUTE_SESSION_MAX_CELLS", "20000000"))
+ROUTE_SESSION_TIME_BUDGET_SECONDS = float(os.environ.get("ROUTE_SESSION_TIME_BUDGET_SECONDS", "0.05"))
+route_sessions = RouteSessionStore(ROUTE_SESSION_MAX, ROUTE_SESSION_TTL_SECONDS, ROUTE_SESSION_MAX_CELLS)
+# Route duration model: buffer per driven segment (parking, lights) and time spent at each stop
+SEGMENT_BUFFER_MINUTES = 1.0  # 1 minute buffer per segment
+DELIVERY_MINUTES_PER_STOP = 3.0  # 3 minutes per stop for delivery (more realistic)
+detour_model = DetourModel(os.environ.get("DETOUR_MODEL_DB", "db/detour_model.db"))
+try:
+    for route_coords, driven_km in load_route_observations('db/training_data.db'):
+        detour_model.observe_route(route_coords, driven_km)
+except Exception as e:
+    logger.warning(f"Could not learn detour factors from training routes: {e}")
+
+def approximate_matrix(coords_latlon: List[Tuple[float, float]]) -> Dict[str, Any]:
+    """Instant matrix in the ORS shape, estimated from straight-line distances."""
+    return detour_model.matrix(coords_latlon)
+
+def _local_routing(coords_latlon: List[Tuple[float, float]]) -> bool:
+    """True when the local road graph should answer for these points."""
+    return road_graph is not None and road_graph.covers(coords_latlon, ROAD_GRAPH_MAX_SNAP_KM)
+
+def geocode_address(address: str) -> Optional[Tuple[float, float]]:
+    """Geocode address through the cache, then OpenRouteService and Nominatim."""
+    coords, _ = geocode_address_with_source(address)
+    return coords
+
+def geocode_address_with_source(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    """Like geocode_address, but also reports which provider (or failure kind) answered."""
+    local = _geocode_locally(address)
+    if local is not None:
+        return local
+    return geocode_flight.do(normalize_address(address), _geocode_and_cache, address)
+
+async def geocode_address_async(address: str) -> Optional[Tuple[float, float]]:
+    """geocode_address for the event loop; upstream calls do not hold a thread."""
+    coords, _ = await geocode_address_with_source_async(address)
+    return coords
+
+async def geocode_address_with_source_async(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    # The cache is SQLite; keep its reads off the event loop
+    local = await asyncio.to_thread(_geocode_locally, address)
+    if local is not None:
+        return local
+    return await geocode_flight_async.do(normalize_address(address), _geocode_and_cache_async, address)
+
+def _geocode_locally(address: str) -> Optional[Tuple[Optional[Tuple[float, float]], str]]:
+    """Answer from literal coordinates or the cache; None means providers must be asked."""
+    
+    # Check if address is already coordinates (lat,lon format)
+    coords = parse_coordinates(address)
+    if coords is not None:
+        logger.info(f"✅ Using provided coordinates '{address}' -> [{coords[0]}, {coords[1]}]")
+        return coords, "coordinates"
+    
+    cached = geocode_cache.get(address)
+    if cached is not None:
+        logger.info(f"⚡ Geocode cache hit for '{address}' -> {cached.coords} ({cached.provider})")
+        if cached.coords is not None:
+            suggestion_index.add(address, cached.coords[0], cached.coords[1])
+        return cached.coords, cached.provider
+    return None
+
+def _geocode_and_cache(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    coords, source = _geocode_from_providers(address)
+    _remember_geocode(address, coords, source)
+    return coords, source
+
+async def _geocode_and_cache_async(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    coords, source = await _geocode_from_providers_async(address)
+    await asyncio.to_thread(_remember_geocode, address, coords, source)
+    return coords, source
+
+def _remember_geocode(address: str, coords: Optional[Tuple[float, float]], source: str) -> None:
+    if coords is not None:
+        geocode_cache.put(address, coords, source)
+        suggestion_index.add(address, coords[0], coords[1])
+    elif source == "not_found":
+        geocode_cache.put_negative(address)
+    # Transient provider errors are not cached so the next call retries
+
+def _gazetteer_lookup(address: str, min_score: float) -> Optional[Tuple[float, float]]:
+    if gazetteer is None:
+        return None
+    try:
+        matches = gazetteer.lookup(address, min_score=min_score)
+    except Exception as e:
+        logger.warning(f"❌ Gazetteer lookup error for '{address}': {e}")
+        return None
+    if not matches:
+        return None
+    match = matches[0]
+    logger.info(f"📚 Gazetteer matched '{address}' -> [{match.lat}, {match.lon}] ({match.name}, score {match.score})")
+    return (match.lat, match.lon)
+
+def _geocode_from_providers(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    """Uncached provider chain: local gazetteer and remote geocoders.
+
+    Returns (coords, source) where source is the provider that answered
+    ("gazetteer", "ors", "nominatim", "gazetteer_fallback", "city_fallback"),
+    "not_found" when every provider answered without a match, or "error" for
+    transient failures.
+    """
+    if GAZETTEER_MODE == "first":
+        coords = _gazetteer_lookup(address, GAZETTEER_FIRST_MIN_SCORE)
+        if coords is not None:
+            return coords, "gazetteer"
+
+    coords, source = _geocode_remote(address)
+    return _gazetteer_fallback(address, coords, source)
+
+async def _geocode_from_providers_async(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    if GAZETTEER_MODE == "first":
+        coords = await asyncio.to_thread(_gazetteer_lookup, address, GAZETTEER_FIRST_MIN_SCORE)
+        if coords is not None:
+            return coords, "gazetteer"
+
+    coords, source = await _geocode_remote_async(address)
+    return await asyncio.to_thread(_gazetteer_fallback, address, coords, source)
+
+def _gazetteer_fallback(address: str, coords: Optional[Tuple[float, float]],
+                        source: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    if coords is None or source == "city_fallback":
+        # A gazetteer match is better than a city center or no answer at all
+        local = _gazetteer_lookup(address, GAZETTEER_FALLBACK_MIN_SCORE)
+        if local is not None:
+            return local, "gazetteer_fallback"
+    return coords, source
+
+ORS_GEOCODE_URL = "https://api.openrouteservice.org/geocode/search"
+NOMINATIM_HEADERS = {"User-Agent": "delivery-route-app/1.0 (contact: tejas12gowda.com)"}
+
+def _ors_geocode_params(address: str) -> Dict[str, Any]:
+    return {
+        "text": address,
+        "boundary.country": "IN",  # Focus on India
+        "size": 5,  # Reduce size to avoid potential issues
+        # "layers": "address,poi,street",  # Simplified layers
+        "sources": "openstreetmap"  # Single source to avoid conflicts
+    }
+
+def _nominatim_params(address: str) -> Dict[str, Any]:
+    return {
+        "q": address, 
+        "format": "json", 
+        "limit": 5,  # Get more results
+        "addressdetails": 1,  # Get detailed address info
+        "countrycodes": "in",  # Focus on India
+        "extratags": 1  # Get extra tags for better matching
+    }
+
+def _parse_ors_geocode(address: str, data: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """Pick the most specific ORS feature; None when there are no features."""
+    if not data.get("features"):
+        logger.warning(f"❌ ORS geocoding failed for '{address}': No features found")
+        return None
+
+    # Try to find the most specific match with better scoring
+    best_feature = None
+    best_score = 0
+    
+    for feature in data["features"]:
+        props = feature.get("properties", {})
+        confidence = props.get("confidence", 0)
+        layer = props.get("layer", "")
+        name = props.get("name", "").lower()
+        label = props.get("label", "").lower()
+        
+        # Calculate score based on multiple factors
+        score = confidence
+        
+        # Boost score for exact name matches
+        if address.lower() in name or address.lower() in label:
+            score += 0.3
+        
+        # Boost score for specific layers
+        if layer == "address":
+            score += 0.2
+        elif layer == "poi":
+            score += 0.15
+        elif layer == "street":
+            score += 0.1
+        
+        # Boost score for higher confidence
+        if confidence > 0.8:
+            score += 0.2
+        elif confidence > 0.6:
+            score += 0.1
+        
+        if score > best_score:
+            best_score = score
+            best_feature = feature
+    
+    if not best_feature:
+        best_feature = data["features"][0]  # Fallback to first result
+    
+    coordinates = best_feature["geometry"]["coordinates"]
+    lon, lat = coordinates[0], coordinates[1]
+    props = best_feature.get("properties", {})
+    logger.info(f"✅ ORS geocoded '{address}' -> [{lat}, {lon}] (confidence: {props.get('confidence', 'N/A')}, layer: {props.get('layer', 'N/A')})")
+    return (lat, lon)
+
+def _parse_nominatim(address: str, data: List[Dict[str, Any]]) -> Tuple[Optional[Tuple[float, float]], str]:
+    if not data:
+        logger.warning(f"❌ No geocoding results for '{address}' from any service")
+        # Try a simple fallback for common Indian cities
+        address_lower = address.lower()
+        if 'bangalore' in address_lower or 'bengaluru' in address_lower:
+            logger.info(f"🔄 Using Bangalore fallback coordinates")
+            return (12.9716, 77.5946), "city_fallback"  # Bangalore center
+        elif 'mumbai' in address_lower or 'bombay' in address_lower:
+            logger.info(f"🔄 Using Mumbai fallback coordinates")
+            return (19.0760, 72.8777), "city_fallback"  # Mumbai center
+        elif 'delhi' in address_lower or 'new delhi' in address_lower:
+            logger.info(f"🔄 Using Delhi fallback coordinates")
+            return (28.6139, 77.2090), "city_fallback"  # Delhi center
+        return None, "not_found"
+    
+    # Try to find the best match from Nominatim results
+    best_result = None
+    for result in data:
+        importance = result.get("importance", 0)
+        osm_type = result.get("osm_type", "")
+        
+        # Prefer house/building results for specific addresses
+        if osm_type in ["way", "node"] and importance > 0.5:
+            best_result = result
+            break
+        elif not best_result and importance > 0.3:
+            best_result = result
+    
+    if not best_result:
+        best_result = data[0]  # Fallback to first result
+    
+    lat = float(best_result["lat"])  # type: ignore
+    lon = float(best_result["lon"])  # type: ignore
+    display_name = best_result.get("display_name", "Unknown")
+    logger.info(f"✅ Nominatim geocoded '{address}' -> [{lat}, {lon}] (importance: {best_result.get('importance', 'N/A')}, type: {best_result.get('osm_type', 'N/A')})")
+    logger.info(f"   Found: {display_name[:100]}...")
+    return (lat, lon), "nominatim"
+
+def _geocode_remote(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    """ORS geocoding first (free), then Nominatim, then hardcoded city centers."""
     
     # Try OpenRouteService Geocoding API first (FREE: 1,000 requests/day)
     if ORS_API_KEY:
         try:
-            url = "https://api.openrouteservice.org/geocode/search"
-            # Try different header formats for ORS API
             headers = {"Authorization": ORS_API_KEY}
-            params = {
-                "text": address,
-                "boundary.country": "IN",  # Focus on India
-                "size": 5,  # Reduce size to avoid potential issues
-                # "layers": "address,poi,street",  # Simplified layers
-                "sources": "openstreetmap"  # Single source to avoid conflicts
-            }
+            params = _ors_geocode_params(address)
             logger.info(f"🔍 ORS geocoding request for '{address}' with key: {ORS_API_KEY[:20]}...")
-            resp = requests.get(url, params=params, headers=headers, timeout=10)
+            ors_geocode_limiter.acquire()
+            resp = upstream.get(ORS_GEOCODE_URL, params=params, headers=headers, timeout=10)
             
             # If Bearer format fails, try without Bearer
             if resp.status_code == 401 or resp.status_code == 400:
                 logger.warning(f"🔄 Retrying ORS with different auth format...")
-                headers = {"Authorization": ORS_API_KEY}
-                resp = requests.get(url, params=params, headers=headers, timeout=10)
+                ors_geocode_limiter.acquire()
+                resp = upstream.get(ORS_GEOCODE_URL, params=params, headers=headers, timeout=10)
             
             if resp.status_code == 200:
-                data = resp.json()
-                if data.get("features"):
-                    # Try to find the most specific match with better scoring
-                    best_feature = None
-                    best_score = 0
-                    
-                    for feature in data["features"]:
-                        props = feature.get("properties", {})
-                        confidence = props.get("confidence", 0)
-                        layer = props.get("layer", "")
-                        name = props.get("name", "").lower()
-                        label = props.get("label", "").lower()
-                        
-                        # Calculate score based on multiple factors
-                        score = confidence
-                        
-                        # Boost score for exact name matches
-                        if address.lower() in name or address.lower() in label:
-                            score += 0.3
-                        
-                        # Boost score for specific layers
-                        if layer == "address":
-                            score += 0.2
-                        elif layer == "poi":
-                            score += 0.15
-                        elif layer == "street":
-                            score += 0.1
-                        
-                        # Boost score for higher confidence
-                        if confidence > 0.8:
-                            score += 0.2
-                        elif confidence > 0.6:
-                            score += 0.1
-                        
-                        if score > best_score:
-                            best_score = score
-                            best_feature = feature
-                    
-                    if not best_feature:
-                        best_feature = data["features"][0]  # Fallback to first result
-                    
-                    coordinates = best_feature["geometry"]["coordinates"]
-                    lon, lat = coordinates[0], coordinates[1]
-                    props = best_feature.get("properties", {})
-                    logger.info(f"✅ ORS geocoded '{address}' -> [{lat}, {lon}] (confidence: {props.get('confidence', 'N/A')}, layer: {props.get('layer', 'N/A')})")
-                    return (lat, lon)
-                else:
-                    logger.warning(f"❌ ORS geocoding failed for '{address}': No features found")
+                coords = _parse_ors_geocode(address, resp.json())
+                if coords is not None:
+                    return coords, "ors"
             else:
                 logger.warning(f"❌ ORS API error for '{address}': HTTP {resp.status_code}")
                 logger.warning(f"   Response: {resp.text[:200]}...")
@@ -444,69 +858,229 @@ def geocode_address(address: str) -> Optional[Tuple[float, float]]:
     
     # Fallback to Nominatim with better parameters
     logger.info(f"🔄 Trying Nominatim fallback for '{address}'")
-    headers = {"User-Agent": "delivery-route-app/1.0 (contact: tejas12gowda.com)"}
-    params = {
-        "q": address, 
-        "format": "json", 
-        "limit": 5,  # Get more results
-        "addressdetails": 1,  # Get detailed address info
-        "countrycodes": "in",  # Focus on India
-        "extratags": 1  # Get extra tags for better matching
-    }
     try:
-        resp = requests.get(NOMINATIM_URL, params=params, headers=headers, timeout=15)
+        nominatim_limiter.acquire()
+        resp = upstream.get(NOMINATIM_URL, params=_nominatim_params(address), headers=NOMINATIM_HEADERS, timeout=15)
         if resp.status_code != 200:
             logger.warning(f"❌ Nominatim non-200 for '{address}': {resp.status_code}")
-            return None
-        data = resp.json()
-        if not data:
-            logger.warning(f"❌ No geocoding results for '{address}' from any service")
-            # Try a simple fallback for common Indian cities
-            address_lower = address.lower()
-            if 'bangalore' in address_lower or 'bengaluru' in address_lower:
-                logger.info(f"🔄 Using Bangalore fallback coordinates")
-                return (12.9716, 77.5946)  # Bangalore center
-            elif 'mumbai' in address_lower or 'bombay' in address_lower:
-                logger.info(f"🔄 Using Mumbai fallback coordinates")
-                return (19.0760, 72.8777)  # Mumbai center
-            elif 'delhi' in address_lower or 'new delhi' in address_lower:
-                logger.info(f"🔄 Using Delhi fallback coordinates")
-                return (28.6139, 77.2090)  # Delhi center
-            return None
-        
-        # Try to find the best match from Nominatim results
-        best_result = None
-        for result in data:
-            importance = result.get("importance", 0)
-            osm_type = result.get("osm_type", "")
+            return None, "error"
+        return _parse_nominatim(address, resp.json())
+    except Exception as e:
+        logger.error(f"❌ Nominatim error for '{address}': {e}")
+        return None, "error"
+
+async def _geocode_remote_async(address: str) -> Tuple[Optional[Tuple[float, float]], str]:
+    """_geocode_remote on the async client; rate limits are shared with the sync path."""
+    if ORS_API_KEY:
+        try:
+            headers = {"Authorization": ORS_API_KEY}
+            params = _ors_geocode_params(address)
+            logger.info(f"🔍 ORS geocoding request for '{address}' with key: {ORS_API_KEY[:20]}...")
+            await ors_geocode_limiter.acquire_async()
+            resp = await upstream_async.get(ORS_GEOCODE_URL, params=params, headers=headers, timeout=10)
             
-            # Prefer house/building results for specific addresses
-            if osm_type in ["way", "node"] and importance > 0.5:
-                best_result = result
-                break
-            elif not best_result and importance > 0.3:
-                best_result = result
-        
-        if not best_result:
-            best_result = data[0]  # Fallback to first result
-        
-        lat = float(best_result["lat"])  # type: ignore
-        lon = float(best_result["lon"])  # type: ignore
-        display_name = best_result.get("display_name", "Unknown")
-        logger.info(f"✅ Nominatim geocoded '{address}' -> [{lat}, {lon}] (importance: {best_result.get('importance', 'N/A')}, type: {best_result.get('osm_type', 'N/A')})")
-        logger.info(f"   Found: {display_name[:100]}...")
-        return (lat, lon)
+            if resp.status_code == 401 or resp.status_code == 400:
+                logger.warning(f"🔄 Retrying ORS with different auth format...")
+                await ors_geocode_limiter.acquire_async()
+                resp = await upstream_async.get(ORS_GEOCODE_URL, params=params, headers=headers, timeout=10)
+            
+            if resp.status_code == 200:
+                coords = _parse_ors_geocode(address, resp.json())
+                if coords is not None:
+                    return coords, "ors"
+            else:
+                logger.warning(f"❌ ORS API error for '{address}': HTTP {resp.status_code}")
+                logger.warning(f"   Response: {resp.text[:200]}...")
+        except Exception as e:
+            logger.error(f"❌ ORS geocoding error for '{address}': {e}")
+    
+    logger.info(f"🔄 Trying Nominatim fallback for '{address}'")
+    try:
+        await nominatim_limiter.acquire_async()
+        resp = await upstream_async.get(NOMINATIM_URL, params=_nominatim_params(address),
+                                        headers=NOMINATIM_HEADERS, timeout=15)
+        if resp.status_code != 200:
+            logger.warning(f"❌ Nominatim non-200 for '{address}': {resp.status_code}")
+            return None, "error"
+        return _parse_nominatim(address, resp.json())
     except Exception as e:
         logger.error(f"❌ Nominatim error for '{address}': {e}")
-        return None
+        return None, "error"
+
+def _matrix_flight_key(coords_latlon: List[Tuple[float, float]]) -> Tuple[Tuple[float, float], ...]:
+    return tuple((round(lat, 6), round(lon, 6)) for (lat, lon) in coords_latlon)
 
 def ors_matrix(api_key: str, coords_latlon: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+    """ORS distance/duration matrix. Identical concurrent requests share one call (treat result as read-only)."""
+    if _local_routing(coords_latlon):
+        return road_graph.matrix(coords_latlon)
+    return matrix_flight.do(_matrix_flight_key(coords_latlon), _fetch_ors_matrix, api_key, coords_latlon)
+
+async def ors_matrix_async(api_key: str, coords_latlon: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+    """ors_matrix for the event loop; missing tiles are fetched concurrently (ORS_MATRIX_MAX_PARALLEL at a time).
+
+    Road graph queries are CPU-bound and run in a worker thread.
+    """
+    if await asyncio.to_thread(_local_routing, coords_latlon):
+        return await asyncio.to_thread(road_graph.matrix, coords_latlon)
+    return await matrix_flight_async.do(_matrix_flight_key(coords_latlon), _fetch_ors_matrix_async,
+                                        api_key, coords_latlon)
+
+def _fetch_ors_matrix(api_key: str, coords_latlon: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+    """Assemble the matrix from cached cells, fetching only the missing rows/columns.
+
+    Missing cells are split into tiles within the provider's per-request
+    limits and fetched in parallel.
+    """
+    keys = matrix_cache.keys_for(coords_latlon)
+    distances, durations, known = matrix_cache.lookup(keys)
+    blocks = tile_blocks(plan_missing_blocks(known), ORS_MATRIX_MAX_LOCATIONS, ORS_MATRIX_MAX_ELEMENTS)
+    if len(blocks) <= 1:
+        results = [_ors_matrix_request(api_key, coords_latlon, sources, destinations)
+                   for sources, destinations in blocks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(ORS_MATRIX_MAX_PARALLEL, len(blocks))) as executor:
+            results = list(executor.map(lambda block: _ors_matrix_request(api_key, coords_latlon, *block), blocks))
+    return _merge_matrix_blocks(coords_latlon, keys, distances, durations, blocks, results)
+
+async def _fetch_ors_matrix_async(api_key: str, coords_latlon: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+    keys = matrix_cache.keys_for(coords_latlon)
+    distances, durations, known = await asyncio.to_thread(matrix_cache.lookup, keys)
+    blocks = tile_blocks(plan_missing_blocks(known), ORS_MATRIX_MAX_LOCATIONS, ORS_MATRIX_MAX_ELEMENTS)
+    failed = await _fetch_matrix_tiles_async(api_key, coords_latlon, keys, distances, durations, blocks)
+    return await asyncio.to_thread(_assembled_matrix, keys, distances, durations, blocks, failed)
+
+async def _fetch_matrix_tiles_async(api_key: str, coords_latlon: List[Tuple[float, float]],
+                                    keys: List[Tuple[int, int]], distances: np.ndarray, durations: np.ndarray,
+                                    blocks: List[Tuple[List[int], List[int]]]) -> int:
+    """Fetch tiles concurrently, caching each as it arrives; returns the failed count.
+
+    A fetch cut short (the plan's matrix timeout) keeps every tile ORS has
+    already answered, so the next plan only asks for the rest.
+    """
+    semaphore = asyncio.Semaphore(max(1, ORS_MATRIX_MAX_PARALLEL))
+
+    async def fetch(sources: List[int], destinations: List[int]) -> int:
+        async with semaphore:
+            block = await _ors_matrix_request_async(api_key, coords_latlon, sources, destinations)
+        return await asyncio.to_thread(_store_matrix_blocks, coords_latlon, keys, distances, durations,
+                                       [(sources, destinations)], [block])
+
+    return sum(await asyncio.gather(*(fetch(sources, destinations) for sources, destinations in blocks)))
+
+def _merge_matrix_blocks(coords_latlon: List[Tuple[float, float]], keys: List[Tuple[int, int]],
+                         distances: np.ndarray, durations: np.ndarray,
+                         blocks: List[Tuple[List[int], List[int]]],
+                         results: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Store fetched blocks in the cell cache and fill them into the cached view.
+
+    Returns None if any block failed; the blocks that did arrive are still
+    cached so a retry only fetches the rest.
+    """
+    failed = _store_matrix_blocks(coords_latlon, keys, distances, durations, blocks, results)
+    return _assembled_matrix(keys, distances, durations, blocks, failed)
+
+def _assembled_matrix(keys: List[Tuple[int, int]], distances: np.ndarray, durations: np.ndarray,
+                      blocks: List[Tuple[List[int], List[int]]], failed: int) -> Optional[Dict[str, Any]]:
+    """The full matrix response, or None if any block failed."""
+    if failed:
+        logger.warning(f"ORS matrix: {failed} of {len(blocks)} request(s) failed")
+        return None
+    n = len(keys)
+    fetched = sum(len(src) * len(dst) for src, dst in blocks)
+    logger.info(f"🧮 Matrix {n}x{n}: {fetched} cells fetched in {len(blocks)} request(s), rest from cache")
+    return {"distances": _matrix_to_list(distances), "durations": _matrix_to_list(durations)}
+
+def _store_matrix_blocks(coords_latlon: List[Tuple[float, float]], keys: List[Tuple[int, int]],
+                         distances: np.ndarray, durations: np.ndarray,
+                         blocks: List[Tuple[List[int], List[int]]],
+                         results: List[Optional[Dict[str, Any]]]) -> int:
+    """Cache successful blocks and write them into distances/durations; returns the failed count."""
+    failed = 0
+    for (sources, destinations), block in zip(blocks, results):
+        if block is None or "distances" not in block or "durations" not in block:
+            failed += 1
+            continue
+        matrix_cache.store([keys[i] for i in sources], [keys[j] for j in destinations],
+                           block["distances"], block["durations"])
+        block_dist = np.array(block["distances"], dtype=float)
+        block_dur = np.array(block["durations"], dtype=float)
+        distances[np.ix_(sources, destinations)] = block_dist
+        durations[np.ix_(sources, destinations)] = block_dur
+        # Every real matrix cell refines the approximate-matrix factors
+        detour_model.observe(haversine_pairs([coords_latlon[i] for i in sources],
+                                             [coords_latlon[j] for j in destinations]),
+                             block_dist, block_dur)
+    return failed
+
+async def ors_sparse_matrix_async(api_key: str, coords_latlon: List[Tuple[float, float]],
+                                  k: int) -> Optional[Dict[str, Any]]:
+    """Matrix with only each stop's k nearest candidates (both directions) measured.
+
+    Candidates come from a haversine prefilter; their cells are served from
+    the cell cache or fetched in grouped requests, so ORS sees about n*k
+    cells instead of n*n. Every other cell is a conservative estimate from
+    the detour model. Returns SparseCostMatrix values under "distances" and
+    "durations", which the optimizers take directly.
+    """
+    if await asyncio.to_thread(_local_routing, coords_latlon):
+        return await asyncio.to_thread(road_graph.matrix, coords_latlon)
+    # Shared and shielded like the full matrix, so a timed-out plan does not cancel the fetch
+    return await matrix_flight_async.do(("sparse", k) + _matrix_flight_key(coords_latlon),
+                                        _fetch_ors_sparse_matrix_async, api_key, coords_latlon, k)
+
+async def _fetch_ors_sparse_matrix_async(api_key: str, coords_latlon: List[Tuple[float, float]],
+                                         k: int) -> Optional[Dict[str, Any]]:
+    keys = matrix_cache.keys_for(coords_latlon)
+    distances, durations, known = await asyncio.to_thread(matrix_cache.lookup, keys)
+    neighbors = knn_candidates(coords_latlon, k)
+    needed = needed_cells(neighbors)
+    blocks = tile_blocks(plan_sparse_blocks(coords_latlon, needed & ~known,
+                                            ORS_MATRIX_MAX_LOCATIONS, ORS_MATRIX_MAX_ELEMENTS),
+                         ORS_MATRIX_MAX_LOCATIONS, ORS_MATRIX_MAX_ELEMENTS)
+    failed = await _fetch_matrix_tiles_async(api_key, coords_latlon, keys, distances, durations, blocks)
+    if failed:
+        logger.warning(f"ORS sparse matrix: {failed} of {len(blocks)} request(s) failed")
+        return None
+    requested = known.copy()
+    for sources, destinations in blocks:
+        requested[np.ix_(sources, destinations)] = True
+    est_km, est_seconds = detour_model.estimate(coords_latlon)
+    n = len(keys)
+    fetched = sum(len(src) * len(dst) for src, dst in blocks)
+    logger.info(f"🧮 Sparse matrix {n}x{n} (k={neighbors.shape[1]}): {fetched} cells fetched "
+                f"in {len(blocks)} request(s), {int(needed.sum())} needed")
+    return {
+        "distances": build_sparse(distances, requested, est_km, neighbors),
+        "durations": build_sparse(durations, requested, est_seconds, neighbors),
+        "sparse": True,
+    }
+
+def _matrix_to_list(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    # ORS reports unroutable pairs as null; keep that convention
+    return [[None if np.isnan(v) else float(v) for v in row] for row in matrix]
+
+def _ors_matrix_body(coords_latlon: List[Tuple[float, float]],
+                     sources: List[int], destinations: List[int]) -> Dict[str, Any]:
+    # Only send the locations this block needs, re-indexed
+    used = sorted(set(sources) | set(destinations))
+    position = {idx: pos for pos, idx in enumerate(used)}
     # ORS expects [lon, lat]
-    locations = [[lon, lat] for (lat, lon) in coords_latlon]
-    headers = {"Authorization": api_key, "Content-Type": "application/json"}
+    locations = [[coords_latlon[i][1], coords_latlon[i][0]] for i in used]
     body = {"locations": locations, "metrics": ["distance", "duration"], "units": "km"}
+    if len(sources) < len(used) or len(destinations) < len(used):
+        body["sources"] = [position[i] for i in sources]
+        body["destinations"] = [position[j] for j in destinations]
+    return body
+
+def _ors_matrix_request(api_key: str, coords_latlon: List[Tuple[float, float]],
+                        sources: List[int], destinations: List[int]) -> Optional[Dict[str, Any]]:
+    """One ORS matrix call for the given source/destination indices into coords_latlon."""
+    headers = {"Authorization": api_key, "Content-Type": "application/json"}
+    body = _ors_matrix_body(coords_latlon, sources, destinations)
+    ors_matrix_limiter.acquire()
     try:
-        resp = requests.post(ORS_MATRIX_URL, json=body, headers=headers, timeout=30)
+        resp = upstream.post(ORS_MATRIX_URL, json=body, headers=headers, timeout=30)
         if resp.status_code != 200:
             logger.warning(f"ORS matrix non-200: {resp.status_code} {resp.text[:200]}")
             return None
@@ -515,116 +1089,52 @@ def ors_matrix(api_key: str, coords_latlon: List[Tuple[float, float]]) -> Option
         logger.error(f"ORS matrix error: {e}")
         return None
 
-def nearest_neighbor_order(matrix_dist: List[List[float]], start_index: int = 0) -> List[int]:
-    n = len(matrix_dist)
-    visited = [False] * n
-    order = [start_index]
-    visited[start_index] = True
-    current = start_index
-    for _ in range(n - 1):
-        next_idx = None
-        next_cost = float("inf")
-        for j in range(n):
-            if not visited[j] and matrix_dist[current][j] is not None:
-                if matrix_dist[current][j] < next_cost:
-                    next_cost = matrix_dist[current][j]
-                    next_idx = j
-        if next_idx is None:
-            # Fallback: pick any unvisited
-            for j in range(n):
-                if not visited[j]:
-                    next_idx = j
-                    break
-        order.append(next_idx)  # type: ignore
-        visited[next_idx] = True  # type: ignore
-        current = next_idx  # type: ignore
-    return order
-
-def _route_cost(matrix_dist: List[List[float]], order: List[int]) -> float:
-    total = 0.0
-    for i in range(len(order) - 1):
-        total += float(matrix_dist[order[i]][order[i + 1]])
-    return total
-
-def two_opt_improvement(matrix_dist: List[List[float]], order: List[int], max_iterations: int = 200) -> List[int]:
-    """Simple 2-opt local search to improve a given route order.
-    Keeps first and last nodes fixed; improves internal sequence for lower total distance.
-    """
-    if len(order) <= 3:
-        return order
-    best = order[:]
-    best_cost = _route_cost(matrix_dist, best)
-    n = len(order)
-    iterations = 0
-    improved = True
-    while improved and iterations < max_iterations:
-        improved = False
-        iterations += 1
-        # Do not swap the very first index to preserve start
-        for i in range(1, n - 2):
-            for k in range(i + 1, n - 1):
-                # Create new order by reversing the segment [i:k]
-                new_order = best[:i] + list(reversed(best[i:k + 1])) + best[k + 1:]
-                new_cost = _route_cost(matrix_dist, new_order)
-                if new_cost + 1e-9 < best_cost:
-                    best = new_order
-                    best_cost = new_cost
-                    improved = True
-        # loop again if improved
-    return best
-
-def _nearest_neighbor_with_start(matrix: List[List[float]], start_index: int) -> List[int]:
-    return nearest_neighbor_order(matrix, start_index)
-
-def build_best_order_multistart(matrix: List[List[float]], prefer_start: int = 0) -> List[int]:
-    """Always start from the preferred start point and optimize from there."""
-    n = len(matrix)
-    if n <= 1:
-        return list(range(n))
-    
-    # For delivery routes, use simple sequential order starting from current location
-    # This ensures we visit all stops in the order they were added
-    if prefer_start == 0:
-        # If starting from current location (index 0), use sequential order
-        order = list(range(n))
-        logger.info(f"📍 Using sequential delivery order: {order}")
-    else:
-        # For other cases, use nearest neighbor with 2-opt
-        order = _nearest_neighbor_with_start(matrix, prefer_start)
-        order = two_opt_improvement(matrix, order)
-        logger.info(f"📍 Using optimized order: {order}")
-    
-    return order
+async def _ors_matrix_request_async(api_key: str, coords_latlon: List[Tuple[float, float]],
+                                    sources: List[int], destinations: List[int]) -> Optional[Dict[str, Any]]:
+    headers = {"Authorization": api_key, "Content-Type": "application/json"}
+    body = _ors_matrix_body(coords_latlon, sources, destinations)
+    await ors_matrix_limiter.acquire_async()
+    try:
+        resp = await upstream_async.post(ORS_MATRIX_URL, json=body, headers=headers, timeout=30)
+        if resp.status_code != 200:
+            logger.warning(f"ORS matrix non-200: {resp.status_code} {resp.text[:200]}")
+            return None
+        return resp.json()
+    except Exception as e:
+        logger.error(f"ORS matrix error: {e}")
+        return None
 
-def get_traffic_multiplier(lat: float, lon: float, time_of_day: str = None) -> float:
-    """Get traffic multiplier based on location and time."""
+def _traffic_period(hour: int) -> Tuple[str, float]:
+    """(time period, base multiplier) for an hour of day."""
+    # Peak hours in India (adjust based on your city)
+    if 7 <= hour <= 10 or 17 <= hour <= 20:  # Rush hours
+        return "Rush Hours", 2.2
+    elif 10 <= hour <= 17:  # Daytime
+        return "Daytime", 1.8
+    elif 20 <= hour <= 23:  # Evening
+        return "Evening", 1.5
+    else:  # Night/Early morning
+        return "Night/Early Morning", 1.2
+
+def _location_traffic_factor(lat: float, lon: float) -> float:
+    # Location-based adjustments (you can expand this)
+    # Bangalore traffic is generally heavier
+    if 12.5 <= lat <= 13.5 and 77.0 <= lon <= 78.0:  # Bangalore area
+        return 1.1
+    # Mumbai traffic
+    elif 18.5 <= lat <= 19.5 and 72.5 <= lon <= 73.5:  # Mumbai area
+        return 1.2
+    # Delhi traffic
+    elif 28.0 <= lat <= 29.0 and 76.5 <= lon <= 77.5:  # Delhi area
+        return 1.15
+    return 1.0
+
+def get_traffic_multiplier(lat: float, lon: float, time_of_day: str = None, hour: Optional[int] = None) -> float:
+    """Get traffic multiplier based on location and time (hour of day; now if omitted)."""
     try:
         # For now, use time-based multipliers until we integrate real traffic APIs
-        current_hour = datetime.now().hour
-        
-        # Peak hours in India (adjust based on your city)
-        if 7 <= current_hour <= 10 or 17 <= current_hour <= 20:  # Rush hours
-            base_multiplier = 2.2
-        elif 10 <= current_hour <= 17:  # Daytime
-            base_multiplier = 1.8
-        elif 20 <= current_hour <= 23:  # Evening
-            base_multiplier = 1.5
-        else:  # Night/Early morning
-            base_multiplier = 1.2
-        
-        # Location-based adjustments (you can expand this)
-        # Bangalore traffic is generally heavier
-        if 12.5 <= lat <= 13.5 and 77.0 <= lon <= 78.0:  # Bangalore area
-            base_multiplier *= 1.1
-        
-        # Mumbai traffic
-        elif 18.5 <= lat <= 19.5 and 72.5 <= lon <= 73.5:  # Mumbai area
-            base_multiplier *= 1.2
-        
-        # Delhi traffic
-        elif 28.0 <= lat <= 29.0 and 76.5 <= lon <= 77.5:  # Delhi area
-            base_multiplier *= 1.15
-        
+        current_hour = datetime.now().hour if hour is None else hour
+        base_multiplier = _traffic_period(current_hour)[1] * _location_traffic_factor(lat, lon)
         logger.info(f"🚦 Traffic multiplier: {base_multiplier:.2f} (hour: {current_hour}, location: {lat:.3f}, {lon:.3f})")
         return base_multiplier
         
@@ -632,6 +1142,13 @@ def get_traffic_multiplier(lat: float, lon: float, time_of_day: str = None) -> f
         logger.warning(f"❌ Error calculating traffic multiplier: {e}")
         return 1.8  # Default fallback
 
+def hourly_traffic_profile(coords_latlon: List[Tuple[float, float]]) -> List[float]:
+    """24 traffic multipliers (index = hour of day) for the area around these points."""
+    lat = sum(c[0] for c in coords_latlon) / len(coords_latlon)
+    lon = sum(c[1] for c in coords_latlon) / len(coords_latlon)
+    factor = _location_traffic_factor(lat, lon)
+    return [_traffic_period(hour)[1] * factor for hour in range(24)]
+
 def get_real_time_traffic_data(lat: float, lon: float) -> Optional[Dict[str, Any]]:
     """Get real-time traffic data from external APIs."""
     try:
@@ -654,11 +1171,27 @@ def get_real_time_traffic_data(lat: float, lon: float) -> Optional[Dict[str, Any
         return None
 
 def ors_directions(api_key: str, coords_latlon_ordered: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
-    coordinates = [[lon, lat] for (lat, lon) in coords_latlon_ordered]
+    if _local_routing(coords_latlon_ordered):
+        return road_graph.directions(coords_latlon_ordered)
+    headers = {"Authorization": api_key, "Content-Type": "application/json"}
+    body = _ors_directions_body(coords_latlon_ordered)
+    try:
+        resp = upstream.post(ORS_DIRECTIONS_URL, json=body, headers=headers, timeout=45)
+        if resp.status_code != 200:
+            logger.warning(f"ORS directions non-200: {resp.status_code} {resp.text[:200]}")
+            return None
+        return resp.json()
+    except Exception as e:
+        logger.error(f"ORS directions error: {e}")
+        return None
+
+async def ors_directions_async(api_key: str, coords_latlon_ordered: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+    if await asyncio.to_thread(_local_routing, coords_latlon_ordered):
+        return await asyncio.to_thread(road_graph.directions, coords_latlon_ordered)
     headers = {"Authorization": api_key, "Content-Type": "application/json"}
-    body = {"coordinates": coordinates, "units": "km"}
+    body = _ors_directions_body(coords_latlon_ordered)
     try:
-        resp = requests.post(ORS_DIRECTIONS_URL, json=body, headers=headers, timeout=45)
+        resp = await upstream_async.post(ORS_DIRECTIONS_URL, json=body, headers=headers, timeout=45)
         if resp.status_code != 200:
             logger.warning(f"ORS directions non-200: {resp.status_code} {resp.text[:200]}")
             return None
@@ -667,6 +1200,10 @@ def ors_directions(api_key: str, coords_latlon_ordered: List[Tuple[float, float]
         logger.error(f"ORS directions error: {e}")
         return None
 
+def _ors_directions_body(coords_latlon_ordered: List[Tuple[float, float]]) -> Dict[str, Any]:
+    coordinates = [[lon, lat] for (lat, lon) in coords_latlon_ordered]
+    return {"coordinates": coordinates, "units": "km"}
+
 # --- OCR Parsing Functions ---
 def parse_ocr_original(result):
     """Your current parsing method"""
@@ -728,13 +1265,39 @@ def parse_ocr_defensive(result):
 def read_root():
     return {"message": "Welcome to the AI Route Optimization API! It is running correctly."}
 
+@app.get("/metrics")
+def get_metrics():
+    """Cache and upstream counters for the geocoding/routing pipeline."""
+    return {
+        "geocode_cache": geocode_cache.stats(),
+        "rate_limits": {
+            "ors_geocode": ors_geocode_limiter.stats(),
+            "nominatim": nominatim_limiter.stats(),
+            "ors_matrix": ors_matrix_limiter.stats(),
+        },
+        "matrix_cache": matrix_cache.stats(),
+        "route_sessions": route_sessions.stats(),
+        "approximate_matrix": detour_model.stats(),
+        "upstream_hosts": upstream.stats(),
+        "upstream_hosts_async": upstream_async.stats(),
+        "singleflight": {
+            "geocode": geocode_flight.stats(),
+            "suggestions": suggestion_flight.stats(),
+            "matrix": matrix_flight.stats(),
+            "geocode_async": geocode_flight_async.stats(),
+            "matrix_async": matrix_flight_async.stats(),
+        },
+    }
+
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "ocr_model_loaded": ocr_model is not None,
-        "ml_models_loaded": eta_model is not None and model_columns is not None
+        "ml_models_loaded": eta_model is not None and model_columns is not None,
+        "gazetteer_loaded": gazetteer is not None,
+        "routing_backend": "local" if road_graph is not None else "ors"
     }
 
 @app.post("/ocr/extract-text")
@@ -963,7 +1526,7 @@ def get_nearby_places(lat: float, lon: float, radius: int = 5000):
         out center;
         """
         
-        response = requests.post(overpass_url, data=query, timeout=30)
+        response = upstream.post(overpass_url, data=query, timeout=30)
         if response.status_code == 200:
             data = response.json()
             places = []
@@ -1006,11 +1569,29 @@ def get_nearby_places(lat: float, lon: float, radius: int = 5000):
         return {"places": []}
 
 @app.get("/search-suggestions")
-def search_suggestions(q: str):
-    """Get search suggestions using ORS geocoding API."""
+def search_suggestions(q: str, lat: Optional[float] = None, lon: Optional[float] = None):
+    """Get search suggestions from the local index, topping up from ORS/Nominatim.
+
+    Optional lat/lon rank nearby local suggestions higher.
+    """
     if not q or len(q.strip()) < 2:
         return {"suggestions": []}
     
+    near = (lat, lon) if lat is not None and lon is not None else None
+    suggestions = suggestion_index.search(q, limit=SUGGESTION_LIMIT, near=near)
+    if len(suggestions) >= SUGGEST_MIN_LOCAL_RESULTS:
+        return {"suggestions": suggestions}
+    
+    # Too few local matches: ask the remote providers and merge, local first
+    seen = {s["display_name"].lower() for s in suggestions}
+    for item in suggestion_flight.do(normalize_address(q), _remote_suggestions, q):
+        if item["display_name"].lower() not in seen and len(suggestions) < SUGGESTION_LIMIT:
+            seen.add(item["display_name"].lower())
+            suggestions.append(item)
+    return {"suggestions": suggestions}
+
+def _remote_suggestions(q: str) -> List[Dict[str, Any]]:
+    """Suggestions from ORS geocoding, falling back to Nominatim."""
     suggestions = []
     
     # Try ORS Geocoding API first
@@ -1024,7 +1605,9 @@ def search_suggestions(q: str):
                 "boundary.country": "IN",  # Focus on India
                 "size": 5
             }
-            resp = requests.get(url, params=params, headers=headers, timeout=10)
+            if not ors_geocode_limiter.acquire(timeout=2.0):
+                raise RuntimeError("ORS geocode rate limit reached")
+            resp = upstream.get(url, params=params, headers=headers, timeout=10)
             if resp.status_code == 200:
                 data = resp.json()
                 if data.get("features"):
@@ -1037,7 +1620,7 @@ def search_suggestions(q: str):
                             "lon": coords[0]
                         })
                     logger.info(f"✅ ORS found {len(suggestions)} suggestions for '{q}'")
-                    return {"suggestions": suggestions}
+                    return suggestions
         except Exception as e:
             logger.warning(f"❌ ORS search error for '{q}': {e}")
     
@@ -1050,7 +1633,10 @@ def search_suggestions(q: str):
             "addressdetails": "1",
             "limit": 5
         }
-        resp = requests.get(NOMINATIM_URL, params=params, headers=headers, timeout=10)
+        if not nominatim_limiter.acquire(timeout=2.0):
+            logger.warning(f"⏳ Nominatim rate limit reached; skipping suggestions for '{q}'")
+            return suggestions
+        resp = upstream.get(NOMINATIM_URL, params=params, headers=headers, timeout=10)
         if resp.status_code == 200:
             data = resp.json()
             for item in data:
@@ -1063,37 +1649,183 @@ def search_suggestions(q: str):
     except Exception as e:
         logger.error(f"❌ Nominatim search error for '{q}': {e}")
     
-    return {"suggestions": suggestions}
+    return suggestions
+
+def directions_legs(directions: Optional[Dict[str, Any]]) -> Optional[List[Tuple[float, float]]]:
+    """Per-leg (distance_km, duration_minutes) from a multi-waypoint ORS directions response."""
+    if not directions or not directions.get("features"):
+        return None
+    segments = directions["features"][0].get("properties", {}).get("segments")
+    if not segments:
+        return None
+    return [(float(seg.get("distance", 0.0)), float(seg.get("duration", 0.0)) / 60.0) for seg in segments]
+
+def route_legs(directions: Optional[Dict[str, Any]], ordered_coords: List[Tuple[float, float]], order_idx: List[int],
+               matrix: Optional[Dict[str, Any]]) -> Tuple[List[Optional[Tuple[float, float]]], Optional[Dict[str, Any]]]:
+    """Leg metrics and geometry for an ordered route from one multi-waypoint directions response.
+
+    Falls back to the already-fetched matrix (indexed like order_idx) for
+    legs when directions fail or come back without per-segment summaries.
+    """
+    route_geojson = None
+    if directions and "features" in directions and len(directions["features"]) > 0:
+        route_geojson = directions["features"][0]
+    legs: List[Optional[Tuple[float, float]]] = directions_legs(directions) or []
+    if len(legs) == len(ordered_coords) - 1:
+        return legs, route_geojson
+
+    logger.warning("⚠️ Directions had no per-leg summaries; using matrix values for legs")
+    legs = []
+    distances = (matrix or {}).get("distances")
+    durations = (matrix or {}).get("durations")
+    for a, b in zip(order_idx, order_idx[1:]):
+        dist = distances[a][b] if distances else None
+        dur = durations[a][b] if durations else None
+        legs.append(None if dist is None or dur is None else (float(dist), float(dur) / 60.0))
+    return legs, route_geojson
+
+def segment_traffic_multiplier(start_coord: Tuple[float, float], end_coord: Tuple[float, float],
+                               segment_distance: float, hour: Optional[int] = None) -> float:
+    """Traffic multiplier for one leg, evaluated at its midpoint and departure hour (now if omitted)."""
+    mid_lat = (start_coord[0] + end_coord[0]) / 2
+    mid_lon = (start_coord[1] + end_coord[1]) / 2
+    
+    # Try to get real-time traffic data first
+    real_time_traffic = get_real_time_traffic_data(mid_lat, mid_lon)
+    if real_time_traffic:
+        # Use real-time traffic data if available
+        traffic_multiplier = real_time_traffic.get('multiplier', 1.8)
+        logger.info(f"    Using real-time traffic multiplier: {traffic_multiplier:.2f}")
+        return traffic_multiplier
+    
+    # Use improved traffic calculation
+    traffic_multiplier = get_traffic_multiplier(mid_lat, mid_lon, hour=hour)
+    return traffic_multiplier * _leg_distance_factor(segment_distance)
+
+def _leg_distance_factor(segment_distance: float) -> float:
+    # Additional adjustment based on distance (longer routes have more variability)
+    if segment_distance > 10:  # Long distance
+        return 1.1
+    elif segment_distance < 2:  # Short distance
+        return 0.9
+    return 1.0
+
+def _empty_plan_response(**extra: Any) -> Dict[str, Any]:
+    response = {
+        "ordered_addresses": [],
+        "ordered_coordinates": [],
+        "ors_duration_minutes": 0.0,
+        "total_distance_km": 0.0,
+        "num_stops": 0,
+        "predicted_eta_minutes": None,
+        "route_geometry_geojson": None
+    }
+    response.update(extra)
+    return response
+
+def _addresses_from_csv(text: str) -> List[str]:
+    """Addresses from an 'address' column if there is a header, else the first column."""
+    rows = [row for row in csv.reader(io.StringIO(text)) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    for name in ("address", "addresses", "full_address", "location"):
+        if name in header:
+            col = header.index(name)
+            return [row[col].strip() for row in rows[1:] if len(row) > col and row[col].strip()]
+    if len(rows[0]) > 1:
+        # Several unnamed columns: treat each row as one comma-separated address
+        return [", ".join(cell.strip() for cell in row if cell.strip()) for row in rows]
+    return [row[0].strip() for row in rows if row[0].strip()]
+
+@app.post("/geocode/batch")
+async def geocode_batch(request: FastAPIRequest):
+    """Geocode many addresses, streaming one NDJSON line per unique address as it resolves.
+
+    Accepts a JSON list of strings, {"addresses": [...]}, a text/csv body, or a
+    multipart upload with a CSV file field. Each result line lists every input
+    index that shared the (normalized) address; the last line is a summary.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = next((v for v in form.values() if hasattr(v, "read")), None)
+        if upload is None:
+            raise HTTPException(status_code=400, detail="Expected a CSV file upload")
+        addresses = _addresses_from_csv((await upload.read()).decode("utf-8-sig"))
+    elif "csv" in content_type or content_type.startswith("text/plain"):
+        addresses = _addresses_from_csv((await request.body()).decode("utf-8-sig"))
+    else:
+        try:
+            payload = await request.json()
+        except Exception:
+            raise HTTPException(status_code=400, detail="Body must be a JSON list of addresses or a CSV upload")
+        if isinstance(payload, dict):
+            payload = payload.get("addresses")
+        if not isinstance(payload, list) or not all(isinstance(a, str) for a in payload):
+            raise HTTPException(status_code=400, detail="Body must be a JSON list of addresses or a CSV upload")
+        addresses = [a.strip() for a in payload if a.strip()]
+
+    if len(addresses) > MAX_BATCH_GEOCODE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_GEOCODE} addresses per batch")
+
+    def stream():
+        started = time.time()
+        unique = len(dedupe_addresses(addresses))
+        resolved = 0
+        for _, indices, outcome in iter_geocode_as_completed(addresses, geocode_address_with_source,
+                                                             max_workers=GEOCODE_MAX_WORKERS):
+            resolved += outcome.ok
+            line = {
+                "type": "result",
+                "indices": indices,
+                "address": outcome.address,
+                "coordinates": list(outcome.coords) if outcome.coords else None,
+                "source": outcome.source,
+                "error": outcome.error,
+            }
+            yield json.dumps(line) + "\n"
+        summary = {
+            "type": "summary",
+            "total": len(addresses),
+            "unique": unique,
+            "resolved": resolved,
+            "failed": unique - resolved,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        }
+        logger.info(f"📦 Batch geocode: {summary}")
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.post("/plan-full-route", response_model=PlannedRouteResponse)
-def plan_full_route(req: PlanRouteRequest):
+async def plan_full_route(req: PlanRouteRequest):
+    """Plan a route on the event loop.
+
+    Upstream calls are awaited rather than holding a threadpool thread, so
+    one worker can keep hundreds of plans in flight. Stages that do not
+    depend on each other (the matrix and directions for a fixed stop order,
+    debug reverse probes) run concurrently.
+    """
     # 1) Geocode all addresses
     addresses = req.addresses
     if not addresses or len(addresses) < 1:
-        return {
-            "ordered_addresses": [],
-            "ordered_coordinates": [],
-            "ors_duration_minutes": 0.0,
-            "total_distance_km": 0.0,
-            "num_stops": 0,
-            "predicted_eta_minutes": None,
-            "route_geometry_geojson": None
-        }
-
-    coords: List[Tuple[float, float]] = []
-    for addr in addresses:
-        c = geocode_address(addr)
-        if c is None:
-            return {
-                "ordered_addresses": [],
-                "ordered_coordinates": [],
-                "ors_duration_minutes": 0.0,
-                "total_distance_km": 0.0,
-                "num_stops": 0,
-                "predicted_eta_minutes": None,
-                "route_geometry_geojson": None
-            }
-        coords.append(c)
+        return _empty_plan_response()
+    windowed = req.time_windows is not None or req.service_minutes is not None
+    start_dt = _plan_start_datetime(req.start_time, strict=windowed)
+    if windowed:
+        # Reject malformed windows before spending geocoding/matrix calls
+        stop_windows = _stop_windows(req, start_dt)
+
+    # Geocode all stops concurrently; latency tracks the slowest address
+    outcomes = await geocode_concurrently_async(addresses, geocode_address_with_source_async,
+                                                max_concurrency=GEOCODE_MAX_CONCURRENCY)
+    failures = [o for o in outcomes if not o.ok]
+    if failures:
+        for o in failures:
+            logger.warning(f"❌ Could not geocode stop {o.index}: '{o.address}' ({o.source})")
+        return _empty_plan_response(failed_addresses=[o.to_dict() for o in failures])
+    coords: List[Tuple[float, float]] = [o.coords for o in outcomes]
 
     # Find the start index (current location should be first)
     start_index = 0
@@ -1106,58 +1838,75 @@ def plan_full_route(req: PlanRouteRequest):
     # 2) Build ordering using ORS matrix (nearest neighbor heuristic)
     # Prefer in-code key; fallback to environment
     ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
-    if not ors_key:
+    if not ors_key and road_graph is None:
         logger.warning("ORS_API_KEY not set; route planning will fail")
-        return {
-            "ordered_addresses": [],
-            "ordered_coordinates": [],
-            "ors_duration_minutes": 0.0,
-            "total_distance_km": 0.0,
-            "num_stops": 0,
-            "predicted_eta_minutes": None,
-            "route_geometry_geojson": None
-        }
-
-    matrix = ors_matrix(ors_key, coords)
-    if matrix is None or "distances" not in matrix:
-        return {
-            "ordered_addresses": [],
-            "ordered_coordinates": [],
-            "ors_duration_minutes": 0.0,
-            "total_distance_km": 0.0,
-            "num_stops": 0,
-            "predicted_eta_minutes": None,
-            "route_geometry_geojson": None
-        }
+        return _empty_plan_response()
 
     # For delivery routes, use original order (no optimization)
     # This ensures we visit stops in the order they were added
-    if start_index == 0:
-        # Sequential delivery order: Current → Stop 1 → Stop 2 → Stop 3
+    stop_schedule = infeasible_stops = None
+    end_index = None
+    if start_index == 0 and not windowed:
+        # The order is known up front, so directions need not wait for the matrix
         order_idx = list(range(len(addresses)))
-        ordered_addresses = addresses.copy()
-        ordered_coords = coords.copy()
-        logger.info(f"📍 Using sequential delivery order (no optimization):")
-        logger.info(f"  Order: {order_idx}")
-        logger.info(f"  Addresses: {ordered_addresses}")
-        logger.info(f"  Coordinates: {ordered_coords}")
+        optimizer_info = None
+        if len(addresses) >= 2:
+            matrix, directions = await asyncio.gather(_plan_matrix(ors_key, coords),
+                                                      ors_directions_async(ors_key, coords))
+        else:
+            matrix, directions = await _plan_matrix(ors_key, coords), None
+        if matrix is None or "distances" not in matrix:
+            return _empty_plan_response()
     else:
-        # Use matrix-based optimization for other cases
+        matrix = await _plan_matrix(ors_key, coords)
+        if matrix is None or "distances" not in matrix:
+            return _empty_plan_response()
         matrix_dist = matrix.get("durations") or matrix.get("distances")
-        order_idx = build_best_order_multistart(matrix_dist, start_index)
-        ordered_addresses = [addresses[i] for i in order_idx]
-        ordered_coords = [coords[i] for i in order_idx]
-        logger.info(f"📍 Using matrix-based optimization:")
-        logger.info(f"  Original order: {list(range(len(addresses)))}")
-        logger.info(f"  Optimized order: {order_idx}")
-        logger.info(f"  Addresses: {ordered_addresses}")
-        logger.info(f"  Coordinates: {ordered_coords}")
+        if req.vehicle_end_address and req.vehicle_end_address in addresses:
+            end_index = addresses.index(req.vehicle_end_address)
+        # CPU-bound; keep it off the event loop
+        workers = OPTIMIZER_WORKERS if len(coords) >= OPTIMIZER_PARALLEL_MIN_STOPS else 1
+        time_dependent = OPTIMIZER_TIME_DEPENDENT if req.time_dependent is None else req.time_dependent
+        if windowed:
+            order_idx, optimizer_info, stop_schedule, infeasible_stops = await _order_with_time_windows(
+                req, matrix, coords, stop_windows, start_dt, start_index, end_index)
+        elif req.instant:
+            optimized = instant_order(matrix_dist, coords, start_index, end_index)
+            order_idx = optimized.order
+            optimizer_info = optimized.to_dict()
+        elif len(coords) >= DECOMPOSE_MIN_STOPS:
+            optimized = await asyncio.to_thread(decompose_order, matrix_dist, coords, start_index, end_index,
+                                                OPTIMIZER_TIME_BUDGET_SECONDS, workers)
+            order_idx = optimized.order
+            optimizer_info = optimized.to_dict()
+        elif time_dependent:
+            optimized = await asyncio.to_thread(_order_time_dependent, matrix, coords, start_dt, start_index,
+                                                end_index, workers)
+            order_idx = optimized.order
+            optimizer_info = optimized.to_dict()
+        else:
+            optimized = await asyncio.to_thread(build_best_order, matrix_dist, start_index,
+                                                OPTIMIZER_TIME_BUDGET_SECONDS, workers, end_index)
+            order_idx = optimized.order
+            optimizer_info = optimized.to_dict()
+        directions = None
+    return await _plan_response(req, ors_key, addresses, coords, matrix, order_idx, optimizer_info, start_dt,
+                                end_index, directions, stop_schedule, infeasible_stops)
+
+async def _plan_response(req: PlanRouteRequest, ors_key: str, addresses: List[str], coords: List[Tuple[float, float]],
+                         matrix: Dict[str, Any], order_idx: List[int], optimizer_info: Optional[Dict[str, Any]],
+                         start_dt: datetime, end_index: Optional[int], directions: Optional[Dict[str, Any]] = None,
+                         stop_schedule: Optional[List[Dict[str, Any]]] = None,
+                         infeasible_stops: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Legs, duration, ETA and a route session for a chosen stop order (directions if already fetched)."""
+    ordered_addresses, ordered_coords = _log_stop_order(addresses, coords, order_idx, optimizer_info is not None)
 
     # 3) Calculate proper multi-stop route duration
     num_stops = len(ordered_addresses)
-    total_distance_km = 0.0
     ors_duration_minutes = 0.0
+    total_distance_km = 0.0
     route_geojson = None
+    route_id = None
     
     # Calculate total duration by summing individual segments
     logger.info(f"🚚 Calculating linear delivery route:")
@@ -1166,102 +1915,433 @@ def plan_full_route(req: PlanRouteRequest):
     logger.info(f"  Final destination: {ordered_addresses[-1] if ordered_addresses else 'None'}")
     
     if num_stops >= 2:
-        # Calculate duration for each segment in the optimized route
-        total_segment_duration = 0.0
-        total_segment_distance = 0.0
-        
-        for i in range(num_stops - 1):
-            start_coord = ordered_coords[i]
-            end_coord = ordered_coords[i + 1]
-            
-            # Get directions for this segment
-            segment_directions = ors_directions(ors_key, [start_coord, end_coord])
-            
-            if segment_directions and "features" in segment_directions and len(segment_directions["features"]) > 0:
-                feat = segment_directions["features"][0]
-                summary = feat.get("properties", {}).get("summary", {})
-                segment_distance = float(summary.get("distance", 0.0))
-                segment_duration = float(summary.get("duration", 0.0)) / 60.0  # Convert to minutes
-                
-                # Apply more accurate traffic multiplier based on location and time
-                # Get the midpoint of the segment for traffic calculation
-                mid_lat = (start_coord[0] + end_coord[0]) / 2
-                mid_lon = (start_coord[1] + end_coord[1]) / 2
-                
-                # Try to get real-time traffic data first
-                real_time_traffic = get_real_time_traffic_data(mid_lat, mid_lon)
-                if real_time_traffic:
-                    # Use real-time traffic data if available
-                    traffic_multiplier = real_time_traffic.get('multiplier', 1.8)
-                    logger.info(f"    Using real-time traffic multiplier: {traffic_multiplier:.2f}")
-                else:
-                    # Use improved traffic calculation
-                    traffic_multiplier = get_traffic_multiplier(mid_lat, mid_lon)
-                    
-                    # Additional adjustment based on distance (longer routes have more variability)
-                    if segment_distance > 10:  # Long distance
-                        traffic_multiplier *= 1.1
-                    elif segment_distance < 2:  # Short distance
-                        traffic_multiplier *= 0.9
-                
-                # Apply traffic multiplier with some smoothing
-                segment_duration *= traffic_multiplier
-                
-                # Add small buffer for real-world conditions (parking, traffic lights, etc.)
-                segment_duration += 1.0  # 1 minute buffer per segment
-                
-                total_segment_duration += segment_duration
-                total_segment_distance += segment_distance
-                
-                raw_duration = segment_duration / traffic_multiplier
-                logger.info(f"  Segment {i+1}: {ordered_addresses[i]} → {ordered_addresses[i+1]}")
-                logger.info(f"    Coordinates: {start_coord} → {end_coord}")
-                logger.info(f"    Distance: {segment_distance:.2f} km")
-                logger.info(f"    Raw ORS duration: {raw_duration:.2f} min")
-                logger.info(f"    Adjusted duration: {segment_duration:.2f} min (×{traffic_multiplier})")
-                
-                # Debug: Also test the reverse direction to see if there's a difference
-                reverse_directions = ors_directions(ors_key, [end_coord, start_coord])
-                if reverse_directions and "features" in reverse_directions and len(reverse_directions["features"]) > 0:
-                    reverse_feat = reverse_directions["features"][0]
-                    reverse_summary = reverse_feat.get("properties", {}).get("summary", {})
-                    reverse_duration = float(reverse_summary.get("duration", 0.0)) / 60.0
-                    logger.info(f"    Reverse duration: {reverse_duration:.2f} min (difference: {abs(segment_duration - reverse_duration):.2f} min)")
-            else:
-                logger.warning(f"  Failed to get directions for segment {i+1}")
-        
-        # Add delivery time at each stop (except the last one)
-        delivery_time_per_stop = 3.0  # 3 minutes per stop for delivery (more realistic)
-        total_delivery_time = (num_stops - 1) * delivery_time_per_stop
-        
-        # This is a linear delivery route (not round trip)
-        # Route: Current → Stop A → Stop B → Stop C (final destination)
-        # No return journey calculation needed
-        
-        ors_duration_minutes = total_segment_duration + total_delivery_time
-        
-        logger.info(f"  Total driving time: {total_segment_duration:.2f} min")
-        logger.info(f"  Total delivery time: {total_delivery_time:.2f} min")
-        logger.info(f"  Total route time: {ors_duration_minutes:.2f} min")
-        logger.info(f"  Total distance: {total_distance_km:.2f} km")
-        
-        # Debug: Compare with Google Maps expectations
-        logger.info(f"🔍 Route Analysis:")
-        logger.info(f"  Expected Google Maps: Current→GAT (8min) + GAT→BMS (24min) = 32min")
-        logger.info(f"  Our calculation: {ors_duration_minutes:.2f} min")
-        logger.info(f"  Difference: {ors_duration_minutes - 32:.2f} min")
-        
-        # Get the full route geometry for display (from start to end)
-        directions = ors_directions(ors_key, ordered_coords)
-        if directions and "features" in directions and len(directions["features"]) > 0:
-            route_geojson = directions["features"][0]
+        # One multi-waypoint directions call gives the geometry and every leg
+        if directions is None:
+            directions = await ors_directions_async(ors_key, ordered_coords)
+        legs, route_geojson = route_legs(directions, ordered_coords, order_idx, matrix)
+        reverse_durations = None
+        if req.debug:
+            # Debug: Also test the reverse direction of every leg to see if there's a difference
+            probed = [i for i, leg in enumerate(legs) if leg is not None]
+            found = await asyncio.gather(*(_reverse_leg_duration(ors_key, ordered_coords[i + 1], ordered_coords[i])
+                                           for i in probed))
+            reverse_durations = dict(zip(probed, found))
+        ors_duration_minutes, total_distance_km = _summarize_legs(ordered_addresses, ordered_coords, legs,
+                                                                  reverse_durations, start_dt)
+        
+        if req.debug:
+            # Debug: Compare with Google Maps expectations
+            logger.info(f"🔍 Route Analysis:")
+            logger.info(f"  Expected Google Maps: Current→GAT (8min) + GAT→BMS (24min) = 32min")
+            logger.info(f"  Our calculation: {ors_duration_minutes:.2f} min")
+            logger.info(f"  Difference: {ors_duration_minutes - 32:.2f} min")
+
+        # Keep the route editable without re-planning it
+        session = route_sessions.create(addresses=list(addresses), coords=list(coords), order=list(order_idx),
+                                        travel=_travel_minutes(matrix), fixed_end=end_index is not None,
+                                        distances=_session_distances(matrix), start_time=req.start_time)
+        _store_session_legs(session, order_idx, legs, _leg_geometries(directions, len(legs)))
+        route_id = session.route_id
     else:
         logger.warning("Need at least 2 stops for route calculation")
 
-    # 4) Predict ETA using our ML model (if loaded)
+    # 4) Predict ETA using our ML model (if loaded); pandas/XGBoost work stays off the event loop
+    predicted_eta = await asyncio.to_thread(_predict_eta, ors_duration_minutes, total_distance_km, num_stops,
+                                            req.start_time)
+
+    return {
+        "ordered_addresses": ordered_addresses,
+        "ordered_coordinates": ordered_coords,
+        "ors_duration_minutes": round(ors_duration_minutes, 2),
+        "total_distance_km": round(total_distance_km, 3),
+        "num_stops": num_stops,
+        "predicted_eta_minutes": round(predicted_eta, 2) if predicted_eta is not None else None,
+        "route_geometry_geojson": route_geojson,
+        "optimizer": optimizer_info,
+        "stop_schedule": stop_schedule,
+        "infeasible_stops": infeasible_stops,
+        "route_id": route_id,
+    }
+
+@app.post("/plan-full-route/stream")
+async def plan_full_route_stream(req: PlanRouteRequest):
+    """Plan a route as server-sent events, so drivers need not wait for the best order.
+
+    "initial" carries the nearest neighbor order as soon as the matrix is
+    in, and "improvement" each order local search finds since that
+    shortens the projected duration (at most one every
+    STREAM_UPDATE_INTERVAL_SECONDS); both have ETAs projected from the
+    matrix, and "cost" is that projected duration in minutes. "final" is the /plan-full-route response for
+    the best order once OPTIMIZER_TIME_BUDGET_SECONDS runs out, or for the
+    best order streamed so far if the search fails ("error" if there was
+    none). Start and end rules are those of /plan-full-route; time windows
+    are not streamed.
+    """
+    if req.time_windows is not None or req.service_minutes is not None:
+        raise HTTPException(status_code=400, detail="Time-window plans are not streamed; use /plan-full-route")
+    start_dt = _plan_start_datetime(req.start_time, strict=False)
+
+    async def events():
+        started = time.monotonic()
+        addresses = req.addresses
+        if not addresses:
+            yield _sse("final", _empty_plan_response())
+            return
+        outcomes = await geocode_concurrently_async(addresses, geocode_address_with_source_async,
+                                                    max_concurrency=GEOCODE_MAX_CONCURRENCY)
+        failures = [o for o in outcomes if not o.ok]
+        if failures:
+            yield _sse("final", _empty_plan_response(failed_addresses=[o.to_dict() for o in failures]))
+            return
+        coords: List[Tuple[float, float]] = [o.coords for o in outcomes]
+        start_index = 0
+        if req.vehicle_start_address and req.vehicle_start_address in addresses:
+            start_index = addresses.index(req.vehicle_start_address)
+        ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
+        matrix = await _plan_matrix(ors_key, coords) if ors_key or road_graph is not None else None
+        if matrix is None or "distances" not in matrix:
+            yield _sse("final", _empty_plan_response())
+            return
+        if start_index == 0:
+            # Sequential delivery order, as in /plan-full-route: nothing to improve
+            plan = await _plan_response(req, ors_key, addresses, coords, matrix, list(range(len(addresses))),
+                                        None, start_dt, None)
+            yield _sse("final", plan)
+            return
+
+        end_index = None
+        if req.vehicle_end_address and req.vehicle_end_address in addresses:
+            end_index = addresses.index(req.vehicle_end_address)
+        td_costs = _time_dependent_costs(matrix, coords, start_dt)
+        loop = asyncio.get_running_loop()
+        found: asyncio.Queue = asyncio.Queue()
+        # Set once the client has gone away, so the search stops instead of using its whole budget
+        cancelled = threading.Event()
+        # The search runs on start-hour leg minutes; every order it finds is re-priced by projected
+        # duration, and only orders that shorten it are streamed, so "cost" never goes up
+        projected = {"best": np.inf, "first": None}
+
+        def on_improvement(order: List[int], cost: float) -> None:
+            duration = td_costs.duration(order)
+            if projected["first"] is None:
+                projected["first"] = duration
+            if duration < projected["best"] and not cancelled.is_set():
+                projected["best"] = duration
+                loop.call_soon_threadsafe(found.put_nowait, (order, duration))
+
+        # CPU-bound; keep it off the event loop
+        search = asyncio.ensure_future(asyncio.to_thread(
+            anytime_search, td_costs.matrix(td_costs.bucket(0)), start_index, end_index,
+            OPTIMIZER_TIME_BUDGET_SECONDS, on_improvement, cancelled))
+        event, updates = "initial", 0
+        best: Optional[Tuple[List[int], float]] = None
+        try:
+            while True:
+                waiter = asyncio.ensure_future(found.get())
+                await asyncio.wait({waiter, search}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    break
+                best = waiter.result()
+                while not found.empty():
+                    # Only the latest order is worth sending
+                    best = found.get_nowait()
+                order, cost = best
+                update = await asyncio.to_thread(_order_update, addresses, coords, matrix, td_costs, order, cost,
+                                                 start_dt, req.start_time, started)
+                yield _sse(event, update)
+                event, updates = "improvement", updates + 1
+                await asyncio.sleep(STREAM_UPDATE_INTERVAL_SECONDS)
+            try:
+                result = await search
+                order, cost = result.order, td_costs.duration(result.order)
+                if best is not None and best[1] < cost:
+                    order, cost = best
+                nn_cost = projected["first"] if projected["first"] is not None else cost
+                optimizer_info = OrderResult(order, cost, "anytime", False, nn_cost,
+                                             100.0 * (nn_cost - cost) / cost if cost > 0 else 0.0).to_dict()
+                logger.info(f"📡 Streamed {updates} order(s) in {time.monotonic() - started:.2f}s; projected "
+                            f"{cost:.1f} min (nearest neighbor {nn_cost:.1f})")
+            except Exception as e:
+                while not found.empty():
+                    best = found.get_nowait()
+                logger.warning(f"⚠️ Streamed search failed after {updates} order(s): {e}")
+                if best is None:
+                    yield _sse("error", {"detail": "Route optimization failed"})
+                    return
+                order, optimizer_info = best[0], {"method": "anytime", "cost": round(best[1], 2),
+                                                  "error": "search failed; best order found so far"}
+            plan = await _plan_response(req, ors_key, addresses, coords, matrix, order, optimizer_info,
+                                        start_dt, end_index)
+            plan["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+            yield _sse("final", plan)
+        finally:
+            cancelled.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """One server-sent event; the data repeats the event name as "type"."""
+    return f"event: {event}\ndata: {json.dumps({'type': event, **data})}\n\n"
+
+def _order_update(addresses: List[str], coords: List[Tuple[float, float]], matrix: Dict[str, Any],
+                  td_costs: TimeDependentCosts, order: List[int], cost: float, start_dt: datetime,
+                  start_time: Optional[str], started: float) -> Dict[str, Any]:
+    """A streamed order with ETAs projected from the matrix (no directions call)."""
+    minutes = td_costs.departures(order)
+    idx = np.asarray(order)
+    legs_km = as_cost_array(matrix["distances"])[idx[:-1], idx[1:]]
+    total_km = float(legs_km[np.isfinite(legs_km)].sum())
+    predicted_eta = _predict_eta(minutes[-1], total_km, len(order), start_time)
+    return {
+        "ordered_addresses": [addresses[i] for i in order],
+        "ordered_coordinates": [coords[i] for i in order],
+        "cost": round(cost, 2),
+        "projected_duration_minutes": round(minutes[-1], 2),
+        "total_distance_km": round(total_km, 3),
+        "predicted_eta_minutes": round(predicted_eta, 2) if predicted_eta is not None else None,
+        "stop_etas": [(start_dt + timedelta(minutes=m)).isoformat(timespec="minutes") for m in minutes],
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+
+def _plan_start_datetime(start_time: Optional[str], strict: bool = True) -> datetime:
+    """Planned departure; an unparseable start_time is a 400 when strict, else now."""
+    if start_time:
+        try:
+            return datetime.fromisoformat(start_time)
+        except ValueError:
+            if strict:
+                raise HTTPException(status_code=400, detail=f"Invalid start_time: {start_time}")
+            logger.warning(f"⚠️ Invalid start_time '{start_time}'; planning from now")
+    return datetime.now()
+
+def _travel_minutes(matrix: Dict[str, Any]) -> np.ndarray:
+    """Matrix travel times in minutes (from km at city driving speed if there are no durations)."""
+    if "durations" in matrix:
+        return as_cost_array(matrix["durations"]) / 60.0
+    return as_cost_array(matrix["distances"]) / 25.0 * 60.0
+
+def _time_dependent_costs(matrix: Dict[str, Any], coords: List[Tuple[float, float]], start_dt: datetime,
+                          leg_overhead: float = SEGMENT_BUFFER_MINUTES + DELIVERY_MINUTES_PER_STOP
+                          ) -> TimeDependentCosts:
+    """Leg minutes by departure hour, as _summarize_legs projects them (traffic, buffer and, by default,
+    stop time)."""
+    base = _travel_minutes(matrix)
+    if "distances" in matrix:
+        base = base * np.vectorize(_leg_distance_factor, otypes=[float])(as_cost_array(matrix["distances"]))
+    return TimeDependentCosts(base, hourly_traffic_profile(coords),
+                              start_dt.hour * 60 + start_dt.minute + start_dt.second / 60.0,
+                              leg_overhead)
+
+def _order_time_dependent(matrix: Dict[str, Any], coords: List[Tuple[float, float]], start_dt: datetime,
+                          start_index: int, end_index: Optional[int], workers: int) -> OrderResult:
+    """Stop order by projected duration, pricing every leg like _summarize_legs at the hour it starts."""
+    costs = _time_dependent_costs(matrix, coords, start_dt)
+    result = optimize_time_dependent(costs, start_index, end_index, OPTIMIZER_TIME_BUDGET_SECONDS, workers)
+    logger.info(f"📍 Using time-dependent order from {start_dt.strftime('%H:%M')}: {result.order}")
+    logger.info(f"  Projected {result.cost:.1f} min; the time-independent order would take "
+                f"{result.heuristic_cost:.1f} min")
+    return result
+
+def _window_minutes(value: str, start_dt: datetime) -> float:
+    """Minutes from start_dt to value ("HH:MM" on the start day, or ISO8601)."""
+    try:
+        if len(value) <= 5 and ":" in value:
+            hour, minute = (int(part) for part in value.split(":"))
+            moment = start_dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        else:
+            moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time window bound: {value}")
+    # Compare naive and aware times in server-local time
+    if moment.tzinfo is not None and start_dt.tzinfo is None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    elif moment.tzinfo is None and start_dt.tzinfo is not None:
+        moment = moment.replace(tzinfo=start_dt.tzinfo)
+    return (moment - start_dt).total_seconds() / 60.0
+
+def _stop_windows(req: PlanRouteRequest, start_dt: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-address (earliest, latest, service) in minutes after the route start; 400 on bad input."""
+    n = len(req.addresses)
+    for name, values in (("time_windows", req.time_windows), ("service_minutes", req.service_minutes)):
+        if values is not None and len(values) != n:
+            raise HTTPException(status_code=400, detail=f"{name} must have one entry per address ({n})")
+    earliest = np.full(n, -np.inf)
+    latest = np.full(n, np.inf)
+    for i, window in enumerate(req.time_windows or []):
+        if window is None:
+            continue
+        if window.earliest:
+            earliest[i] = _window_minutes(window.earliest, start_dt)
+        if window.latest:
+            latest[i] = _window_minutes(window.latest, start_dt)
+        if earliest[i] > latest[i]:
+            raise HTTPException(status_code=400, detail=f"Time window for stop {i} ends before it starts")
+    service = np.zeros(n)
+    if req.service_minutes is not None:
+        service = np.maximum(np.asarray(req.service_minutes, dtype=float), 0.0)
+    return earliest, latest, service
+
+async def _order_with_time_windows(req: PlanRouteRequest, matrix: Dict[str, Any], coords: List[Tuple[float, float]],
+                                   stop_windows: Tuple[np.ndarray, np.ndarray, np.ndarray], start_dt: datetime,
+                                   start_index: int, end_index: Optional[int]
+                                   ) -> Tuple[List[int], Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Stop order honouring delivery windows, with the per-stop schedule and any stops that miss theirs.
+
+    Legs are priced like the reported route duration (traffic at the hour
+    they start in, distance factor, segment buffer); without service_minutes
+    every stop but the start takes DELIVERY_MINUTES_PER_STOP.
+    """
+    earliest, latest, service = stop_windows
+    if req.service_minutes is None:
+        service = np.full(len(coords), DELIVERY_MINUTES_PER_STOP)
+        service[start_index] = 0.0
+    travel = _time_dependent_costs(matrix, coords, start_dt, leg_overhead=SEGMENT_BUFFER_MINUTES)
+    started = time.time()
+    schedule = await asyncio.to_thread(solve_time_windows, travel, earliest, latest, service,
+                                       start_index, end_index, OPTIMIZER_TIME_BUDGET_SECONDS)
+    stop_schedule = []
+    for row in schedule_report(schedule):
+        row["address"] = req.addresses[row["index"]]
+        row["arrival_time"] = (start_dt + timedelta(minutes=row["arrival_minutes"])).isoformat()
+        stop_schedule.append(row)
+    windows = req.time_windows or [None] * len(req.addresses)
+    infeasible_stops = [{
+        "index": row["index"],
+        "address": row["address"],
+        "window": windows[row["index"]].dict() if windows[row["index"]] else None,
+        "arrival_time": row["arrival_time"],
+        "late_minutes": row["late_minutes"],
+    } for row in stop_schedule if not row["feasible"]]
+    optimizer_info = {
+        "method": "time_windows",
+        "cost": round(schedule.completion, 2),
+        "total_late_minutes": round(schedule.total_late, 2),
+        "feasible": not infeasible_stops,
+        "elapsed_ms": round((time.time() - started) * 1000, 1),
+    }
+    if infeasible_stops:
+        logger.warning(f"⏰ {len(infeasible_stops)} stop(s) cannot be reached inside their window "
+                       f"({schedule.total_late:.1f} min late in total)")
+    return schedule.order, optimizer_info, stop_schedule, infeasible_stops
+
+async def _plan_matrix(ors_key: str, coords: List[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+    """Matrix used to order stops, per MATRIX_MODE (see approximate_matrix)."""
+    if MATRIX_MODE == "approx":
+        return approximate_matrix(coords)
+    sparse = MATRIX_MODE == "sparse" or 0 < MATRIX_SPARSE_MIN_STOPS <= len(coords)
+    fetch = ors_sparse_matrix_async(ors_key, coords, MATRIX_SPARSE_K) if sparse else ors_matrix_async(ors_key, coords)
+    timeout = _matrix_timeout(len(coords), sparse)
+    try:
+        matrix = await asyncio.wait_for(fetch, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ ORS matrix took longer than {timeout:.1f}s")
+        matrix = None
+    if matrix is None or "distances" not in matrix:
+        logger.warning("⚠️ ORS matrix unavailable; ordering stops on the approximate matrix")
+        return approximate_matrix(coords)
+    return matrix
+
+def _matrix_timeout(n: int, sparse: bool) -> float:
+    """ORS_MATRIX_TIMEOUT_SECONDS plus the rate limiter's spacing of a cold-cache fetch for n stops."""
+    if ors_matrix_limiter.rate_per_sec <= 0:
+        return ORS_MATRIX_TIMEOUT_SECONDS
+    # Sparse requests hold about 2k candidates per stop, overfetched at most MAX_OVERFETCH times
+    cells = n * min(n, int(2 * MATRIX_SPARSE_K * MAX_OVERFETCH)) if sparse else n * n
+    tiles = -(-cells // max(1, ORS_MATRIX_MAX_ELEMENTS))
+    return ORS_MATRIX_TIMEOUT_SECONDS + max(0, tiles - ors_matrix_limiter.burst) / ors_matrix_limiter.rate_per_sec
+
+def _log_stop_order(addresses: List[str], coords: List[Tuple[float, float]], order_idx: List[int],
+                    optimized: bool) -> Tuple[List[str], List[Tuple[float, float]]]:
+    ordered_addresses = [addresses[i] for i in order_idx]
+    ordered_coords = [coords[i] for i in order_idx]
+    if not optimized:
+        # Sequential delivery order: Current → Stop 1 → Stop 2 → Stop 3
+        logger.info(f"📍 Using sequential delivery order (no optimization):")
+        logger.info(f"  Order: {order_idx}")
+    else:
+        # Use matrix-based optimization for other cases
+        logger.info(f"📍 Using matrix-based optimization:")
+        logger.info(f"  Original order: {list(range(len(addresses)))}")
+        logger.info(f"  Optimized order: {order_idx}")
+    logger.info(f"  Addresses: {ordered_addresses}")
+    logger.info(f"  Coordinates: {ordered_coords}")
+    return ordered_addresses, ordered_coords
+
+async def _reverse_leg_duration(ors_key: str, start_coord: Tuple[float, float],
+                                end_coord: Tuple[float, float]) -> Optional[float]:
+    reverse_directions = await ors_directions_async(ors_key, [start_coord, end_coord])
+    if reverse_directions and "features" in reverse_directions and len(reverse_directions["features"]) > 0:
+        reverse_feat = reverse_directions["features"][0]
+        reverse_summary = reverse_feat.get("properties", {}).get("summary", {})
+        return float(reverse_summary.get("duration", 0.0)) / 60.0
+    return None
+
+def _summarize_legs(ordered_addresses: List[str], ordered_coords: List[Tuple[float, float]],
+                    legs: List[Optional[Tuple[float, float]]],
+                    reverse_durations: Optional[Dict[int, Optional[float]]] = None,
+                    start_dt: Optional[datetime] = None) -> Tuple[float, float]:
+    """(route minutes incl. traffic, buffers and delivery stops, distance km) for a linear route.
+
+    Each leg's traffic multiplier uses the hour it is projected to start in
+    when the route leaves at start_dt (the current hour if omitted).
+    """
+    num_stops = len(ordered_addresses)
+    total_segment_duration = 0.0
+    total_segment_distance = 0.0
+    
+    for i, leg in enumerate(legs):
+        start_coord = ordered_coords[i]
+        end_coord = ordered_coords[i + 1]
+        if leg is None:
+            logger.warning(f"  Failed to get directions for segment {i+1}")
+            continue
+        segment_distance, raw_duration = leg
+        hour = None
+        if start_dt is not None:
+            elapsed = total_segment_duration + i * DELIVERY_MINUTES_PER_STOP
+            hour = (start_dt + timedelta(minutes=elapsed)).hour
+        traffic_multiplier = segment_traffic_multiplier(start_coord, end_coord, segment_distance, hour)
+        
+        # Apply traffic multiplier with some smoothing
+        segment_duration = raw_duration * traffic_multiplier
+        
+        # Add small buffer for real-world conditions (parking, traffic lights, etc.)
+        segment_duration += SEGMENT_BUFFER_MINUTES
+        
+        total_segment_duration += segment_duration
+        total_segment_distance += segment_distance
+        
+        logger.info(f"  Segment {i+1}: {ordered_addresses[i]} → {ordered_addresses[i+1]}")
+        logger.info(f"    Coordinates: {start_coord} → {end_coord}")
+        logger.info(f"    Distance: {segment_distance:.2f} km")
+        logger.info(f"    Raw ORS duration: {raw_duration:.2f} min")
+        logger.info(f"    Adjusted duration: {segment_duration:.2f} min (×{traffic_multiplier})")
+        reverse_duration = (reverse_durations or {}).get(i)
+        if reverse_duration is not None:
+            logger.info(f"    Reverse duration: {reverse_duration:.2f} min (difference: {abs(segment_duration - reverse_duration):.2f} min)")
+    
+    # Add delivery time at each stop (except the last one)
+    total_delivery_time = (num_stops - 1) * DELIVERY_MINUTES_PER_STOP
+    
+    # This is a linear delivery route (not round trip)
+    # Route: Current → Stop A → Stop B → Stop C (final destination)
+    # No return journey calculation needed
+    
+    ors_duration_minutes = total_segment_duration + total_delivery_time
+    
+    logger.info(f"  Total driving time: {total_segment_duration:.2f} min")
+    logger.info(f"  Total delivery time: {total_delivery_time:.2f} min")
+    logger.info(f"  Total route time: {ors_duration_minutes:.2f} min")
+    logger.info(f"  Total distance: {total_segment_distance:.2f} km")
+    return ors_duration_minutes, total_segment_distance
+
+def _predict_eta(ors_duration_minutes: float, total_distance_km: float, num_stops: int,
+                 start_time: Optional[str]) -> Optional[float]:
+    """ML ETA for a planned route, falling back to the ORS duration plus a traffic buffer."""
     predicted_eta = None
     try:
-        use_start_time = req.start_time or datetime.now().isoformat()
+        use_start_time = start_time or datetime.now().isoformat()
         if eta_model is not None and model_columns is not None:
             input_df = pd.DataFrame([{
                 "ors_duration_minutes": ors_duration_minutes,
@@ -1301,13 +2381,269 @@ def plan_full_route(req: PlanRouteRequest):
         # Fallback to ORS duration with traffic buffer
         predicted_eta = ors_duration_minutes * 1.2  # 20% buffer for traffic
         logger.info(f"Using ORS-based fallback after error: {predicted_eta:.1f} min")
+    return predicted_eta
+
+def _leg_geometries(directions: Optional[Dict[str, Any]], num_legs: int) -> List[Optional[List[List[float]]]]:
+    """Per-leg [lon, lat] slices of a directions LineString, split at its way_points."""
+    try:
+        feature = directions["features"][0]
+        coordinates = feature["geometry"]["coordinates"]
+        way_points = feature["properties"]["way_points"]
+    except (KeyError, IndexError, TypeError):
+        return [None] * num_legs
+    if len(way_points) != num_legs + 1:
+        return [None] * num_legs
+    return [coordinates[a:b + 1] for a, b in zip(way_points, way_points[1:])]
+
+def _session_distances(matrix: Dict[str, Any]) -> Optional[np.ndarray]:
+    return as_cost_array(matrix["distances"]) if "distances" in matrix else None
+
+async def _new_stop_cells(ors_key: str, coords: List[Tuple[float, float]]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """(km, seconds) arrays whose last row and column hold the legs from and to the last point, else NaN.
+
+    Only those cells are read from the cell cache or fetched, so a session's
+    measured matrix is extended rather than rebuilt. None if ORS fails.
+    """
+    n = len(coords)
+    if MATRIX_MODE == "approx":
+        matrix = approximate_matrix(coords)
+    elif await asyncio.to_thread(_local_routing, coords):
+        matrix = await asyncio.to_thread(road_graph.matrix, coords)
+    else:
+        keys = matrix_cache.keys_for(coords)
+        distances = np.full((n, n), np.nan)
+        durations = np.full((n, n), np.nan)
+        row_km, row_s, row_known = await asyncio.to_thread(matrix_cache.lookup_block, keys[-1:], keys)
+        col_km, col_s, col_known = await asyncio.to_thread(matrix_cache.lookup_block, keys, keys[-1:])
+        distances[-1, :], durations[-1, :] = row_km[0], row_s[0]
+        distances[:, -1], durations[:, -1] = col_km[:, 0], col_s[:, 0]
+        blocks = [([n - 1], [j for j in range(n) if not row_known[0, j]]),
+                  ([i for i in range(n) if not col_known[i, 0]], [n - 1])]
+        blocks = tile_blocks([(src, dst) for src, dst in blocks if src and dst],
+                             ORS_MATRIX_MAX_LOCATIONS, ORS_MATRIX_MAX_ELEMENTS)
+        if await _fetch_matrix_tiles_async(ors_key, coords, keys, distances, durations, blocks):
+            return None
+        return distances, durations
+    if matrix is None or "durations" not in matrix:
+        return None
+    return as_cost_array(matrix["distances"]), as_cost_array(matrix["durations"])
 
+def _grow_matrix(matrix: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """matrix with one more point, its row and column taken from the last row and column of cells."""
+    n = len(matrix)
+    cells = np.where(np.isnan(cells), np.inf, cells)
+    grown = np.empty((n + 1, n + 1))
+    grown[:n, :n] = matrix
+    grown[n, :] = cells[n, :]
+    grown[:, n] = cells[:, n]
+    grown[n, n] = 0.0
+    return grown
+
+def _store_session_legs(session: RouteSession, stops: List[int], legs: List[Optional[Tuple[float, float]]],
+                        geometries: List[Optional[List[List[float]]]]) -> None:
+    for (a, b), leg, geometry in zip(zip(stops, stops[1:]), legs, geometries):
+        session.legs[(a, b)] = leg
+        if geometry:
+            session.geometry[(a, b)] = geometry
+
+async def _fetch_session_legs(ors_key: str, session: RouteSession) -> int:
+    """Directions for the legs of the session's order not driven before, one call per stretch; returns the count."""
+    runs = session.missing_legs()
+    found = await asyncio.gather(*(ors_directions_async(ors_key, [session.coords[i] for i in run]) for run in runs))
+    for run, directions in zip(runs, found):
+        legs = directions_legs(directions) or []
+        if len(legs) != len(run) - 1:
+            # Same fallback as route_legs: the matrix values for each leg
+            legs = [None if session.distances is None
+                    else (float(session.distances[a, b]), float(session.travel[a, b]))
+                    for a, b in zip(run, run[1:])]
+        _store_session_legs(session, run, legs, _leg_geometries(directions, len(run) - 1))
+    return sum(len(run) - 1 for run in runs)
+
+def _session_plan(session: RouteSession, optimizer_info: Dict[str, Any]) -> Dict[str, Any]:
+    """The session's current route in the /plan-full-route response shape, from stored legs only."""
+    order = session.order
+    ordered_addresses = [session.addresses[i] for i in order]
+    ordered_coords = [session.coords[i] for i in order]
+    legs = [session.legs.get(leg) for leg in zip(order, order[1:])]
+    ors_duration_minutes, total_distance_km = _summarize_legs(
+        ordered_addresses, ordered_coords, legs, start_dt=_plan_start_datetime(session.start_time, strict=False))
+    predicted_eta = _predict_eta(ors_duration_minutes, total_distance_km, len(order), session.start_time)
+    # Stitch the stored leg geometries into one ORS-shaped feature
+    coordinates: List[List[float]] = []
+    way_points = [0]
+    segments = []
+    for (a, b), leg in zip(zip(order, order[1:]), legs):
+        points = session.geometry.get((a, b)) or [[session.coords[a][1], session.coords[a][0]],
+                                                  [session.coords[b][1], session.coords[b][0]]]
+        coordinates.extend(points if not coordinates else points[1:])
+        way_points.append(len(coordinates) - 1)
+        segments.append({"distance": leg[0] if leg else None, "duration": leg[1] * 60.0 if leg else None})
+    route_geojson = {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": coordinates},
+        "properties": {"segments": segments, "way_points": way_points},
+    } if len(order) >= 2 else None
     return {
         "ordered_addresses": ordered_addresses,
         "ordered_coordinates": ordered_coords,
         "ors_duration_minutes": round(ors_duration_minutes, 2),
         "total_distance_km": round(total_distance_km, 3),
-        "num_stops": num_stops,
+        "num_stops": len(order),
+        "predicted_eta_minutes": round(predicted_eta, 2) if predicted_eta is not None else None,
+        "route_geometry_geojson": route_geojson,
+        "optimizer": optimizer_info,
+        "route_id": session.route_id,
+    }
+
+@app.post("/routes/{route_id}/insert-stop", response_model=PlannedRouteResponse)
+async def insert_route_stop(route_id: str, req: RouteStopRequest):
+    """Add a stop to a planned route: cheapest insertion, then local improvement around it.
+
+    Only the new stop's matrix row and column (from the cell cache's point
+    of view) and directions for legs the route has not driven are fetched.
+    """
+    session = route_sessions.get(route_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Route not found or expired")
+    started = time.time()
+    async with session.lock:
+        if session.index_of(req.address) is not None:
+            raise HTTPException(status_code=409, detail="Stop is already on the route")
+        ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
+        if req.address in session.addresses:
+            # Dropped earlier: its matrix row and legs are still known
+            stop = session.addresses.index(req.address)
+        else:
+            coords, source = await geocode_address_with_source_async(req.address)
+            if coords is None:
+                raise HTTPException(status_code=422, detail=f"Could not geocode '{req.address}' ({source})")
+            cells = await _new_stop_cells(ors_key, session.coords + [coords])
+            if cells is None:
+                raise HTTPException(status_code=502, detail=f"Could not get travel times for '{req.address}'")
+            distances, durations = cells
+            session.addresses.append(req.address)
+            session.coords.append(coords)
+            session.travel = _grow_matrix(session.travel, durations / 60.0)
+            if session.distances is not None:
+                session.distances = _grow_matrix(session.distances, distances)
+            route_sessions.resized(session)
+            stop = len(session.coords) - 1
+        order = await asyncio.to_thread(insert_stop, session, stop, ROUTE_SESSION_TIME_BUDGET_SECONDS)
+        session.order = order
+        refetched = await _fetch_session_legs(ors_key, session)
+        logger.info(f"➕ Route {route_id}: inserted '{req.address}' at position {order.index(stop)}, "
+                    f"{refetched} leg(s) fetched")
+        return await asyncio.to_thread(_session_plan, session, {
+            "method": "cheapest_insertion",
+            "position": order.index(stop),
+            "refetched_legs": refetched,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        })
+
+@app.post("/routes/{route_id}/remove-stop", response_model=PlannedRouteResponse)
+async def remove_route_stop(route_id: str, req: RouteStopRequest):
+    """Drop a stop from a planned route and improve the route around the gap."""
+    session = route_sessions.get(route_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Route not found or expired")
+    started = time.time()
+    async with session.lock:
+        stop = session.index_of(req.address)
+        if stop is None:
+            raise HTTPException(status_code=404, detail="Stop is not on the route")
+        if stop == session.order[0] or (session.fixed_end and stop == session.order[-1]):
+            raise HTTPException(status_code=400, detail="The route's start and end cannot be removed")
+        ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
+        order = await asyncio.to_thread(remove_stop, session, stop, ROUTE_SESSION_TIME_BUDGET_SECONDS)
+        session.order = order
+        refetched = await _fetch_session_legs(ors_key, session)
+        logger.info(f"➖ Route {route_id}: removed '{req.address}', {refetched} leg(s) fetched")
+        return await asyncio.to_thread(_session_plan, session, {
+            "method": "removal",
+            "refetched_legs": refetched,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        })
+
+@app.post("/plan-fleet", response_model=PlannedFleetResponse)
+async def plan_fleet_routes(req: PlanFleetRequest):
+    """Split a pool of stops across vehicles within their capacities and plan every vehicle's route."""
+    vehicles = req.vehicles
+    if not vehicles:
+        raise HTTPException(status_code=400, detail="At least one vehicle is required")
+    if any(v.capacity < 0 for v in vehicles) or any(s.demand < 0 for s in req.stops):
+        raise HTTPException(status_code=400, detail="Capacities and demands must not be negative")
+
+    # Locations: vehicle starts, then vehicle ends, then stops
+    addresses = [v.start_address for v in vehicles]
+    ends: List[Optional[int]] = []
+    for v in vehicles:
+        ends.append(len(addresses) if v.end_address else None)
+        if v.end_address:
+            addresses.append(v.end_address)
+    first_stop = len(addresses)
+    addresses += [s.address for s in req.stops]
+
+    outcomes = await geocode_concurrently_async(addresses, geocode_address_with_source_async,
+                                                max_concurrency=GEOCODE_MAX_CONCURRENCY)
+    failures = [o for o in outcomes if not o.ok]
+    if failures:
+        for o in failures:
+            logger.warning(f"❌ Could not geocode fleet location {o.index}: '{o.address}' ({o.source})")
+        return {"routes": [], "unassigned_stops": [], "failed_addresses": [o.to_dict() for o in failures]}
+    coords: List[Tuple[float, float]] = [o.coords for o in outcomes]
+
+    ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
+    if not ors_key and road_graph is None:
+        logger.warning("ORS_API_KEY not set; fleet planning will fail")
+        return {"routes": [], "unassigned_stops": []}
+    matrix = await _plan_matrix(ors_key, coords)
+    matrix_dist = matrix.get("durations") or matrix.get("distances")
+
+    demands = [0.0] * first_stop + [s.demand for s in req.stops]
+    workers = OPTIMIZER_WORKERS if len(req.stops) >= OPTIMIZER_PARALLEL_MIN_STOPS else 1
+    # CPU-bound; keep it off the event loop
+    plan = await asyncio.to_thread(plan_fleet, matrix_dist, list(range(len(vehicles))), ends,
+                                   [v.capacity for v in vehicles], demands, range(first_stop, len(addresses)),
+                                   OPTIMIZER_TIME_BUDGET_SECONDS, workers)
+
+    # Every vehicle's directions, legs and ETA are independent
+    routes = await asyncio.gather(*(_fleet_route(ors_key, addresses, coords, matrix, route, req.start_time)
+                                    for route in plan.routes))
+    for v, route in enumerate(routes):
+        route.update({
+            "vehicle_id": vehicles[v].vehicle_id or str(v),
+            "load": round(plan.loads[v], 3),
+            "capacity": vehicles[v].capacity,
+            "optimizer_method": plan.methods[v],
+        })
+    unassigned = [{"index": i - first_stop, "address": addresses[i], "demand": demands[i]}
+                  for i in plan.unassigned]
+    if unassigned:
+        logger.warning(f"🚛 {len(unassigned)} stop(s) did not fit in any vehicle")
+    return {"routes": routes, "unassigned_stops": unassigned}
+
+async def _fleet_route(ors_key: str, addresses: List[str], coords: List[Tuple[float, float]],
+                       matrix: Dict[str, Any], route: List[int], start_time: Optional[str]) -> Dict[str, Any]:
+    """Directions, duration, distance and ML ETA for one vehicle's ordered route."""
+    ordered_addresses = [addresses[i] for i in route]
+    ordered_coords = [coords[i] for i in route]
+    ors_duration_minutes = total_distance_km = 0.0
+    route_geojson = None
+    predicted_eta = None
+    if len(route) >= 2:
+        directions = await ors_directions_async(ors_key, ordered_coords)
+        legs, route_geojson = route_legs(directions, ordered_coords, route, matrix)
+        ors_duration_minutes, total_distance_km = _summarize_legs(ordered_addresses, ordered_coords, legs,
+                                                                  start_dt=_plan_start_datetime(start_time, strict=False))
+        predicted_eta = await asyncio.to_thread(_predict_eta, ors_duration_minutes, total_distance_km, len(route),
+                                                start_time)
+    return {
+        "ordered_addresses": ordered_addresses,
+        "ordered_coordinates": ordered_coords,
+        "ors_duration_minutes": round(ors_duration_minutes, 2),
+        "total_distance_km": round(total_distance_km, 3),
+        "num_stops": len(route),
         "predicted_eta_minutes": round(predicted_eta, 2) if predicted_eta is not None else None,
         "route_geometry_geojson": route_geojson,
     }
@@ -1342,6 +2678,13 @@ def submit_training_data(data: TrainingDataRequest):
         conn.commit()
         conn.close()
         
+        for address, point in zip(data.addresses, data.coordinates):
+            if len(point) >= 2 and parse_coordinates(address) is None:
+                suggestion_index.add(address, point[0], point[1])
+        driven_km = route_distance_km(data.route_metadata)
+        if driven_km:
+            detour_model.observe_route([(p[0], p[1]) for p in data.coordinates if len(p) >= 2], driven_km)
+        
         logger.info(f"✅ Training data submitted for route {data.route_id}")
         return {"status": "success", "message": "Training data submitted successfully"}
         
@@ -1431,7 +2774,7 @@ def test_segment(from_addr: str, to_addr: str):
         
         # Get ORS directions
         ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
-        if not ors_key:
+        if not ors_key and road_graph is None:
             return {"error": "ORS API key not set"}
         
         directions = ors_directions(ors_key, [from_coord, to_coord])
@@ -1465,24 +2808,14 @@ def get_traffic_config():
     current_hour = datetime.now().hour
     
     # Determine current time period
-    if 7 <= current_hour <= 10 or 17 <= current_hour <= 20:
-        time_period = "Rush Hours"
-        base_multiplier = 2.2
-    elif 10 <= current_hour <= 17:
-        time_period = "Daytime"
-        base_multiplier = 1.8
-    elif 20 <= current_hour <= 23:
-        time_period = "Evening"
-        base_multiplier = 1.5
-    else:
-        time_period = "Night/Early Morning"
-        base_multiplier = 1.2
+    time_period, base_multiplier = _traffic_period(current_hour)
     
     return {
         "current_time": datetime.now().isoformat(),
         "current_hour": current_hour,
         "time_period": time_period,
         "base_multiplier": base_multiplier,
+        "hourly_multipliers": {hour: _traffic_period(hour)[1] for hour in range(24)},
         "location_adjustments": {
             "bangalore": 1.1,
             "mumbai": 1.2,
@@ -1640,48 +2973,38 @@ def debug_route(addresses: str):
         
         # Geocode addresses
         coords = []
-        for addr in address_list:
-            coord = geocode_address(addr.strip())
-            if coord:
-                coords.append(coord)
-                logger.info(f"  {addr.strip()} -> {coord}")
+        outcomes = geocode_concurrently([a.strip() for a in address_list], geocode_address_with_source,
+                                        max_workers=GEOCODE_MAX_WORKERS, fail_fast=False)
+        for o in outcomes:
+            if o.coords:
+                coords.append(o.coords)
+                logger.info(f"  {o.address} -> {o.coords}")
             else:
-                logger.warning(f"  Failed to geocode: {addr.strip()}")
+                logger.warning(f"  Failed to geocode: {o.address}")
         
         if len(coords) < 2:
             return {"error": "Need at least 2 valid addresses"}
         
         # Get ORS matrix
         ors_key = ORS_API_KEY or os.environ.get("ORS_API_KEY", "")
-        if not ors_key:
+        if not ors_key and road_graph is None:
             return {"error": "ORS API key not set"}
         
         matrix = ors_matrix(ors_key, coords)
         if not matrix:
             return {"error": "Failed to get ORS matrix"}
         
-        # Test individual segments
+        # Get full route directions; its per-segment summaries give the individual legs
+        directions = ors_directions(ors_key, coords)
         segment_results = []
-        for i in range(len(coords) - 1):
-            start_coord = coords[i]
-            end_coord = coords[i + 1]
-            
-            segment_directions = ors_directions(ors_key, [start_coord, end_coord])
-            if segment_directions and "features" in segment_directions and len(segment_directions["features"]) > 0:
-                feat = segment_directions["features"][0]
-                summary = feat.get("properties", {}).get("summary", {})
-                segment_distance = float(summary.get("distance", 0.0))
-                segment_duration = float(summary.get("duration", 0.0)) / 60.0
-                
-                segment_results.append({
-                    "from": address_list[i],
-                    "to": address_list[i + 1],
-                    "distance_km": round(segment_distance, 2),
-                    "duration_minutes": round(segment_duration, 2)
-                })
+        for i, (segment_distance, segment_duration) in enumerate(directions_legs(directions) or []):
+            segment_results.append({
+                "from": address_list[i],
+                "to": address_list[i + 1],
+                "distance_km": round(segment_distance, 2),
+                "duration_minutes": round(segment_duration, 2)
+            })
         
-        # Get full route directions
-        directions = ors_directions(ors_key, coords)
         ors_duration = 0.0
         total_distance = 0.0
         
@@ -0,0 +1,164 @@
+"""Cache of individual distance/duration matrix cells keyed by quantized coordinate pairs."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PointKey = Tuple[int, int]
+
+
+def quantize(lat: float, lon: float, decimals: int = 5) -> PointKey:
+    """Snap a coordinate to a grid (5 decimals is ~1 m) so nearby repeats share cells."""
+    scale = 10 ** decimals
+    return (int(round(lat * scale)), int(round(lon * scale)))
+
+
+class MatrixCellCache:
+    def __init__(self, ttl_seconds: float = 12 * 3600, max_cells: int = 500_000, decimals: int = 5):
+        self.ttl_seconds = ttl_seconds
+        self.max_cells = max_cells
+        self.decimals = decimals
+        # (src_key, dst_key) -> (distance_km, duration_s, expires_at); NaN marks an unroutable pair
+        self._cells: "OrderedDict[Tuple[PointKey, PointKey], Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hit_cells = 0
+        self.missed_cells = 0
+        self.stored_cells = 0
+
+    def keys_for(self, coords_latlon: Sequence[Tuple[float, float]]) -> List[PointKey]:
+        return [quantize(lat, lon, self.decimals) for (lat, lon) in coords_latlon]
+
+    def lookup(self, keys: List[PointKey]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Assemble an n x n view: (distances, durations, known mask)."""
+        return self.lookup_block(keys, keys)
+
+    def lookup_block(self, src_keys: List[PointKey],
+                     dst_keys: List[PointKey]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """lookup for the sources x destinations rectangle only."""
+        distances = np.full((len(src_keys), len(dst_keys)), np.nan)
+        durations = np.full((len(src_keys), len(dst_keys)), np.nan)
+        known = np.zeros((len(src_keys), len(dst_keys)), dtype=bool)
+        now = time.time()
+        same = 0
+        with self._lock:
+            for i, a in enumerate(src_keys):
+                for j, b in enumerate(dst_keys):
+                    if a == b:
+                        distances[i, j] = durations[i, j] = 0.0
+                        known[i, j] = True
+                        same += 1
+                        continue
+                    cell = self._cells.get((a, b))
+                    if cell is None:
+                        continue
+                    if cell[2] <= now:
+                        del self._cells[(a, b)]
+                        continue
+                    distances[i, j], durations[i, j] = cell[0], cell[1]
+                    known[i, j] = True
+            hits = int(known.sum()) - same
+            self.hit_cells += hits
+            self.missed_cells += known.size - same - hits
+        return distances, durations, known
+
+    def store(self, src_keys: List[PointKey], dst_keys: List[PointKey],
+              distances: Sequence[Sequence[Optional[float]]], durations: Sequence[Sequence[Optional[float]]]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for i, a in enumerate(src_keys):
+                for j, b in enumerate(dst_keys):
+                    if a == b:
+                        continue
+                    dist = distances[i][j]
+                    dur = durations[i][j]
+                    self._cells[(a, b)] = (
+                        float("nan") if dist is None else float(dist),
+                        float("nan") if dur is None else float(dur),
+                        expires_at,
+                    )
+                    self._cells.move_to_end((a, b))
+                    self.stored_cells += 1
+            while len(self._cells) > self.max_cells:
+                self._cells.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hit_cells + self.missed_cells
+            return {
+                "cells": len(self._cells),
+                "hit_cells": self.hit_cells,
+                "missed_cells": self.missed_cells,
+                "stored_cells": self.stored_cells,
+                "hit_rate": round(self.hit_cells / lookups, 4) if lookups else 0.0,
+            }
+
+
+def plan_missing_blocks(known: np.ndarray) -> List[Tuple[List[int], List[int]]]:
+    """Cover the unknown cells with a few (sources, destinations) requests.
+
+    Points whose rows/columns are mostly unknown ("new" stops) are fetched as
+    full rows plus the columns into them from the other points; anything
+    left over among the remaining points is fetched as one rectangle.
+    """
+    n = known.shape[0]
+    missing = ~known
+    if not missing.any():
+        return []
+    per_point = missing.sum(axis=0) + missing.sum(axis=1)
+    new = [i for i in range(n) if per_point[i] > n - 1]
+    old = [i for i in range(n) if i not in set(new)]
+    blocks: List[Tuple[List[int], List[int]]] = []
+    covered = np.zeros_like(known)
+    if new:
+        blocks.append((new, list(range(n))))
+        covered[new, :] = True
+        if old:
+            blocks.append((old, new))
+            covered[np.ix_(old, new)] = True
+    rest = missing & ~covered
+    if rest.any():
+        rows = [int(i) for i in np.nonzero(rest.any(axis=1))[0]]
+        cols = [int(j) for j in np.nonzero(rest.any(axis=0))[0]]
+        blocks.append((rows, cols))
+    return blocks
+
+
+def split_block(sources: List[int], destinations: List[int], max_locations: int,
+                max_elements: int) -> List[Tuple[List[int], List[int]]]:
+    """Tile one (sources, destinations) request into provider-sized requests.
+
+    Each tile sends at most max_locations distinct locations and asks for
+    at most max_elements cells. Tiles are rectangles of the original block,
+    so their cells cover it exactly once.
+    """
+    if not sources or not destinations:
+        return []
+    if len(set(sources) | set(destinations)) <= max_locations and len(sources) * len(destinations) <= max_elements:
+        return [(sources, destinations)]
+    half = max(1, max_locations // 2)
+    if len(destinations) > half:
+        rows = min(len(sources), half)
+    else:
+        rows = min(len(sources), max(1, max_locations - len(destinations)))
+    cols = min(len(destinations), max(1, max_locations - rows))
+    while rows * cols > max_elements and max(rows, cols) > 1:
+        if rows >= cols:
+            rows -= 1
+        else:
+            cols -= 1
+    return [
+        (sources[i:i + rows], destinations[j:j + cols])
+        for i in range(0, len(sources), rows)
+        for j in range(0, len(destinations), cols)
+    ]
+
+
+def tile_blocks(blocks: List[Tuple[List[int], List[int]]], max_locations: int,
+                max_elements: int) -> List[Tuple[List[int], List[int]]]:
+    tiles: List[Tuple[List[int], List[int]]] = []
+    for sources, destinations in blocks:
+        tiles.extend(split_block(sources, destinations, max_locations, max_elements))
+    return tiles
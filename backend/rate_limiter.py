@@ -0,0 +1,70 @@
+"""Token-bucket rate limiter for upstream providers, usable from threads and coroutines."""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+
+class RateLimiter:
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate_per_sec = float(rate_per_sec)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.rejected = 0
+
+    def _reserve(self) -> float:
+        """Take a token if one is available, else return seconds until the next one."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate_per_sec)
+        self._last = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate_per_sec
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Block until a request may be sent. Returns False if timeout elapses first."""
+        if self.rate_per_sec <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            with self._lock:
+                delay = self._reserve()
+                if delay == 0.0:
+                    if waited:
+                        self.waits += 1
+                    return True
+            if deadline is not None and time.monotonic() + delay > deadline:
+                with self._lock:
+                    self.rejected += 1
+                return False
+            waited = True
+            time.sleep(delay)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """acquire() for coroutines: shares the same bucket but waits with asyncio.sleep."""
+        if self.rate_per_sec <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            with self._lock:
+                delay = self._reserve()
+                if delay == 0.0:
+                    if waited:
+                        self.waits += 1
+                    return True
+            if deadline is not None and time.monotonic() + delay > deadline:
+                with self._lock:
+                    self.rejected += 1
+                return False
+            waited = True
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        return {"rate_per_sec": self.rate_per_sec, "burst": self.burst, "waits": self.waits, "rejected": self.rejected}
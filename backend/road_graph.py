@@ -0,0 +1,553 @@
+"""Offline road-graph routing engine built from an OSM XML extract.
+
+Build a graph once:
+
+    python road_graph.py build --osm bengaluru.osm --out db/road_graph.npz
+
+The importer keeps drivable ways, weights every edge by travel time from its
+highway class (or maxspeed), keeps the largest strongly connected component
+and preprocesses the graph with contraction hierarchies. The .npz file holds
+node coordinates and the upward forward/backward graphs in CSR form; each
+shortcut records the node it bypasses so paths can be unpacked back into
+road geometry.
+
+Point-to-point queries are bidirectional upward searches. Many-to-many
+matrices use the bucket algorithm: one backward search per target fills
+buckets, one forward search per source scans them.
+"""
+
+import argparse
+import heapq
+import math
+import time
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+INF = float("inf")
+
+# Typical free-flow speeds on Indian city roads (km/h) by OSM highway class
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 80, "trunk": 60, "primary": 45, "secondary": 35, "tertiary": 30,
+    "unclassified": 25, "residential": 20, "living_street": 10, "service": 15, "road": 20,
+    "motorway_link": 50, "trunk_link": 40, "primary_link": 30, "secondary_link": 25, "tertiary_link": 20,
+}
+ONEWAY_VALUES = {"yes", "true", "1"}
+EXCLUDED_ACCESS = {"no", "private"}
+
+# Witness searches stop after settling this many nodes (more = fewer shortcuts, slower build)
+WITNESS_SETTLE_LIMIT = 400
+PRIORITY_SETTLE_LIMIT = 60
+SNAP_CELL_DEG = 0.01
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(min(a, 1.0)))
+
+
+# -------------------- Import --------------------
+
+def _speed_kmh(tags: Dict[str, str]) -> Optional[float]:
+    highway = tags.get("highway")
+    if highway not in HIGHWAY_SPEEDS_KMH:
+        return None
+    if tags.get("access") in EXCLUDED_ACCESS or tags.get("motor_vehicle") in EXCLUDED_ACCESS:
+        return None
+    speed = float(HIGHWAY_SPEEDS_KMH[highway])
+    maxspeed = tags.get("maxspeed", "").split(" ")[0]
+    if maxspeed.isdigit():
+        # Posted limits are rarely reached in city traffic
+        speed = min(speed, float(maxspeed))
+    return speed
+
+
+def read_osm_ways(path: str) -> Tuple[Dict[int, Tuple[float, float]], List[Tuple[List[int], float, int]]]:
+    """Node coordinates and drivable ways as (node refs, speed km/h, direction).
+
+    direction is 0 for two-way, 1 for one-way along the refs and -1 for
+    one-way against them. PBF extracts must be converted to XML first.
+    """
+    if path.endswith(".pbf"):
+        raise ValueError("PBF extracts are not supported; convert with `osmium cat in.osm.pbf -o out.osm`")
+    node_coords: Dict[int, Tuple[float, float]] = {}
+    ways: List[Tuple[List[int], float, int]] = []
+    tags: Dict[str, str] = {}
+    refs: List[int] = []
+    for event, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "tag":
+            tags[elem.get("k")] = elem.get("v")
+        elif elem.tag == "nd":
+            refs.append(int(elem.get("ref")))
+        elif elem.tag == "node":
+            node_coords[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+            tags, refs = {}, []
+            elem.clear()
+        elif elem.tag == "way":
+            speed = _speed_kmh(tags)
+            if speed and len(refs) >= 2:
+                oneway = tags.get("oneway", "")
+                if oneway == "-1":
+                    direction = -1
+                elif oneway in ONEWAY_VALUES or tags.get("junction") == "roundabout" or tags.get("highway") == "motorway":
+                    direction = 1
+                else:
+                    direction = 0
+                ways.append((refs, speed, direction))
+            tags, refs = {}, []
+            elem.clear()
+        elif elem.tag == "relation":
+            tags, refs = {}, []
+            elem.clear()
+    return node_coords, ways
+
+
+def build_edges(node_coords: Dict[int, Tuple[float, float]],
+                ways: List[Tuple[List[int], float, int]]) -> Tuple[np.ndarray, np.ndarray, Dict[Tuple[int, int], Tuple[float, float]]]:
+    """Compact node arrays and the directed edge map (u, v) -> (seconds, km), keeping the fastest parallel edge."""
+    index: Dict[int, int] = {}
+    lats: List[float] = []
+    lons: List[float] = []
+    edges: Dict[Tuple[int, int], Tuple[float, float]] = {}
+
+    def node(ref: int) -> int:
+        idx = index.get(ref)
+        if idx is None:
+            idx = index[ref] = len(lats)
+            lats.append(node_coords[ref][0])
+            lons.append(node_coords[ref][1])
+        return idx
+
+    for refs, speed, direction in ways:
+        present = [r for r in refs if r in node_coords]
+        for a_ref, b_ref in zip(present, present[1:]):
+            if a_ref == b_ref:
+                continue
+            a, b = node(a_ref), node(b_ref)
+            km = haversine_km(lats[a], lons[a], lats[b], lons[b])
+            seconds = km / speed * 3600.0
+            pairs = [(a, b), (b, a)] if direction == 0 else [(a, b)] if direction == 1 else [(b, a)]
+            for pair in pairs:
+                current = edges.get(pair)
+                if current is None or seconds < current[0]:
+                    edges[pair] = (seconds, km)
+    return np.array(lats), np.array(lons), edges
+
+
+def largest_strong_component(n: int, edges: Dict[Tuple[int, int], Tuple[float, float]]) -> np.ndarray:
+    """Boolean mask of the nodes in the largest strongly connected component."""
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if not edges:
+        return np.zeros(n, dtype=bool)
+    pairs = np.array(list(edges.keys()), dtype=np.int64)
+    adjacency = csr_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(adjacency, directed=True, connection="strong")
+    return labels == np.bincount(labels).argmax()
+
+
+# -------------------- Contraction hierarchies --------------------
+
+Adjacency = List[Dict[int, Tuple[float, float, int]]]  # neighbor -> (seconds, km, bypassed node or -1)
+
+
+def _witness_distances(out_adj: Adjacency, source: int, skip: int, max_weight: float,
+                       targets: Sequence[int], settle_limit: int) -> Dict[int, float]:
+    """Bounded Dijkstra from source that ignores the node being contracted."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_weight:
+            break
+        remaining.discard(u)
+        settled += 1
+        if not remaining or settled > settle_limit:
+            break
+        for v, (w, _, _) in out_adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _shortcuts(v: int, out_adj: Adjacency, in_adj: Adjacency, settle_limit: int) -> List[Tuple[int, int, float, float]]:
+    """Shortcuts (u, w, seconds, km) needed to preserve shortest paths through v."""
+    outs = out_adj[v]
+    if not outs:
+        return []
+    needed = []
+    for u, (w_uv, km_uv, _) in in_adj[v].items():
+        via = {w: w_uv + w_vw for w, (w_vw, _, _) in outs.items() if w != u}
+        if not via:
+            continue
+        witness = _witness_distances(out_adj, u, v, max(via.values()), list(via), settle_limit)
+        for w, weight in via.items():
+            if witness.get(w, INF) > weight:
+                needed.append((u, w, weight, km_uv + outs[w][1]))
+    return needed
+
+
+def contract(n: int, edges: Dict[Tuple[int, int], Tuple[float, float]],
+             log_every: int = 0) -> Tuple[np.ndarray, List[Tuple[int, int, float, float, int]], List[Tuple[int, int, float, float, int]]]:
+    """Contract every node; returns (rank, upward forward edges, upward backward edges).
+
+    Forward edges (u, w, ...) lead from u to a higher-ranked w. Backward
+    edges (v, u, ...) stand for the original direction u -> v where u is
+    higher-ranked than v, so backward searches from a target climb them.
+    """
+    out_adj: Adjacency = [dict() for _ in range(n)]
+    in_adj: Adjacency = [dict() for _ in range(n)]
+    for (u, v), (seconds, km) in edges.items():
+        out_adj[u][v] = (seconds, km, -1)
+        in_adj[v][u] = (seconds, km, -1)
+
+    deleted_neighbors = [0] * n
+    # Hierarchy depth; penalizing it keeps contraction spread evenly over the graph
+    level = [0] * n
+
+    def priority(v: int) -> int:
+        added = len(_shortcuts(v, out_adj, in_adj, PRIORITY_SETTLE_LIMIT))
+        return 2 * (added - len(out_adj[v]) - len(in_adj[v])) + deleted_neighbors[v] + level[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.full(n, -1, dtype=np.int64)
+    up_forward: List[Tuple[int, int, float, float, int]] = []
+    up_backward: List[Tuple[int, int, float, float, int]] = []
+    next_rank = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if rank[v] >= 0:
+            continue
+        # Lazy update: re-evaluate and defer if another node became cheaper
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        shortcuts = _shortcuts(v, out_adj, in_adj, WITNESS_SETTLE_LIMIT)
+        rank[v] = next_rank
+        next_rank += 1
+        for w, (seconds, km, mid) in out_adj[v].items():
+            up_forward.append((v, w, seconds, km, mid))
+            del in_adj[w][v]
+            deleted_neighbors[w] += 1
+            level[w] = max(level[w], level[v] + 1)
+        for u, (seconds, km, mid) in in_adj[v].items():
+            up_backward.append((v, u, seconds, km, mid))
+            del out_adj[u][v]
+            deleted_neighbors[u] += 1
+            level[u] = max(level[u], level[v] + 1)
+        out_adj[v], in_adj[v] = {}, {}
+        for u, w, seconds, km in shortcuts:
+            existing = out_adj[u].get(w)
+            if existing is None or seconds < existing[0]:
+                out_adj[u][w] = (seconds, km, v)
+                in_adj[w][u] = (seconds, km, v)
+        if log_every and next_rank % log_every == 0:
+            print(f"   contracted {next_rank}/{n} nodes")
+    return rank, up_forward, up_backward
+
+
+def _csr(n: int, edges: List[Tuple[int, int, float, float, int]]) -> Dict[str, np.ndarray]:
+    edges = sorted(edges, key=lambda e: e[0])
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    for e in edges:
+        offsets[e[0] + 1] += 1
+    return {
+        "offsets": np.cumsum(offsets),
+        "to": np.array([e[1] for e in edges], dtype=np.int32),
+        "seconds": np.array([e[2] for e in edges], dtype=np.float64),
+        "km": np.array([e[3] for e in edges], dtype=np.float64),
+        "mid": np.array([e[4] for e in edges], dtype=np.int32),
+    }
+
+
+def build_graph(osm_paths: Sequence[str], out_path: str, verbose: bool = False) -> Tuple[int, int]:
+    """Import OSM extracts, contract and write the graph; returns (nodes, upward edges)."""
+    node_coords: Dict[int, Tuple[float, float]] = {}
+    ways: List[Tuple[List[int], float, int]] = []
+    for path in osm_paths:
+        coords, found = read_osm_ways(path)
+        node_coords.update(coords)
+        ways.extend(found)
+    lat, lon, edges = build_edges(node_coords, ways)
+    del node_coords
+
+    keep = largest_strong_component(len(lat), edges)
+    remap = np.full(len(lat), -1, dtype=np.int64)
+    remap[keep] = np.arange(int(keep.sum()))
+    edges = {(int(remap[u]), int(remap[v])): cost for (u, v), cost in edges.items() if keep[u] and keep[v]}
+    lat, lon = lat[keep], lon[keep]
+    n = len(lat)
+    if verbose:
+        print(f"   {n} nodes, {len(edges)} edges in the largest connected component")
+
+    started = time.time()
+    rank, up_forward, up_backward = contract(n, edges, log_every=50000 if verbose else 0)
+    if verbose:
+        print(f"   contraction took {time.time() - started:.1f}s")
+    fwd = _csr(n, up_forward)
+    bwd = _csr(n, up_backward)
+    np.savez_compressed(
+        out_path, lat=lat, lon=lon, rank=rank,
+        **{f"fwd_{k}": v for k, v in fwd.items()},
+        **{f"bwd_{k}": v for k, v in bwd.items()},
+    )
+    return n, len(up_forward) + len(up_backward)
+
+
+# -------------------- Queries --------------------
+
+class RoadGraph:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.lat = arrays["lat"]
+        self.lon = arrays["lon"]
+        self.rank = arrays["rank"]
+        # Python lists are much faster than numpy scalars inside the search loops
+        self._fwd = self._adjacency(arrays, "fwd")
+        self._bwd = self._adjacency(arrays, "bwd")
+        self._fwd_mid = arrays["fwd_mid"]
+        self._bwd_mid = arrays["bwd_mid"]
+        self._arrays = arrays
+        self._shortcut_mid: Optional[Dict[Tuple[int, int], int]] = None
+        self._build_snap_grid()
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @staticmethod
+    def _adjacency(arrays: Dict[str, np.ndarray], prefix: str) -> List[List[Tuple[int, float, float]]]:
+        offsets = arrays[f"{prefix}_offsets"].tolist()
+        to = arrays[f"{prefix}_to"].tolist()
+        seconds = arrays[f"{prefix}_seconds"].tolist()
+        km = arrays[f"{prefix}_km"].tolist()
+        return [list(zip(to[offsets[i]:offsets[i + 1]], seconds[offsets[i]:offsets[i + 1]], km[offsets[i]:offsets[i + 1]]))
+                for i in range(len(offsets) - 1)]
+
+    # ---- snapping ----
+
+    def _build_snap_grid(self) -> None:
+        cells = (np.floor(self.lat / SNAP_CELL_DEG).astype(np.int64) * 100000
+                 + np.floor(self.lon / SNAP_CELL_DEG).astype(np.int64))
+        order = np.argsort(cells, kind="stable")
+        keys, starts = np.unique(cells[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        self._grid = {int(k): order[bounds[i]:bounds[i + 1]] for i, k in enumerate(keys)}
+
+    def snap(self, lat: float, lon: float) -> Tuple[int, float]:
+        """Nearest graph node and its distance in km."""
+        cy, cx = int(math.floor(lat / SNAP_CELL_DEG)), int(math.floor(lon / SNAP_CELL_DEG))
+        nearby = [self._grid[k] for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+                  if (k := (cy + dy) * 100000 + cx + dx) in self._grid]
+        candidates = np.concatenate(nearby) if nearby else np.arange(len(self.lat))
+        x = np.radians(self.lon[candidates] - lon) * math.cos(math.radians(lat))
+        y = np.radians(self.lat[candidates] - lat)
+        best = int(np.argmin(x * x + y * y))
+        node = int(candidates[best])
+        return node, haversine_km(lat, lon, float(self.lat[node]), float(self.lon[node]))
+
+    def covers(self, coords_latlon: Sequence[Tuple[float, float]], max_snap_km: float) -> bool:
+        """True when every point is within max_snap_km of the road graph."""
+        return all(self.snap(lat, lon)[1] <= max_snap_km for lat, lon in coords_latlon)
+
+    # ---- searches ----
+
+    def _upward_search(self, source: int, adjacency: List[List[Tuple[int, float, float]]],
+                       reverse: List[List[Tuple[int, float, float]]],
+                       parents: Optional[Dict[int, int]] = None) -> Dict[int, Tuple[float, float]]:
+        """Dijkstra over the upward graph: node -> (seconds, km).
+
+        Uses stall-on-demand: a node reachable more cheaply through a
+        higher-ranked neighbor (an edge of the opposite search direction) is
+        not expanded, since no shortest path climbs through it.
+        """
+        best = {source: (0.0, 0.0)}
+        heap = [(0.0, 0.0, source)]
+        done = set()
+        while heap:
+            d, km, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            stalled = False
+            for x, w, _ in reverse[u]:
+                label = best.get(x)
+                if label is not None and label[0] + w < d:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+            for v, w, edge_km in adjacency[u]:
+                nd = d + w
+                current = best.get(v)
+                if current is None or nd < current[0]:
+                    best[v] = (nd, km + edge_km)
+                    if parents is not None:
+                        parents[v] = u
+                    heapq.heappush(heap, (nd, km + edge_km, v))
+        return best
+
+    def route(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """(seconds, km, node path) of the fastest route between two graph nodes."""
+        if source == target:
+            return 0.0, 0.0, [source]
+        fwd_parents: Dict[int, int] = {}
+        bwd_parents: Dict[int, int] = {}
+        forward = self._upward_search(source, self._fwd, self._bwd, fwd_parents)
+        backward = self._upward_search(target, self._bwd, self._fwd, bwd_parents)
+        meet, best = -1, (INF, INF)
+        for node, (d, km) in forward.items():
+            other = backward.get(node)
+            if other is not None and d + other[0] < best[0]:
+                meet, best = node, (d + other[0], km + other[1])
+        if meet < 0:
+            return None
+
+        up_path = [meet]
+        while up_path[-1] != source:
+            up_path.append(fwd_parents[up_path[-1]])
+        up_path.reverse()
+        down_path = [meet]
+        while down_path[-1] != target:
+            down_path.append(bwd_parents[down_path[-1]])
+        hierarchy_path = up_path + down_path[1:]
+
+        nodes = [source]
+        for a, b in zip(hierarchy_path, hierarchy_path[1:]):
+            self._unpack(a, b, nodes)
+        return best[0], best[1], nodes
+
+    def _unpack(self, a: int, b: int, out: List[int]) -> None:
+        """Append the original nodes of edge a -> b (excluding a) to out."""
+        if self._shortcut_mid is None:
+            self._shortcut_mid = self._shortcut_index()
+        stack = [(a, b)]
+        while stack:
+            u, v = stack.pop()
+            mid = self._shortcut_mid.get((u, v))
+            if mid is None:
+                out.append(v)
+            else:
+                stack.append((mid, v))
+                stack.append((u, mid))
+
+    def _shortcut_index(self) -> Dict[Tuple[int, int], int]:
+        """(from, to) in original direction -> bypassed node, for every shortcut."""
+        index: Dict[Tuple[int, int], int] = {}
+        for prefix, mids in (("fwd", self._fwd_mid), ("bwd", self._bwd_mid)):
+            offsets = self._arrays[f"{prefix}_offsets"]
+            to = self._arrays[f"{prefix}_to"]
+            owners = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+            for i in np.nonzero(mids >= 0)[0]:
+                owner, other = int(owners[i]), int(to[i])
+                pair = (owner, other) if prefix == "fwd" else (other, owner)
+                index[pair] = int(mids[i])
+        return index
+
+    def many_to_many(self, sources: Sequence[int], targets: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """(seconds, km) matrices between graph nodes; inf marks unreachable pairs."""
+        buckets: Dict[int, List[Tuple[int, float, float]]] = defaultdict(list)
+        for j, t in enumerate(targets):
+            for node, (d, km) in self._upward_search(t, self._bwd, self._fwd).items():
+                buckets[node].append((j, d, km))
+        seconds = np.full((len(sources), len(targets)), INF)
+        km_matrix = np.full((len(sources), len(targets)), INF)
+        for i, s in enumerate(sources):
+            row_s = seconds[i]
+            row_km = km_matrix[i]
+            for node, (d, km) in self._upward_search(s, self._fwd, self._bwd).items():
+                for j, dt, kt in buckets.get(node, ()):
+                    if d + dt < row_s[j]:
+                        row_s[j] = d + dt
+                        row_km[j] = km + kt
+        return seconds, km_matrix
+
+    # ---- ORS-compatible responses ----
+
+    def matrix(self, coords_latlon: Sequence[Tuple[float, float]]) -> Dict[str, Any]:
+        """Same shape as the ORS matrix response (km / seconds, None when unroutable)."""
+        nodes = [self.snap(lat, lon)[0] for lat, lon in coords_latlon]
+        seconds, km = self.many_to_many(nodes, nodes)
+        return {
+            "distances": [[None if math.isinf(v) else round(float(v), 3) for v in row] for row in km],
+            "durations": [[None if math.isinf(v) else round(float(v), 1) for v in row] for row in seconds],
+        }
+
+    def directions(self, coords_latlon_ordered: Sequence[Tuple[float, float]]) -> Optional[Dict[str, Any]]:
+        """Same shape as the ORS directions GeoJSON response; None if a leg is unroutable."""
+        nodes = [self.snap(lat, lon)[0] for lat, lon in coords_latlon_ordered]
+        path = [nodes[0]]
+        segments = []
+        way_points = [0]
+        for a, b in zip(nodes, nodes[1:]):
+            leg = self.route(a, b)
+            if leg is None:
+                return None
+            seconds, km, leg_nodes = leg
+            path.extend(leg_nodes[1:])
+            way_points.append(len(path) - 1)
+            segments.append({"distance": round(km, 3), "duration": round(seconds, 1)})
+        coordinates = [[float(self.lon[i]), float(self.lat[i])] for i in path]
+        summary = {
+            "distance": round(sum(s["distance"] for s in segments), 3),
+            "duration": round(sum(s["duration"] for s in segments), 1),
+        }
+        return {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "properties": {"segments": segments, "summary": summary, "way_points": way_points},
+            }],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline road graph")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Import OSM extracts and preprocess them with contraction hierarchies")
+    build.add_argument("--osm", action="append", required=True, help="OSM XML extract (.osm)")
+    build.add_argument("--out", default="db/road_graph.npz")
+    route = sub.add_parser("route", help="Fastest route between two 'lat,lon' points")
+    route.add_argument("origin")
+    route.add_argument("destination")
+    route.add_argument("--graph", default="db/road_graph.npz")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"📥 Reading OSM extracts {', '.join(args.osm)}")
+        nodes, edges = build_graph(args.osm, args.out, verbose=True)
+        print(f"✅ Wrote road graph with {nodes} nodes and {edges} upward edges to {args.out}")
+    else:
+        graph = RoadGraph.load(args.graph)
+        points = [tuple(float(x) for x in p.split(",")) for p in (args.origin, args.destination)]
+        started = time.perf_counter()
+        result = graph.directions(points)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if result is None:
+            print("❌ No route found")
+            return
+        summary = result["features"][0]["properties"]["summary"]
+        print(f"{summary['distance']:.2f} km, {summary['duration'] / 60:.1f} min ({elapsed_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
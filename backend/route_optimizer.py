@@ -0,0 +1,834 @@
+"""Stop ordering: exact Held-Karp for small routes, and nearest neighbor construction,
+2-opt and chained local search heuristics for the rest.
+
+Every function accepts a cost matrix as a list of lists (None for
+unroutable pairs), a NumPy array, or a SparseCostMatrix, and works on a
+float array internally (unroutable pairs cost inf).
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from sparse_matrix import SparseCostMatrix
+
+logger = logging.getLogger(__name__)
+
+CostMatrix = Union[Sequence[Sequence[Optional[float]]], np.ndarray, SparseCostMatrix]
+
+# Candidate neighbors per node for local search moves
+NEIGHBOR_K = 10
+# Moves must gain at least this much
+IMPROVEMENT_EPS = 1e-9
+# Full vectorized 2-opt sweeps build n x n arrays; skip them above this size
+FULL_SWEEP_MAX_NODES = 2500
+# Longest segment or-opt relocates
+OR_OPT_MAX_SEGMENT = 3
+# Longest segment a double-bridge kick moves, so kicks stay local
+KICK_SEGMENT_MAX = 30
+# Multistart: randomized nearest neighbor picks among this many closest stops
+RANDOM_NN_CHOICES = 3
+# Noise on insertion costs for randomized regret insertion starts
+REGRET_NOISE = 0.15
+# Regret insertion is O(n^3); larger routes only use nearest neighbor starts
+REGRET_MAX_STOPS = 300
+MULTISTART_DEFAULT_STARTS = 8
+MULTISTART_MAX_STARTS = 256
+# The pool is started from a threaded server, where fork can copy held locks into workers;
+# forkserver (spawn where unavailable) starts them from a clean process instead. Workers then
+# re-import a __main__ script (not the uvicorn CLI), so keep app start-up behind its guard
+POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+# Routes up to this many stops (start included) are solved exactly with Held-Karp
+HELD_KARP_MAX_STOPS = 16
+
+
+def as_cost_array(matrix: CostMatrix) -> np.ndarray:
+    if isinstance(matrix, SparseCostMatrix):
+        return matrix.values
+    arr = np.array(matrix, dtype=float)
+    arr[np.isnan(arr)] = np.inf
+    return arr
+
+
+def nearest_neighbor_order(matrix_dist: CostMatrix, start_index: int = 0) -> List[int]:
+    costs = as_cost_array(matrix_dist)
+    # Sparse matrices look at the measured candidates first
+    neighbors = matrix_dist.neighbors if isinstance(matrix_dist, SparseCostMatrix) else None
+    n = len(costs)
+    visited = np.zeros(n, dtype=bool)
+    order = [start_index]
+    visited[start_index] = True
+    current = start_index
+    for _ in range(n - 1):
+        next_idx = None
+        if neighbors is not None and neighbors.shape[1]:
+            candidates = neighbors[current][~visited[neighbors[current]]]
+            if len(candidates):
+                next_idx = int(candidates[np.argmin(costs[current, candidates])])
+        if next_idx is None:
+            # Unvisited stops only; if every cost is inf this is the first unvisited one
+            row = np.where(visited, np.nan, costs[current])
+            row[np.isinf(row)] = np.finfo(float).max
+            next_idx = int(np.nanargmin(row))
+        order.append(next_idx)
+        visited[next_idx] = True
+        current = next_idx
+    return order
+
+
+def _route_cost(matrix_dist: CostMatrix, order: List[int]) -> float:
+    costs = matrix_dist if isinstance(matrix_dist, np.ndarray) else as_cost_array(matrix_dist)
+    idx = np.asarray(order)
+    return float(costs[idx[:-1], idx[1:]].sum())
+
+
+def finite_costs(matrix_dist: CostMatrix) -> np.ndarray:
+    """Cost array with inf replaced by a large finite cost, so move deltas stay comparable."""
+    costs = as_cost_array(matrix_dist)
+    finite = np.isfinite(costs)
+    if finite.all():
+        return costs
+    big = (float(np.abs(costs[finite]).max()) if finite.any() else 1.0) * 1e6 + 1.0
+    return np.where(finite, costs, big)
+
+
+def neighbor_lists(costs: np.ndarray, k: int = NEIGHBOR_K) -> np.ndarray:
+    """n x min(k, n-1) candidate lists: each node's nearest nodes by round-trip cost."""
+    n = len(costs)
+    k = max(0, min(k, n - 1))
+    if k == 0:
+        return np.zeros((n, 0), dtype=np.int64)
+    both = costs + costs.T
+    np.fill_diagonal(both, np.inf)
+    nearest = np.argpartition(both, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(both, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def _candidate_lists(matrix_dist: CostMatrix, costs: np.ndarray,
+                     neighbors: Optional[np.ndarray]) -> np.ndarray:
+    if neighbors is not None:
+        return neighbors
+    if isinstance(matrix_dist, SparseCostMatrix) and matrix_dist.neighbors.shape[1]:
+        return matrix_dist.neighbors
+    return neighbor_lists(costs)
+
+
+class RoutePath:
+    """A stop order under local search moves, with prefix sums for O(1) move deltas.
+
+    Position 0 is fixed, and so is the last position unless fixed_end is
+    False; moves only rearrange positions 1..last. Moves are tuples:
+
+    ("2opt", i, k)        reverse t[i..k]
+    ("or", i, j, p, rev)  move t[i..j] to just after t[p], reversed if rev
+    ("swap", i, j, k)     exchange t[i..j] with t[j+1..k] (3-opt, no reversal)
+
+    Forward and reverse prefix sums price any reversed stretch exactly, so
+    asymmetric matrices are handled correctly; or-opt and swap moves keep
+    segment direction and need no such correction.
+    """
+
+    def __init__(self, costs: np.ndarray, order: List[int], fixed_end: bool):
+        self.costs = costs
+        self.n = len(order)
+        self.last = self.n - 2 if fixed_end else self.n - 1
+        self.pos = np.full(len(costs), -1, dtype=np.int64)
+        self.set(np.array(order, dtype=np.int64))
+
+    def set(self, t: np.ndarray) -> None:
+        self.t = t
+        self.pos[t] = np.arange(self.n)
+        c = self.costs
+        self.fwd = np.concatenate(([0.0], np.cumsum(c[t[:-1], t[1:]])))
+        self.rev = np.concatenate(([0.0], np.cumsum(c[t[1:], t[:-1]])))
+
+    def cost(self) -> float:
+        return float(self.fwd[-1])
+
+    def edge(self, x: int, y: int) -> float:
+        """Cost of t[x] -> t[y]; 0 past the end of an open path."""
+        return float(self.costs[self.t[x], self.t[y]]) if y < self.n else 0.0
+
+    def _flip(self, i: int, k: int) -> float:
+        """Extra cost of traversing t[i..k] backwards."""
+        return float((self.rev[k] - self.rev[i]) - (self.fwd[k] - self.fwd[i]))
+
+    def delta(self, move: Tuple) -> float:
+        kind = move[0]
+        if kind == "2opt":
+            _, i, k = move
+            return (self.edge(i - 1, k) + self.edge(i, k + 1) - self.edge(i - 1, i) - self.edge(k, k + 1)
+                    + self._flip(i, k))
+        if kind == "or":
+            _, i, j, p, rev = move
+            removed = self.edge(i - 1, i) + self.edge(j, j + 1) - self.edge(i - 1, j + 1)
+            if rev:
+                added = self.edge(p, j) + self.edge(i, p + 1) + self._flip(i, j)
+            else:
+                added = self.edge(p, i) + self.edge(j, p + 1)
+            return added - self.edge(p, p + 1) - removed
+        _, i, j, k = move
+        return (self.edge(i - 1, j + 1) + self.edge(k, i) + self.edge(j, k + 1)
+                - self.edge(i - 1, i) - self.edge(j, j + 1) - self.edge(k, k + 1))
+
+    def apply(self, move: Tuple) -> List[int]:
+        """Apply a move; returns the nodes whose path neighbors changed."""
+        t = self.t
+        kind = move[0]
+        if kind == "2opt":
+            _, i, k = move
+            cuts = [i - 1, i, k, k + 1]
+            new = t.copy()
+            new[i:k + 1] = t[i:k + 1][::-1]
+        elif kind == "or":
+            _, i, j, p, rev = move
+            cuts = [i - 1, i, j, j + 1, p, p + 1]
+            segment = t[i:j + 1][::-1] if rev else t[i:j + 1]
+            rest = np.concatenate((t[:i], t[j + 1:]))
+            at = p + 1 if p < i else p + 1 - (j - i + 1)
+            new = np.concatenate((rest[:at], segment, rest[at:]))
+        else:
+            _, i, j, k = move
+            cuts = [i - 1, i, j, j + 1, k, k + 1]
+            new = np.concatenate((t[:i], t[j + 1:k + 1], t[i:j + 1], t[k + 1:]))
+        touched = t[[x for x in cuts if x < self.n]].tolist()
+        self.set(new)
+        return touched
+
+    def two_opt_moves(self, a: int, candidates: np.ndarray) -> List[Tuple]:
+        """Reversals that create an edge between a and one of its candidates, in either direction."""
+        p = int(self.pos[a])
+        moves = []
+        for q in self.pos[candidates].tolist():
+            if q < 0:
+                continue
+            # a->c, c->a, a->c (a moves), c->a (a moves)
+            for i, k in ((p + 1, q), (q, p - 1), (p, q - 1), (q + 1, p)):
+                if 1 <= i < k <= self.last:
+                    moves.append(("2opt", i, k))
+        return moves
+
+    def or_opt_moves(self, a: int, candidates: np.ndarray) -> List[Tuple]:
+        """Relocations of short segments starting or ending at a to next to one of its candidates."""
+        p = int(self.pos[a])
+        targets = [q for q in self.pos[candidates].tolist() if q >= 0]
+        moves = []
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            starts = (p,) if length == 1 else (p, p - length + 1)
+            for i in starts:
+                j = i + length - 1
+                if i < 1 or j > self.last:
+                    continue
+                for q in targets:
+                    for after in (q, q - 1):
+                        if after < 0 or after > self.last or i - 1 <= after <= j:
+                            continue
+                        moves.append(("or", i, j, after, False))
+                        if length > 1:
+                            moves.append(("or", i, j, after, True))
+        return moves
+
+    def swap_moves(self, a: int, candidates: np.ndarray, neighbors: np.ndarray) -> List[Tuple]:
+        """Segment exchanges that add a -> c for a candidate c, closing with an edge into a's successor."""
+        p = int(self.pos[a])
+        i = p + 1
+        if i < 1 or i > self.last:
+            return []
+        moves = []
+        closing = [r for r in self.pos[neighbors[self.t[i]]].tolist() if r >= 0]
+        for q in self.pos[candidates].tolist():
+            j = q - 1
+            if q < 0 or j < i or q > self.last:
+                continue
+            for k in closing:
+                if q <= k <= self.last:
+                    moves.append(("swap", i, j, k))
+        return moves
+
+    def double_bridge(self, rng: np.random.Generator) -> List[int]:
+        """Random kick: exchange two adjacent segments of at most KICK_SEGMENT_MAX stops."""
+        p1 = int(rng.integers(1, self.last))
+        p2 = p1 + int(rng.integers(1, min(KICK_SEGMENT_MAX, self.last - p1) + 1))
+        p3 = p2 + int(rng.integers(1, min(KICK_SEGMENT_MAX, self.last + 1 - p2) + 1))
+        return self.apply(("swap", p1, p2 - 1, p3 - 1))
+
+
+def _local_search(path: RoutePath, neighbors: np.ndarray, active_nodes: Sequence[int],
+                  deadline: Optional[float], kinds: Tuple[str, ...]) -> bool:
+    """Best-improvement moves per node with don't-look bits; False if the deadline cut it short."""
+    active = deque(active_nodes)
+    queued = np.zeros(len(path.costs), dtype=bool)
+    queued[list(active_nodes)] = True
+    while active:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        a = active.popleft()
+        queued[a] = False
+        candidates = neighbors[a]
+        moves = path.two_opt_moves(a, candidates)
+        if "or" in kinds:
+            moves += path.or_opt_moves(a, candidates)
+        if "swap" in kinds:
+            moves += path.swap_moves(a, candidates, neighbors)
+        best, best_delta = None, -IMPROVEMENT_EPS
+        for move in moves:
+            d = path.delta(move)
+            if d < best_delta:
+                best, best_delta = move, d
+        if best is None:
+            continue
+        # a may have more to gain, so it goes back in the queue too
+        for node in path.apply(best) + [a]:
+            if not queued[node]:
+                queued[node] = True
+                active.append(node)
+    return True
+
+
+def _best_two_opt(path: RoutePath) -> Tuple[int, int, float]:
+    """Best reversal over all (i, k) pairs, evaluated in one vectorized sweep."""
+    c, t, n = path.costs, path.t, path.n
+    i = np.arange(n)[:, None]
+    k = np.arange(n)[None, :]
+    valid = (i >= 1) & (k > i) & (k <= path.last)
+    prev, first, end = t[np.maximum(i - 1, 0)], t[i], t[k]
+    nxt = t[np.minimum(k + 1, n - 1)]
+    d = (c[prev, end] - c[prev, first] + (path.rev[k] - path.rev[i]) - (path.fwd[k] - path.fwd[i])
+         + np.where(k + 1 < n, c[first, nxt] - c[end, nxt], 0.0))
+    d = np.where(valid, d, np.inf)
+    flat = int(np.argmin(d))
+    return flat // n, flat % n, float(d.flat[flat])
+
+
+def two_opt_improvement(matrix_dist: CostMatrix, order: List[int], max_iterations: int = 200,
+                        time_budget_s: Optional[float] = None, neighbors: Optional[np.ndarray] = None,
+                        fixed_end: bool = True) -> List[int]:
+    """2-opt local search with O(1) move evaluation.
+
+    Keeps the first node fixed, and the last one unless fixed_end is False.
+    Each node tries the reversals that connect it to its candidate neighbors
+    (a SparseCostMatrix's own candidates, or neighbor_lists); nodes whose
+    path neighbors have not changed since they last failed are skipped
+    (don't-look bits). When no node is left, one vectorized sweep over every
+    reversal either confirms a full 2-opt optimum or re-activates the nodes
+    of the move it finds. max_iterations caps those sweeps and time_budget_s
+    bounds the wall-clock time; either way the best route so far is returned.
+    """
+    if len(order) <= 3:
+        return order
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    costs = finite_costs(matrix_dist)
+    neighbors = _candidate_lists(matrix_dist, costs, neighbors)
+    path = RoutePath(costs, order, fixed_end)
+    active: Sequence[int] = order
+    for _ in range(max_iterations + 1):
+        if not _local_search(path, neighbors, active, deadline, ("2opt",)):
+            break
+        if path.n > FULL_SWEEP_MAX_NODES:
+            break
+        i, k, d = _best_two_opt(path)
+        if d >= -IMPROVEMENT_EPS:
+            break
+        active = path.apply(("2opt", i, k))
+    return path.t.tolist()
+
+
+def local_improvement(matrix_dist: CostMatrix, order: List[int], active_nodes: Sequence[int],
+                      fixed_end: bool = True, time_budget_s: Optional[float] = None) -> List[int]:
+    """2-opt, or-opt and 3-opt moves starting from active_nodes only.
+
+    For a route that changed in one place (a stop added or dropped): nodes
+    join the queue only when a move touches them, so the work stays near
+    the change. order must visit every node of the matrix.
+    """
+    if len(order) <= 3:
+        return list(order)
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    costs = finite_costs(matrix_dist)
+    path = RoutePath(costs, list(order), fixed_end)
+    _local_search(path, neighbor_lists(costs), active_nodes, deadline, ("2opt", "or", "swap"))
+    return path.t.tolist()
+
+
+def chained_local_search(matrix_dist: CostMatrix, order: List[int], time_budget_s: Optional[float] = 1.0,
+                         neighbors: Optional[np.ndarray] = None, fixed_end: bool = True,
+                         max_stale_kicks: Optional[int] = None, seed: int = 0,
+                         on_improvement: Optional[Callable[[List[int], float], None]] = None,
+                         stop: Optional[threading.Event] = None) -> List[int]:
+    """Lin-Kernighan style chained local search; correct for asymmetric costs.
+
+    Descends with 2-opt (priced exactly for reversed segments), or-opt
+    (segments of up to OR_OPT_MAX_SEGMENT stops moved, either way round) and
+    3-opt segment exchanges (no reversal), then repeatedly kicks the best
+    route with a random double bridge and descends again from the stops the
+    kick touched, keeping the result only if it is cheaper. Stops after
+    max_stale_kicks kicks in a row without improvement (default 5 per stop)
+    or when time_budget_s runs out. Same fixed start/end rules as
+    two_opt_improvement. on_improvement, if given, gets every new best
+    route and its cost as the search finds it; setting stop ends the search
+    after the current kick.
+    """
+    if len(order) <= 3:
+        return order
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    costs = finite_costs(matrix_dist)
+    neighbors = _candidate_lists(matrix_dist, costs, neighbors)
+    path = RoutePath(costs, order, fixed_end)
+    kinds = ("2opt", "or", "swap")
+    _local_search(path, neighbors, order, deadline, kinds)
+    best_t, best_cost = path.t.copy(), path.cost()
+    if on_improvement is not None:
+        on_improvement(best_t.tolist(), best_cost)
+    # A double bridge needs two segments between the fixed ends
+    if path.last < 3:
+        return best_t.tolist()
+    rng = np.random.default_rng(seed)
+    limit = max_stale_kicks if max_stale_kicks is not None else max(50, 5 * path.n)
+    stale = 0
+    while stale < limit and (deadline is None or time.monotonic() < deadline) and not (stop and stop.is_set()):
+        touched = path.double_bridge(rng)
+        _local_search(path, neighbors, touched, deadline, kinds)
+        if path.cost() < best_cost - IMPROVEMENT_EPS:
+            best_t, best_cost = path.t.copy(), path.cost()
+            stale = 0
+            if on_improvement is not None:
+                on_improvement(best_t.tolist(), best_cost)
+        else:
+            path.set(best_t.copy())
+            stale += 1
+    return best_t.tolist()
+
+
+def _route_cost_reference(matrix_dist: List[List[float]], order: List[int]) -> float:
+    total = 0.0
+    for i in range(len(order) - 1):
+        total += float(matrix_dist[order[i]][order[i + 1]])
+    return total
+
+
+def two_opt_improvement_reference(matrix_dist: CostMatrix, order: List[int], max_iterations: int = 200) -> List[int]:
+    """Simple 2-opt local search to improve a given route order.
+    Keeps first and last nodes fixed; improves internal sequence for lower total distance.
+    Rebuilds and re-costs the route for every move (O(n^3) per pass); kept as the
+    reference that two_opt_improvement is benchmarked and checked against.
+    """
+    if len(order) <= 3:
+        return order
+    costs = as_cost_array(matrix_dist).tolist()
+    best = order[:]
+    best_cost = _route_cost_reference(costs, best)
+    n = len(order)
+    iterations = 0
+    improved = True
+    while improved and iterations < max_iterations:
+        improved = False
+        iterations += 1
+        # Do not swap the very first index to preserve start
+        for i in range(1, n - 2):
+            for k in range(i + 1, n - 1):
+                # Create new order by reversing the segment [i:k]
+                new_order = best[:i] + list(reversed(best[i:k + 1])) + best[k + 1:]
+                new_cost = _route_cost_reference(costs, new_order)
+                if new_cost + 1e-9 < best_cost:
+                    best = new_order
+                    best_cost = new_cost
+                    improved = True
+        # loop again if improved
+    return best
+
+
+def _nearest_neighbor_with_start(matrix: CostMatrix, start_index: int) -> List[int]:
+    return nearest_neighbor_order(matrix, start_index)
+
+
+def _randomized_nearest_neighbor(costs: np.ndarray, start: int, rng: np.random.Generator) -> List[int]:
+    """Nearest neighbor that picks among the RANDOM_NN_CHOICES cheapest next stops, favoring closer ones."""
+    n = len(costs)
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    order = [start]
+    weights = 1.0 / np.arange(1, RANDOM_NN_CHOICES + 1)
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, costs[order[-1]])
+        choices = min(RANDOM_NN_CHOICES, n - len(order))
+        nearest = np.argpartition(row, choices - 1)[:choices]
+        nearest = nearest[np.argsort(row[nearest])]
+        pick = int(rng.choice(nearest, p=weights[:choices] / weights[:choices].sum()))
+        order.append(pick)
+        visited[pick] = True
+    return order
+
+
+def _regret_insertion(costs: np.ndarray, start: int, rng: Optional[np.random.Generator]) -> List[int]:
+    """Regret-2 insertion: repeatedly insert the stop that would lose most by waiting for its second-best slot.
+
+    With an rng, insertion costs get multiplicative noise so each start builds a different route.
+    """
+    n = len(costs)
+    noisy = costs if rng is None else costs * rng.uniform(1.0, 1.0 + REGRET_NOISE, costs.shape)
+    order = [start]
+    pending = np.array([i for i in range(n) if i != start], dtype=np.int64)
+    while len(pending):
+        path = np.array(order)
+        # Slot p sits after order[p]; the last slot appends to the open end
+        after = noisy[path][:, pending]
+        before = noisy[pending][:, path[1:]].T
+        replaced = noisy[path[:-1], path[1:]][:, None]
+        slots = np.vstack((after[:-1] + before - replaced, after[-1:]))
+        if len(slots) > 1:
+            two = np.partition(slots, 1, axis=0)[:2]
+            regret = two[1] - two[0]
+            u = int(np.argmax(regret - 1e-9 * two[0]))
+        else:
+            u = int(np.argmin(slots[0]))
+        slot = int(np.argmin(slots[:, u]))
+        order.insert(slot + 1, int(pending[u]))
+        pending = np.delete(pending, u)
+    return order
+
+
+def _construct(costs: np.ndarray, start: int, seed: int) -> List[int]:
+    """Start number seed: 0 is plain nearest neighbor, 1 plain regret insertion, then randomized variants."""
+    n = len(costs)
+    rng = np.random.default_rng(seed)
+    use_regret = seed % 2 == 1 and n <= REGRET_MAX_STOPS
+    if seed <= 1:
+        return _regret_insertion(costs, start, None) if use_regret else nearest_neighbor_order(costs, start)
+    if use_regret:
+        return _regret_insertion(costs, start, rng)
+    return _randomized_nearest_neighbor(costs, start, rng)
+
+
+def _run_starts(costs: np.ndarray, start: int, seeds: Sequence[int], deadline: Optional[float],
+                end: Optional[int] = None, at_least_one: bool = True) -> Tuple[float, List[int], int]:
+    """Construct and improve one route per seed until the deadline (time.time()); returns (cost, order, starts).
+
+    The first start runs even past the deadline unless at_least_one is False.
+    """
+    if not at_least_one and deadline is not None and time.time() >= deadline:
+        return np.inf, [], 0
+    neighbors = neighbor_lists(costs)
+    best_cost, best_order, done = np.inf, list(range(len(costs))), 0
+    for seed in seeds:
+        if done and deadline is not None and time.time() >= deadline:
+            break
+        order = _construct(costs, start, seed)
+        if end is not None:
+            order.remove(end)
+            order.append(end)
+        fixed_end = end is not None
+        remaining = None if deadline is None else max(0.0, deadline - time.time())
+        order = two_opt_improvement(costs, order, time_budget_s=remaining, neighbors=neighbors, fixed_end=fixed_end)
+        remaining = None if deadline is None else max(0.0, deadline - time.time())
+        order = chained_local_search(costs, order, time_budget_s=remaining, neighbors=neighbors,
+                                     fixed_end=fixed_end, max_stale_kicks=len(costs), seed=seed)
+        cost = _route_cost(costs, order)
+        if cost < best_cost:
+            best_cost, best_order = cost, order
+        done += 1
+    return float(best_cost), best_order, done
+
+
+def _multistart_worker(shm_name: str, n: int, start: int, seeds: Sequence[int], deadline: Optional[float],
+                       end: Optional[int]) -> Tuple[float, List[int], int]:
+    """Process pool entry point: runs _run_starts on the matrix in shared memory.
+
+    A task that only gets a worker after the deadline (the pool is shared
+    by concurrent plans) returns no start rather than overrunning it.
+    """
+    if deadline is not None and time.time() >= deadline:
+        return np.inf, [], 0
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return _run_starts(np.ndarray((n, n), dtype=np.float64, buffer=shm.buf), start, seeds, deadline, end,
+                           at_least_one=False)
+    finally:
+        shm.close()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def start_pool(workers: int) -> ProcessPoolExecutor:
+    """The shared optimizer process pool, created (and its processes spawned) on first use."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(POOL_START_METHOD)
+            if POOL_START_METHOD == "forkserver":
+                # Workers only need this module, not the app that started the pool
+                context.set_forkserver_preload(["route_optimizer"])
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+            for future in [_pool.submit(time.sleep, 0.1) for _ in range(workers)]:
+                future.result()
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def multistart_search(matrix: CostMatrix, start: int, time_budget_s: Optional[float] = None,
+                      workers: int = 1, max_starts: Optional[int] = None, end: Optional[int] = None) -> List[int]:
+    """Best route over many constructions, each improved by 2-opt and chained local search.
+
+    Starts alternate between nearest neighbor and regret insertion, the
+    first of each deterministic and the rest randomized. With workers > 1
+    they run across the process pool, which reads the matrix from shared
+    memory rather than a pickled copy per task. Without a time budget,
+    max_starts (default MULTISTART_DEFAULT_STARTS) starts run; with one,
+    starts continue until the budget is spent (each worker finishes at
+    least one). The route ends at end if given, otherwise anywhere.
+    """
+    costs = np.ascontiguousarray(finite_costs(matrix), dtype=np.float64)
+    n = len(costs)
+    if max_starts is None:
+        max_starts = MULTISTART_DEFAULT_STARTS if time_budget_s is None else MULTISTART_MAX_STARTS
+    deadline = None if time_budget_s is None else time.time() + time_budget_s
+    workers = max(1, min(workers, max_starts))
+    if workers == 1:
+        return _run_starts(costs, start, range(max_starts), deadline, end)[1]
+
+    shm = shared_memory.SharedMemory(create=True, size=costs.nbytes)
+    try:
+        np.ndarray(costs.shape, dtype=np.float64, buffer=shm.buf)[:] = costs
+        pool = start_pool(workers)
+        workers = min(workers, _pool_workers)
+        futures = [pool.submit(_multistart_worker, shm.name, n, start, range(w, max_starts, workers),
+                               deadline, end)
+                   for w in range(workers)]
+        results = [result for result in (future.result() for future in futures) if result[2]]
+    except Exception as e:
+        logger.warning(f"⚠️ Parallel multistart failed ({e}); running in-process")
+        results = [_run_starts(costs, start, range(max_starts), deadline, end)]
+    finally:
+        shm.close()
+        shm.unlink()
+    if not results:
+        # Every task waited out the budget behind other plans: the plain nearest neighbor start only
+        logger.warning("⚠️ Multistart pool busy past the deadline; using the first start without search")
+        results = [_run_starts(costs, start, [0], time.time(), end)]
+    best_cost, best_order, _ = min(results, key=lambda r: r[0])
+    logger.info(f"🔀 Multistart: {sum(r[2] for r in results)} starts on {len(results)} worker(s), "
+                f"best cost {best_cost:.1f}")
+    return best_order
+
+
+def held_karp(matrix_dist: CostMatrix, start: int = 0, end: Optional[int] = None) -> Tuple[List[int], float]:
+    """Exact cheapest order by bitmask dynamic programming; returns (order, cost).
+
+    end is None for a free end, another stop's index to finish there, or
+    start itself for a closed tour (the cost then includes the way back;
+    the order does not repeat start). dp[S, j] is the cheapest path from
+    start through the stop set S ending at j. Subsets are processed one
+    popcount layer at a time, each layer in a few NumPy operations per
+    stop, so the work is O(2^m m^2) for m free stops; keep m small
+    (HELD_KARP_MAX_STOPS).
+    """
+    costs = finite_costs(matrix_dist)
+    n = len(costs)
+    closed = end == start
+    free = [i for i in range(n) if i != start and (closed or i != end)]
+    m = len(free)
+    if m == 0:
+        order = [start] if end is None or closed else [start, end]
+        return order, _path_cost(costs, order, closed)
+    nodes = np.array(free)
+    full = (1 << m) - 1
+    dp = np.full((1 << m, m), np.inf)
+    parent = np.full((1 << m, m), -1, dtype=np.int8 if m < 127 else np.int16)
+    bits = 1 << np.arange(m)
+    dp[bits, np.arange(m)] = costs[start, nodes]
+    sub = costs[np.ix_(nodes, nodes)]
+    subsets = np.arange(1 << m)
+    popcount = np.zeros(1 << m, dtype=np.int64)
+    for b in range(m):
+        popcount += (subsets >> b) & 1
+    for size in range(2, m + 1):
+        layer = subsets[popcount == size]
+        for j in range(m):
+            with_j = layer[(layer & bits[j]) != 0]
+            cand = dp[with_j ^ bits[j]] + sub[:, j][None, :]
+            best = np.argmin(cand, axis=1)
+            dp[with_j, j] = cand[np.arange(len(with_j)), best]
+            parent[with_j, j] = best
+    if end is None:
+        final = dp[full]
+    else:
+        final = dp[full] + costs[nodes, end]
+    last = int(np.argmin(final))
+    cost = float(final[last])
+    path = []
+    mask = full
+    while last >= 0:
+        path.append(int(nodes[last]))
+        prev = int(parent[mask, last])
+        mask ^= 1 << last
+        last = prev
+    order = [start] + path[::-1]
+    if end is not None and not closed:
+        order.append(end)
+    return order, cost
+
+
+def _path_cost(costs: np.ndarray, order: List[int], closed: bool = False) -> float:
+    cost = _route_cost(costs, order) if len(order) > 1 else 0.0
+    if closed and len(order) > 1:
+        cost += float(costs[order[-1], order[0]])
+    return cost
+
+
+def _to_start_copy(costs: np.ndarray, start: int) -> np.ndarray:
+    """costs plus a copy of start (index n) that can only be arrived at; a path ending there is a closed tour."""
+    n = len(costs)
+    extended = np.full((n + 1, n + 1), np.inf)
+    extended[:n, :n] = costs
+    extended[:n, n] = costs[:, start]
+    extended[n, n] = 0.0
+    return extended
+
+
+def _heuristic_order(costs: np.ndarray, start: int, end: Optional[int]) -> List[int]:
+    """Nearest neighbor plus 2-opt, with end (if any) kept last; the baseline exact solves are compared with."""
+    order = nearest_neighbor_order(costs, start)
+    if end is not None and end != start:
+        order.remove(end)
+        order.append(end)
+    return two_opt_improvement(costs, order, fixed_end=end is not None and end != start)
+
+
+@dataclass
+class OrderResult:
+    order: List[int]
+    cost: float
+    method: str  # "sequential", "held_karp", "multistart", "time_dependent", "decomposition", "hilbert" or "anytime"
+    optimal: bool
+    heuristic_cost: Optional[float] = None  # nearest neighbor + 2-opt (time_dependent: the time-independent order;
+                                            # decomposition: the Hilbert curve order; anytime: nearest neighbor)
+    gap_percent: Optional[float] = None  # how much costlier the heuristic was than the returned order
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "optimal": self.optimal,
+            "cost": round(self.cost, 2),
+            "heuristic_cost": round(self.heuristic_cost, 2) if self.heuristic_cost is not None else None,
+            "gap_percent": round(self.gap_percent, 2) if self.gap_percent is not None else None,
+        }
+
+
+def optimize_order(matrix: CostMatrix, start: int, end: Optional[int] = None,
+                   time_budget_s: Optional[float] = None, workers: int = 1,
+                   exact_max_stops: int = HELD_KARP_MAX_STOPS) -> OrderResult:
+    """Cheapest order from start (ending at end, if given; end == start closes the tour).
+
+    Routes of up to exact_max_stops stops are solved exactly with Held-Karp,
+    and the nearest neighbor + 2-opt route is priced too so its gap to the
+    optimum is visible. Larger routes use multistart_search.
+    """
+    costs = finite_costs(matrix)
+    n = len(costs)
+    closed = end == start
+    if n <= exact_max_stops:
+        order, cost = held_karp(costs, start, end)
+        heuristic_cost = _path_cost(costs, _heuristic_order(costs, start, end), closed)
+        gap = 100.0 * (heuristic_cost - cost) / cost if cost > 0 else 0.0
+        return OrderResult(order, cost, "held_karp", True, heuristic_cost, gap)
+    if closed:
+        # Route to a copy of start instead: same cost, and the copy is a fixed end
+        order = multistart_search(_to_start_copy(costs, start), start, time_budget_s=time_budget_s,
+                                  workers=workers, end=n)[:-1]
+    else:
+        order = multistart_search(costs, start, time_budget_s=time_budget_s, workers=workers, end=end)
+    return OrderResult(order, _path_cost(costs, order, closed), "multistart", False)
+
+
+def anytime_search(matrix: CostMatrix, start: int, end: Optional[int] = None,
+                   time_budget_s: Optional[float] = 1.0,
+                   on_improvement: Optional[Callable[[List[int], float], None]] = None,
+                   stop: Optional[threading.Event] = None) -> OrderResult:
+    """Nearest neighbor order at once, then 2-opt and chained local search until time_budget_s.
+
+    on_improvement gets the nearest neighbor order first and then every
+    cheaper order as it is found, so callers can use a good-enough route
+    while the search goes on; setting stop returns the best order so far
+    early. Same start/end rules as optimize_order.
+    """
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    costs = finite_costs(matrix)
+    n = len(costs)
+    closed = end == start
+    if closed:
+        costs, end = _to_start_copy(costs, start), n
+    fixed_end = end is not None
+    best = [np.inf]
+
+    def report(order: List[int], cost: float) -> None:
+        if cost < best[0] - IMPROVEMENT_EPS:
+            best[0] = cost
+            if on_improvement is not None:
+                on_improvement(order[:n], cost)
+
+    order = nearest_neighbor_order(costs[:n, :n], start)
+    if fixed_end:
+        if not closed:
+            order.remove(end)
+        order.append(end)
+    nn_cost = _route_cost(costs, order)
+    report(order, nn_cost)
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    order = two_opt_improvement(costs, order, time_budget_s=remaining, fixed_end=fixed_end)
+    report(order, _route_cost(costs, order))
+    if (deadline is None or deadline - time.monotonic() > 0) and not (stop and stop.is_set()):
+        remaining = None if deadline is None else deadline - time.monotonic()
+        order = chained_local_search(costs, order, time_budget_s=remaining, fixed_end=fixed_end,
+                                     on_improvement=report, stop=stop)
+    cost = _route_cost(costs, order)
+    gap = 100.0 * (nn_cost - cost) / cost if cost > 0 else 0.0
+    return OrderResult(order[:n], cost, "anytime", False, nn_cost, gap)
+
+
+def build_best_order_multistart(matrix: CostMatrix, prefer_start: int = 0,
+                                time_budget_s: Optional[float] = None, workers: int = 1,
+                                end_index: Optional[int] = None) -> List[int]:
+    """Always start from the preferred start point and optimize from there."""
+    return build_best_order(matrix, prefer_start, time_budget_s, workers, end_index).order
+
+
+def build_best_order(matrix: CostMatrix, prefer_start: int = 0, time_budget_s: Optional[float] = None,
+                     workers: int = 1, end_index: Optional[int] = None) -> OrderResult:
+    """build_best_order_multistart with the solver details (method, optimality, heuristic gap)."""
+    n = len(matrix)
+    if n <= 1:
+        return OrderResult(list(range(n)), 0.0, "sequential", False)
+
+    # For delivery routes, use simple sequential order starting from current location
+    # This ensures we visit all stops in the order they were added
+    if prefer_start == 0:
+        # If starting from current location (index 0), use sequential order
+        order = list(range(n))
+        logger.info(f"📍 Using sequential delivery order: {order}")
+        return OrderResult(order, _path_cost(finite_costs(matrix), order), "sequential", False)
+
+    # For other cases: exact below the size threshold, multistart search above (see optimize_order)
+    result = optimize_order(matrix, prefer_start, end_index, time_budget_s=time_budget_s, workers=workers)
+    logger.info(f"📍 Using optimized order ({result.method}): {result.order}")
+    if result.gap_percent is not None:
+        logger.info(f"  Nearest neighbor + 2-opt would cost {result.gap_percent:.1f}% more")
+    return result
@@ -0,0 +1,157 @@
+"""Live route sessions: a planned route kept server-side so stops can be added or dropped mid-shift.
+
+A session holds every location the route has seen (removed stops keep
+their index), the travel-time matrix between them and the driven legs
+already fetched. Changing the route reuses all of that; only the legs the
+new order has not driven before need directions.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from route_optimizer import finite_costs, local_improvement
+
+Leg = Tuple[int, int]
+
+
+@dataclass
+class RouteSession:
+    route_id: str
+    addresses: List[str]                # every location ever on the route, by location index
+    coords: List[Tuple[float, float]]   # (lat, lon) per location
+    order: List[int]                    # current visiting order (location indices)
+    travel: np.ndarray                  # minutes between locations; orders insertions and removals
+    fixed_end: bool
+    distances: Optional[np.ndarray] = None  # km between locations; legs fall back to it
+    start_time: Optional[str] = None
+    legs: Dict[Leg, Optional[Tuple[float, float]]] = field(default_factory=dict)  # (km, minutes) per driven leg
+    geometry: Dict[Leg, List[List[float]]] = field(default_factory=dict)          # [lon, lat] points per leg
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    touched: float = field(default_factory=time.monotonic)
+
+    def index_of(self, address: str) -> Optional[int]:
+        """Location index of address if it is currently on the route."""
+        for i in self.order:
+            if self.addresses[i] == address:
+                return i
+        return None
+
+    @property
+    def cells(self) -> int:
+        """Matrix cells the session keeps in memory (travel plus distances)."""
+        return self.travel.size + (0 if self.distances is None else self.distances.size)
+
+    def missing_legs(self) -> List[List[int]]:
+        """Stretches of the order (as location lists) made of legs without directions yet."""
+        runs: List[List[int]] = []
+        for a, b in zip(self.order, self.order[1:]):
+            if (a, b) in self.legs:
+                continue
+            if runs and runs[-1][-1] == a:
+                runs[-1].append(b)
+            else:
+                runs.append([a, b])
+        return runs
+
+
+class RouteSessionStore:
+    """In-memory sessions, least recently used first out, dropped after ttl_seconds idle.
+
+    Memory is bounded by max_cells, the matrix cells held across all sessions
+    (the most recently used session is always kept), as well as by max_sessions.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 12 * 3600,
+                 max_cells: int = 20_000_000):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_cells = max_cells
+        self._sessions: "OrderedDict[str, RouteSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _evict(self) -> None:
+        """Drop least recently used sessions until both bounds hold (caller holds the lock)."""
+        cells = sum(session.cells for session in self._sessions.values())
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or cells > self.max_cells):
+            _, session = self._sessions.popitem(last=False)
+            cells -= session.cells
+            self.evictions += 1
+
+    def create(self, **fields: Any) -> RouteSession:
+        session = RouteSession(route_id=uuid.uuid4().hex, **fields)
+        with self._lock:
+            self._sessions[session.route_id] = session
+            self._evict()
+        return session
+
+    def resized(self, session: RouteSession) -> None:
+        """Re-apply the memory bound after session's matrices grew."""
+        with self._lock:
+            if session.route_id in self._sessions:
+                self._sessions.move_to_end(session.route_id)
+                self._evict()
+
+    def get(self, route_id: str) -> Optional[RouteSession]:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(route_id)
+            if session is None:
+                return None
+            if now - session.touched > self.ttl_seconds:
+                del self._sessions[route_id]
+                return None
+            session.touched = now
+            self._sessions.move_to_end(route_id)
+            return session
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions,
+                    "cells": sum(session.cells for session in self._sessions.values()),
+                    "max_cells": self.max_cells, "evictions": self.evictions}
+
+
+def _improve_around(session: RouteSession, order: List[int], active: Set[int],
+                    time_budget_s: Optional[float]) -> List[int]:
+    """Local search on the route's own nodes, seeded with the locations next to the change."""
+    nodes = np.asarray(order)
+    local = {int(node): p for p, node in enumerate(nodes)}
+    improved = local_improvement(session.travel[np.ix_(nodes, nodes)], list(range(len(nodes))),
+                                 [local[a] for a in active if a in local], session.fixed_end, time_budget_s)
+    return [int(nodes[p]) for p in improved]
+
+
+def insert_stop(session: RouteSession, stop: int, time_budget_s: Optional[float] = None) -> List[int]:
+    """New order with stop at its cheapest slot, then improved around it (session.order is not changed).
+
+    The start stays first, and a fixed end stays last.
+    """
+    costs = finite_costs(session.travel)
+    path = np.asarray(session.order)
+    added = costs[path[:-1], stop] + costs[stop, path[1:]] - costs[path[:-1], path[1:]]
+    if not session.fixed_end:
+        # Appending after the last stop is a slot too
+        added = np.append(added, costs[path[-1], stop])
+    slot = int(np.argmin(added))
+    order = session.order[:slot + 1] + [stop] + session.order[slot + 1:]
+    active = {stop, order[slot]} | ({order[slot + 2]} if slot + 2 < len(order) else set())
+    return _improve_around(session, order, active, time_budget_s)
+
+
+def remove_stop(session: RouteSession, stop: int, time_budget_s: Optional[float] = None) -> List[int]:
+    """New order without stop, improved around the gap it leaves (session.order is not changed)."""
+    p = session.order.index(stop)
+    order = session.order[:p] + session.order[p + 1:]
+    active = {order[p - 1]} | ({order[p]} if p < len(order) else set())
+    return _improve_around(session, order, active, time_budget_s)
@@ -0,0 +1,122 @@
+"""Sparse k-nearest cost matrices.
+
+Route optimizers mostly look at short edges, so only each stop's k nearest
+candidates (by straight-line distance) are requested from the provider.
+Every other cell holds a conservative estimate so optimizers still see a
+full array, but avoid guessed edges whenever a measured one is comparable.
+"""
+
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from approx_matrix import haversine_matrix
+
+# Unrequested cells are estimated with this safety margin on top of the approximation
+ESTIMATE_MARGIN = 1.25
+# Grouped requests may fetch this many times the cells they need; provider quotas
+# count requests rather than cells, and the extra cells are cached
+MAX_OVERFETCH = 10.0
+
+
+@dataclass
+class SparseCostMatrix:
+    values: np.ndarray     # n x n costs: measured where known, estimated elsewhere, inf if unroutable
+    known: np.ndarray      # n x n bool, True where values came from the provider
+    neighbors: np.ndarray  # n x k candidate indices per stop, nearest first
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        # Lets matrix[i][j] code read it like a list of lists
+        return self.values[i]
+
+    def known_fraction(self) -> float:
+        n = len(self)
+        return float(self.known.sum() - n) / max(1, n * n - n)
+
+
+def knn_candidates(coords_latlon: Sequence[Tuple[float, float]], k: int) -> np.ndarray:
+    """n x min(k, n-1) indices of each stop's nearest other stops by haversine distance."""
+    n = len(coords_latlon)
+    k = max(0, min(k, n - 1))
+    if k == 0:
+        return np.zeros((n, 0), dtype=np.int64)
+    hav = haversine_matrix(coords_latlon)
+    np.fill_diagonal(hav, np.inf)
+    nearest = np.argpartition(hav, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(hav, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+
+def needed_cells(neighbors: np.ndarray) -> np.ndarray:
+    """Cells to measure: both directions of every candidate edge (2-opt reverses segments)."""
+    n = neighbors.shape[0]
+    needed = np.zeros((n, n), dtype=bool)
+    if neighbors.size:
+        needed[np.repeat(np.arange(n), neighbors.shape[1]), neighbors.ravel()] = True
+    needed |= needed.T
+    np.fill_diagonal(needed, False)
+    return needed
+
+
+def _z_order(coords_latlon: Sequence[Tuple[float, float]]) -> np.ndarray:
+    """Stop indices sorted along a Morton curve, so consecutive stops are close together."""
+    pts = np.asarray(coords_latlon, dtype=np.float64).reshape(-1, 2)
+    lo, hi = pts.min(axis=0), pts.max(axis=0)
+    scaled = ((pts - lo) / np.maximum(hi - lo, 1e-12) * 65535).astype(np.uint64)
+    code = np.zeros(len(pts), dtype=np.uint64)
+    for bit in range(16):
+        for axis in (0, 1):
+            code |= ((scaled[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + axis)
+    return np.argsort(code, kind="stable")
+
+
+def plan_sparse_blocks(coords_latlon: Sequence[Tuple[float, float]], missing: np.ndarray,
+                       max_locations: int, max_elements: int,
+                       max_overfetch: float = MAX_OVERFETCH) -> List[Tuple[List[int], List[int]]]:
+    """Group missing cells into (sources, destinations) requests within provider limits.
+
+    Nearby sources share most of their candidates, so sources are taken in
+    Morton order and grouped while the union of their destinations stays
+    small. A group's rectangle may hold at most max_overfetch times the cells
+    it needs; the extra cells are cached like any other.
+    """
+    blocks: List[Tuple[List[int], List[int]]] = []
+    sources: List[int] = []
+    destinations: set = set()
+    wanted = 0
+    for i in _z_order(coords_latlon):
+        row = set(np.nonzero(missing[i])[0].tolist())
+        if not row:
+            continue
+        merged = destinations | row
+        cells = (len(sources) + 1) * len(merged)
+        locations = len(merged | set(sources) | {int(i)})
+        if sources and (cells > max_elements or locations > max_locations
+                        or cells > max_overfetch * (wanted + len(row))):
+            blocks.append((sources, sorted(destinations)))
+            sources, merged, wanted = [], row, 0
+        sources.append(int(i))
+        destinations = merged
+        wanted += len(row)
+    if sources:
+        blocks.append((sources, sorted(destinations)))
+    return blocks
+
+
+def build_sparse(measured: np.ndarray, requested: np.ndarray, estimate: np.ndarray,
+                 neighbors: np.ndarray) -> SparseCostMatrix:
+    """Combine measured cells (NaN where absent) with an estimate for the rest.
+
+    Requested cells the provider left empty are unroutable and become inf.
+    """
+    known = ~np.isnan(measured)
+    values = np.where(known, measured, estimate * ESTIMATE_MARGIN)
+    values[requested & ~known] = np.inf
+    np.fill_diagonal(values, 0.0)
+    known = known.copy()
+    np.fill_diagonal(known, True)
+    return SparseCostMatrix(values=values, known=known, neighbors=neighbors)
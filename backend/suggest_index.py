@@ -0,0 +1,187 @@
+"""In-memory autocomplete index over addresses we have already geocoded.
+
+Every entry's tokens are indexed by their prefixes (edge n-grams) for
+type-ahead matching, and by character trigrams as a typo-tolerant fallback.
+Results are ranked by match quality, how often the address has been used,
+and (optionally) distance from the user.
+"""
+
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from geocode_cache import normalize_address
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+MAX_PREFIX_LEN = 10
+MAX_CANDIDATES = 2000
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._norm: List[str] = []
+        self._lat = np.zeros(0, dtype=np.float64)
+        self._lon = np.zeros(0, dtype=np.float64)
+        self._freq = np.zeros(0, dtype=np.float64)
+        self._size = 0
+        self._prefixes: Dict[str, Set[int]] = defaultdict(set)
+        self._trigram_index: Dict[str, Set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _grow(self) -> None:
+        capacity = max(1024, len(self._lat) * 2)
+        for name in ("_lat", "_lon", "_freq"):
+            arr = getattr(self, name)
+            grown = np.zeros(capacity, dtype=np.float64)
+            grown[:len(arr)] = arr
+            setattr(self, name, grown)
+
+    def add(self, address: str, lat: float, lon: float, count: int = 1) -> None:
+        """Insert an address or bump its frequency if already indexed."""
+        key = normalize_address(address)
+        if not key:
+            return
+        with self._lock:
+            idx = self._keys.get(key)
+            if idx is not None:
+                self._freq[idx] += count
+                self._lat[idx], self._lon[idx] = lat, lon
+                return
+            idx = self._size
+            if idx >= len(self._lat):
+                self._grow()
+            self._keys[key] = idx
+            self._names.append(address.strip())
+            self._norm.append(key)
+            self._lat[idx], self._lon[idx], self._freq[idx] = lat, lon, count
+            self._size += 1
+            for tok in set(_tokens(key)):
+                for n in range(1, min(len(tok), MAX_PREFIX_LEN) + 1):
+                    self._prefixes[tok[:n]].add(idx)
+                if len(tok) >= 3:
+                    for tg in _trigrams(tok):
+                        self._trigram_index[tg].add(idx)
+
+    def add_many(self, rows: Iterable[Tuple[str, float, float, int]]) -> None:
+        for address, lat, lon, count in rows:
+            self.add(address, lat, lon, count)
+
+    def _prefix_candidates(self, tokens: List[str]) -> Optional[Set[int]]:
+        sets = []
+        for tok in tokens:
+            postings = self._prefixes.get(tok[:MAX_PREFIX_LEN])
+            if not postings:
+                return None
+            sets.append(postings)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                return None
+        if any(len(tok) > MAX_PREFIX_LEN for tok in tokens):
+            # Prefix index is capped; confirm long tokens against the full text
+            long_tokens = [t for t in tokens if len(t) > MAX_PREFIX_LEN]
+            result = {i for i in result if all(t in self._norm[i] for t in long_tokens)}
+        return result
+
+    def _fuzzy_candidates(self, tokens: List[str]) -> Dict[int, float]:
+        counts: Dict[int, int] = defaultdict(int)
+        grams: Set[str] = set()
+        for tok in tokens:
+            if len(tok) >= 3:
+                grams |= _trigrams(tok)
+        for tg in grams:
+            for idx in self._trigram_index.get(tg, ()):
+                counts[idx] += 1
+        if not grams:
+            return {}
+        threshold = max(2, int(len(grams) * 0.5))
+        return {idx: c / len(grams) for idx, c in counts.items() if c >= threshold}
+
+    def search(self, query: str, limit: int = 5,
+               near: Optional[Tuple[float, float]] = None) -> List[Dict[str, object]]:
+        """Ranked suggestions in the /search-suggestions response format."""
+        norm_query = normalize_address(query)
+        tokens = _tokens(norm_query)
+        if not tokens:
+            return []
+        with self._lock:
+            candidates = self._prefix_candidates(tokens)
+            if candidates:
+                ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                quality = np.array([1.0 if self._norm[i].startswith(norm_query) else 0.7 for i in ids])
+            else:
+                fuzzy = self._fuzzy_candidates(tokens)
+                if not fuzzy:
+                    return []
+                ids = np.fromiter(fuzzy.keys(), dtype=np.int64, count=len(fuzzy))
+                quality = np.fromiter(fuzzy.values(), dtype=np.float64, count=len(fuzzy)) * 0.5
+            if len(ids) > MAX_CANDIDATES:
+                keep = np.argsort(-self._freq[ids])[:MAX_CANDIDATES]
+                ids, quality = ids[keep], quality[keep]
+
+            scores = quality + 0.15 * np.log1p(self._freq[ids])
+            if near is not None:
+                scores -= 0.1 * np.log1p(self._haversine_km(ids, near[0], near[1]))
+            order = np.argsort(-scores)[:limit]
+            return [
+                {
+                    "display_name": self._names[ids[i]],
+                    "lat": float(self._lat[ids[i]]),
+                    "lon": float(self._lon[ids[i]]),
+                }
+                for i in order
+            ]
+
+    def _haversine_km(self, ids: np.ndarray, lat: float, lon: float) -> np.ndarray:
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2, lon2 = np.radians(self._lat[ids]), np.radians(self._lon[ids])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 6371.0 * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def load_training_addresses(db_path: str) -> List[Tuple[str, float, float, int]]:
+    """(address, lat, lon, 1) rows from the addresses/coordinates columns of training_data."""
+    rows: List[Tuple[str, float, float, int]] = []
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            records = conn.execute("SELECT addresses, coordinates FROM training_data").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return rows
+    for addresses_json, coords_json in records:
+        try:
+            addresses = json.loads(addresses_json)
+            coords = json.loads(coords_json)
+        except (TypeError, ValueError):
+            continue
+        for address, point in zip(addresses, coords):
+            if not isinstance(address, str) or not isinstance(point, (list, tuple)) or len(point) < 2:
+                continue
+            lat, lon = float(point[0]), float(point[1])
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                rows.append((address, lat, lon, 1))
+    return rows
@@ -0,0 +1,199 @@
+"""Stop ordering when travel times depend on the hour of departure.
+
+A leg leaving at route minute t costs base[i][j] * hourly[h] + leg_overhead,
+where h is the hour of day the vehicle departs in. Each hour bucket's cost
+table is built once and cached, so pricing a leg is two list lookups.
+
+Local search prices a move by re-timing only the positions it changes. A
+change shifts every later departure by the same delta. While no later
+departure crosses an hour boundary, the route's duration just shifts by
+that delta. Suffix minima of each departure's distance to its bucket edges
+tell whether that holds in O(1). Only moves that cross a boundary re-time
+the rest of the route.
+"""
+
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from route_optimizer import (CostMatrix, IMPROVEMENT_EPS, NEIGHBOR_K, OR_OPT_MAX_SEGMENT, OrderResult,
+                             finite_costs, neighbor_lists, optimize_order)
+
+HOUR_MINUTES = 60.0
+
+
+class TimeDependentCosts:
+    def __init__(self, base_minutes: CostMatrix, hourly: Sequence[float], start_minute: float,
+                 leg_overhead: float = 0.0):
+        """base_minutes: travel times before the hourly multiplier; start_minute: minute of day the route starts."""
+        self.base = finite_costs(base_minutes)
+        self.hourly = [float(m) for m in hourly]
+        self.start_minute = float(start_minute)
+        self.leg_overhead = leg_overhead
+        self._tables: Dict[int, List[List[float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def bucket(self, minute: float) -> int:
+        """Absolute hour bucket of route minute (hours since midnight of the start day)."""
+        return int((self.start_minute + minute) // HOUR_MINUTES)
+
+    def matrix(self, bucket: int) -> np.ndarray:
+        costs = self.base * self.hourly[bucket % len(self.hourly)] + self.leg_overhead
+        np.fill_diagonal(costs, 0.0)
+        return costs
+
+    def table(self, bucket: int) -> List[List[float]]:
+        """Leg costs for departures in bucket; built on first use."""
+        key = bucket % len(self.hourly)
+        table = self._tables.get(key)
+        if table is None:
+            table = self._tables[key] = self.matrix(key).tolist()
+        return table
+
+    def leg(self, i: int, j: int, minute: float) -> float:
+        return self.table(self.bucket(minute))[i][j]
+
+    def legs(self, i: np.ndarray, j: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+        """Vectorized leg: costs of i[k] -> j[k] departing at route minute minutes[k] (0 when i[k] == j[k])."""
+        buckets = np.floor((self.start_minute + np.asarray(minutes)) / HOUR_MINUTES).astype(np.int64)
+        costs = self.base[i, j] * np.asarray(self.hourly)[buckets % len(self.hourly)] + self.leg_overhead
+        return np.where(np.asarray(i) == np.asarray(j), 0.0, costs)
+
+    def departures(self, order: Sequence[int]) -> List[float]:
+        """Route minute the vehicle leaves (= reaches) every position of order."""
+        times = [0.0]
+        for a, b in zip(order, order[1:]):
+            times.append(times[-1] + self.leg(a, b, times[-1]))
+        return times
+
+    def duration(self, order: Sequence[int]) -> float:
+        return self.departures(order)[-1] if order else 0.0
+
+
+class _TimedRoute:
+    """An order with its departure times and, per position, how far all later departures may shift."""
+
+    def __init__(self, costs: TimeDependentCosts, order: List[int]):
+        self.costs = costs
+        self.set(order)
+
+    def set(self, order: List[int]) -> None:
+        self.order = order
+        self.pos = {node: p for p, node in enumerate(order)}
+        self.times = self.costs.departures(order)
+        n = len(order)
+        absolute = np.asarray(self.times) + self.costs.start_minute
+        into = absolute - np.floor(absolute / HOUR_MINUTES) * HOUR_MINUTES
+        # ahead[p]/behind[p]: the largest later/earlier shift of every departure from p on
+        # (each one followed by a leg) that keeps it in its hour bucket
+        self.ahead = np.full(n + 1, np.inf)
+        self.behind = np.full(n + 1, np.inf)
+        for p in range(n - 2, -1, -1):
+            self.ahead[p] = min(HOUR_MINUTES - into[p], self.ahead[p + 1])
+            self.behind[p] = min(into[p], self.behind[p + 1])
+
+    def duration(self) -> float:
+        return self.times[-1]
+
+    def price(self, window: Sequence[int], first: int) -> float:
+        """Duration with positions first.. replaced by window (as many nodes as it replaces)."""
+        order, costs = self.order, self.costs
+        last = first + len(window) - 1
+        t = self.times[first - 1]
+        prev = order[first - 1]
+        for node in window:
+            t += costs.leg(prev, node, t)
+            prev = node
+        if last == len(order) - 1:
+            return t
+        t += costs.leg(prev, order[last + 1], t)
+        shift = t - self.times[last + 1]
+        if -self.behind[last + 1] <= shift < self.ahead[last + 1]:
+            return self.duration() + shift
+        for a, b in zip(order[last + 1:], order[last + 2:]):
+            t += costs.leg(a, b, t)
+        return t
+
+
+def _moves(route: _TimedRoute, a: int, neighbors: Sequence[int], last: int):
+    """(first, window) rewrites around node a: or-opt of a segment starting at a next to a neighbor
+    (either orientation, before or after it) and 2-opt reversals that make a neighbor follow a."""
+    order, pos = route.order, route.pos
+    i = pos[a]
+    for b in neighbors:
+        k = pos[b]
+        if i + 1 < k <= last:
+            yield i + 1, order[i + 1:k + 1][::-1]
+    if i < 1:
+        return
+    for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+        j = i + length - 1
+        if j > last:
+            break
+        segment = order[i:j + 1]
+        for b in neighbors:
+            k = pos[b]
+            for p in (k, k - 1):
+                if p < 0 or p > last or i - 1 <= p <= j:
+                    continue
+                for piece in (segment, segment[::-1]):
+                    if p < i:
+                        yield p + 1, piece + order[p + 1:i]
+                    else:
+                        yield i, order[j + 1:p + 1] + piece
+
+
+def time_dependent_search(costs: TimeDependentCosts, order: List[int], fixed_end: bool = False,
+                          deadline: Optional[float] = None) -> List[int]:
+    """First-improvement or-opt/2-opt on time-dependent durations until no move helps or the deadline."""
+    n = len(order)
+    if n < 3:
+        return list(order)
+    neighbors = neighbor_lists(costs.base, NEIGHBOR_K)
+    route = _TimedRoute(costs, list(order))
+    last = n - 2 if fixed_end else n - 1
+    improved = True
+    while improved:
+        improved = False
+        for a in list(route.order):
+            if deadline is not None and time.monotonic() > deadline:
+                return route.order
+            best = route.duration()
+            for first, window in _moves(route, a, neighbors[a], last):
+                if route.price(window, first) < best - IMPROVEMENT_EPS:
+                    route.set(route.order[:first] + window + route.order[first + len(window):])
+                    improved = True
+                    break
+    return route.order
+
+
+def optimize_time_dependent(costs: TimeDependentCosts, start: int, end: Optional[int] = None,
+                            time_budget_s: Optional[float] = None, workers: int = 1) -> OrderResult:
+    """Order from start (to end, if given; end == start returns there) by time-dependent duration.
+
+    The time-independent optimum at the start hour seeds the search; its
+    time-dependent duration is reported as the heuristic cost.
+    """
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    closed = end == start
+    n = len(costs)
+    if closed:
+        # Route to a copy of start: same duration, and the copy is a fixed end
+        base = np.zeros((n + 1, n + 1))
+        base[:n, :n] = costs.base
+        base[:n, n] = costs.base[:, start]
+        costs = TimeDependentCosts(base, costs.hourly, costs.start_minute, costs.leg_overhead)
+        end = n
+    static_budget = None if time_budget_s is None else time_budget_s / 2
+    static = optimize_order(costs.matrix(costs.bucket(0)), start, end, time_budget_s=static_budget,
+                            workers=workers)
+    static_cost = costs.duration(static.order)
+    order = time_dependent_search(costs, static.order, end is not None, deadline)
+    cost = costs.duration(order)
+    if closed:
+        order = order[:-1]
+    gap = 100.0 * (static_cost - cost) / cost if cost > 0 else 0.0
+    return OrderResult(order, cost, "time_dependent", False, static_cost, gap)
@@ -0,0 +1,334 @@
+"""Single-vehicle stop ordering with delivery time windows and service times.
+
+All times are minutes after the route starts. A stop's service begins at
+max(arrival, earliest) and lasts its service time; arriving after latest
+makes the stop late. Routes minimize total lateness first, then the time
+the last stop is finished. Travel is a fixed matrix, or TimeDependentCosts
+when leg times depend on the hour they start in.
+
+Moves are screened with forward time slack (Savelsbergh): for each route
+position, how far its service start can be pushed back before some stop
+from there on misses its window. Only moves that pass that O(1) check and
+shorten travel are re-simulated, so a 50-stop route replans in well under
+a second.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from route_optimizer import (CostMatrix, IMPROVEMENT_EPS, NEIGHBOR_K, OR_OPT_MAX_SEGMENT, RoutePath, finite_costs,
+                             neighbor_lists)
+from time_dependent import TimeDependentCosts
+
+Travel = Union[np.ndarray, TimeDependentCosts]
+
+# Routes with at most this many stops besides the start (and end) are also solved exactly
+TIME_WINDOW_EXACT_MAX_STOPS = 9
+
+
+@dataclass
+class Schedule:
+    order: List[int]
+    arrival: np.ndarray    # per route position
+    begin: np.ndarray      # service start: max(arrival, earliest)
+    departure: np.ndarray  # begin + service
+    late: np.ndarray       # minutes after latest, 0 when on time
+
+    @property
+    def total_late(self) -> float:
+        return float(self.late.sum())
+
+    @property
+    def completion(self) -> float:
+        return float(self.departure[-1])
+
+    def key(self) -> Tuple[float, float]:
+        return round(self.total_late, 6), self.completion
+
+    def infeasible_positions(self) -> List[int]:
+        return [p for p in range(len(self.order)) if self.late[p] > 1e-6]
+
+
+def simulate(order: Sequence[int], travel: Travel, earliest: np.ndarray, latest: np.ndarray,
+             service: np.ndarray) -> Schedule:
+    """Arrival, service and lateness at every stop of order, leaving the first stop at time 0."""
+    timed = travel if isinstance(travel, TimeDependentCosts) else None
+    n = len(order)
+    arrival = np.zeros(n)
+    begin = np.zeros(n)
+    departure = np.zeros(n)
+    now = 0.0
+    prev = None
+    for p, stop in enumerate(order):
+        if prev is not None:
+            now += timed.leg(prev, stop, now) if timed is not None else travel[prev, stop]
+        arrival[p] = now
+        begin[p] = max(now, earliest[stop])
+        now = departure[p] = begin[p] + service[stop]
+        prev = stop
+    idx = np.asarray(order)
+    late = np.maximum(0.0, begin - latest[idx]) if n else np.zeros(0)
+    return Schedule(list(order), arrival, begin, departure, late)
+
+
+def forward_slack(schedule: Schedule, latest: np.ndarray) -> np.ndarray:
+    """F[p]: how much service at position p can start later with no stop from p on missing its window."""
+    idx = np.asarray(schedule.order)
+    room = latest[idx] - schedule.begin
+    wait = schedule.begin - schedule.arrival
+    slack = np.empty(len(idx))
+    running = np.inf
+    for p in range(len(idx) - 1, -1, -1):
+        running = min(room[p], running)
+        slack[p] = running
+        # Waiting at p absorbs part of any delay pushed onto later stops
+        running = running + wait[p]
+    return slack
+
+
+class _Problem:
+    def __init__(self, travel: Travel, earliest: np.ndarray, latest: np.ndarray, service: np.ndarray):
+        self.timed = travel if isinstance(travel, TimeDependentCosts) else None
+        # Fixed matrix for neighbor lists and travel deltas (the start hour's when time-dependent)
+        self.travel = finite_costs(travel) if self.timed is None else self.timed.matrix(self.timed.bucket(0))
+        self.earliest = earliest
+        self.latest = latest
+        self.service = service
+
+    def simulate(self, order: Sequence[int]) -> Schedule:
+        return simulate(order, self.timed or self.travel, self.earliest, self.latest, self.service)
+
+    def leg(self, i: int, j: int, minute: float) -> float:
+        return self.timed.leg(i, j, minute) if self.timed is not None else self.travel[i, j]
+
+    def legs(self, i: np.ndarray, j: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+        """Vectorized leg: i[k] -> j[k] leaving at minutes[k]."""
+        if self.timed is not None:
+            return self.timed.legs(i, j, minutes)
+        return np.broadcast_to(self.travel[i, j], np.shape(minutes)).copy()
+
+    def fits(self, schedule: Schedule, slack: np.ndarray, segment: Sequence[int], after: int) -> bool:
+        """O(1)-per-stop check that segment can follow position after without breaking any window.
+
+        Uses the current departure at after and the current slack from
+        after + 1 on; exact when the segment moves earlier, and a close
+        estimate when it moves later (removing it rarely delays anyone).
+        """
+        order = schedule.order
+        now = schedule.departure[after]
+        prev = order[after]
+        for stop in segment:
+            now += self.leg(prev, stop, now)
+            now = max(now, self.earliest[stop])
+            if now > self.latest[stop] + 1e-9:
+                return False
+            now += self.service[stop]
+            prev = stop
+        nxt = after + 1
+        if nxt >= len(order):
+            return True
+        begin_next = max(now + self.leg(prev, order[nxt], now), self.earliest[order[nxt]])
+        return begin_next - schedule.begin[nxt] <= slack[nxt] + 1e-9
+
+
+def _insert_cheapest(problem: _Problem, start: int, end: Optional[int], stops: Sequence[int]) -> List[int]:
+    """Insertion construction: repeatedly add the stop/slot pair that adds the least travel plus delay.
+
+    Slots are screened with forward time slack. Stops that fit nowhere are
+    added last, each where it leaves the route least late.
+    """
+    earliest, latest, service = problem.earliest, problem.latest, problem.service
+    order = [start] if end is None else [start, end]
+    pending = [s for s in stops if s != start and s != end]
+    unplaceable: List[int] = []
+    while pending:
+        schedule = problem.simulate(order)
+        slack = forward_slack(schedule, latest)
+        t = np.asarray(order)
+        slots = np.arange(len(order) - 1 if end is not None else len(order))
+        best = None
+        inner = slots + 1 < len(order)
+        nxt = slots[inner] + 1
+        replaced = problem.legs(t[slots[inner]], t[nxt], schedule.departure[slots[inner]])
+        for u in pending:
+            added = problem.legs(t[slots], u, schedule.departure[slots])
+            begin = np.maximum(schedule.departure[slots] + added, earliest[u])
+            ok = begin <= latest[u] + 1e-9
+            push = np.zeros(len(slots))
+            onward = problem.legs(u, t[nxt], begin[inner] + service[u])
+            begin_next = np.maximum(begin[inner] + service[u] + onward, earliest[t[nxt]])
+            push[inner] = begin_next - schedule.begin[nxt]
+            ok[inner] &= push[inner] <= slack[nxt] + 1e-9
+            added[inner] += onward - replaced
+            score = np.where(ok, added + np.maximum(push, 0.0), np.inf)
+            slot = int(np.argmin(score))
+            if np.isfinite(score[slot]) and (best is None or score[slot] < best[0]):
+                best = (float(score[slot]), u, int(slots[slot]))
+        if best is None:
+            unplaceable = pending
+            break
+        _, u, slot = best
+        order.insert(slot + 1, u)
+        pending.remove(u)
+    # Most urgent first, each in the slot that adds the least lateness
+    for u in sorted(unplaceable, key=lambda s: latest[s]):
+        last_slot = len(order) - 1 if end is not None else len(order)
+        candidates = [order[:slot + 1] + [u] + order[slot + 1:] for slot in range(last_slot)]
+        order = min(candidates, key=lambda o: problem.simulate(o).key())
+    return order
+
+
+def _exact_order(problem: _Problem, start: int, end: Optional[int], stops: Sequence[int]) -> List[int]:
+    """Cheapest (lateness, completion) order by dynamic programming over visited sets.
+
+    Each (visited set, last stop) keeps its Pareto labels of (lateness so
+    far, departure time), since an earlier departure can never make later
+    stops later. With time-dependent travel that holds as long as leaving
+    later never arrives earlier; solve_time_windows keeps whichever of this
+    and the heuristic route is better.
+    """
+    free = [s for s in stops if s != start and s != end]
+    begin = max(0.0, problem.earliest[start])
+    first = (max(0.0, begin - problem.latest[start]), begin + problem.service[start], (start,))
+    labels: Dict[Tuple[int, int], List[Tuple[float, float, Tuple[int, ...]]]] = {(0, start): [first]}
+
+    def extend(label: Tuple[float, float, Tuple[int, ...]], stop: int) -> Tuple[float, float, Tuple[int, ...]]:
+        late, now, path = label
+        now += problem.leg(path[-1], stop, now)
+        now = max(now, problem.earliest[stop])
+        return late + max(0.0, now - problem.latest[stop]), now + problem.service[stop], path + (stop,)
+
+    for mask in range(1 << len(free)):
+        for last in [start] + free:
+            for label in labels.pop((mask, last), []):
+                for bit, stop in enumerate(free):
+                    if mask >> bit & 1:
+                        continue
+                    new = extend(label, stop)
+                    bucket = labels.setdefault((mask | 1 << bit, stop), [])
+                    if any(o[0] <= new[0] + 1e-9 and o[1] <= new[1] + 1e-9 for o in bucket):
+                        continue
+                    bucket[:] = [o for o in bucket if not (new[0] <= o[0] + 1e-9 and new[1] <= o[1] + 1e-9)]
+                    bucket.append(new)
+                if mask == (1 << len(free)) - 1:
+                    done = extend(label, end) if end is not None else label
+                    labels.setdefault((-1, 0), []).append(done)
+    best = min(labels[(-1, 0)], key=lambda label: (round(label[0], 6), label[1]))
+    return list(best[2])
+
+
+def _relocate(order: List[int], i: int, j: int, after: int, rev: bool = False) -> List[int]:
+    segment = order[i:j + 1][::-1] if rev else order[i:j + 1]
+    rest = order[:i] + order[j + 1:]
+    at = after + 1 if after < i else after + 1 - len(segment)
+    return rest[:at] + segment + rest[at:]
+
+
+def _moved(order: List[int], move: Tuple) -> List[int]:
+    """order after a RoutePath move."""
+    if move[0] == "2opt":
+        _, i, k = move
+        return order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+    if move[0] == "or":
+        _, i, j, after, rev = move
+        return _relocate(order, i, j, after, rev)
+    _, i, j, k = move
+    return order[:i] + order[j + 1:k + 1] + order[i:j + 1] + order[k + 1:]
+
+
+def _improve(problem: _Problem, order: List[int], fixed_end: bool, neighbors: np.ndarray,
+             deadline: Optional[float]) -> List[int]:
+    """Or-opt, 2-opt and segment swap moves until none improves (lateness, completion) or the deadline passes."""
+    schedule = problem.simulate(order)
+    improved = True
+    while improved:
+        improved = False
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        # Late stops first: move each (with up to two followers) to an earlier slot,
+        # move a stop ahead of it to somewhere after it, or reverse the stretch that ends at it
+        last = len(order) - 2 if fixed_end else len(order) - 1
+        for p in schedule.infeasible_positions():
+            if p > last:
+                continue
+            candidates = [("or", p, p + length - 1, after, False)
+                          for length in range(1, OR_OPT_MAX_SEGMENT + 1) if p + length - 1 <= last
+                          for after in range(0, p - 1)]
+            candidates += [("or", q, q, after, False) for q in range(1, p) for after in range(p, last + 1)]
+            candidates += [("2opt", i, p) for i in range(1, p)]
+            for move in candidates:
+                candidate = _moved(order, move)
+                trial = problem.simulate(candidate)
+                if trial.key() < schedule.key():
+                    order, schedule, improved = candidate, trial, True
+                    break
+            if improved or (deadline is not None and time.monotonic() > deadline):
+                break
+        if improved:
+            continue
+        path = RoutePath(problem.travel, order, fixed_end)
+        slack = forward_slack(schedule, problem.latest)
+        feasible = schedule.total_late <= 1e-6
+        for a in order:
+            moves = (path.or_opt_moves(a, neighbors[a]) + path.two_opt_moves(a, neighbors[a])
+                     + path.swap_moves(a, neighbors[a], neighbors))
+            for move in moves:
+                if path.delta(move) >= -IMPROVEMENT_EPS:
+                    continue
+                if feasible and move[0] == "or" and not move[4]:
+                    _, i, j, after, _ = move
+                    if not problem.fits(schedule, slack, order[i:j + 1], after):
+                        continue
+                candidate = _moved(order, move)
+                trial = problem.simulate(candidate)
+                if trial.key() < schedule.key():
+                    order, schedule, improved = candidate, trial, True
+                    break
+            if improved or (deadline is not None and time.monotonic() > deadline):
+                break
+    return order
+
+
+def solve_time_windows(travel_minutes: Union[CostMatrix, TimeDependentCosts], earliest: Sequence[float],
+                       latest: Sequence[float], service: Sequence[float], start: int = 0, end: Optional[int] = None,
+                       time_budget_s: Optional[float] = None) -> Schedule:
+    """Order every stop from start (and to end, if given) respecting windows where possible.
+
+    earliest/latest/service are per stop, in minutes after departure from
+    start (use -inf/inf for an open window). travel_minutes is a matrix or
+    TimeDependentCosts. Stops that cannot be served in their window still
+    appear in the route, with their lateness in the returned Schedule.
+    """
+    travel = travel_minutes if isinstance(travel_minutes, TimeDependentCosts) else finite_costs(travel_minutes)
+    problem = _Problem(travel, np.asarray(earliest, dtype=float), np.asarray(latest, dtype=float),
+                       np.asarray(service, dtype=float))
+    n = len(travel)
+    deadline = None if time_budget_s is None else time.monotonic() + time_budget_s
+    order = _insert_cheapest(problem, start, end, range(n))
+    if n > 3:
+        order = _improve(problem, order, end is not None, neighbor_lists(problem.travel, NEIGHBOR_K), deadline)
+    schedule = problem.simulate(order)
+    if n - (2 if end is not None and end != start else 1) <= TIME_WINDOW_EXACT_MAX_STOPS:
+        exact = problem.simulate(_exact_order(problem, start, end, range(n)))
+        if exact.key() < schedule.key():
+            schedule = exact
+    return schedule
+
+
+def schedule_report(schedule: Schedule) -> List[Dict[str, float]]:
+    """Per route position: arrival, wait, service start/end and lateness, in minutes after departure."""
+    report = []
+    for p, stop in enumerate(schedule.order):
+        report.append({
+            "index": stop,
+            "arrival_minutes": round(float(schedule.arrival[p]), 2),
+            "wait_minutes": round(float(schedule.begin[p] - schedule.arrival[p]), 2),
+            "service_start_minutes": round(float(schedule.begin[p]), 2),
+            "departure_minutes": round(float(schedule.departure[p]), 2),
+            "late_minutes": round(float(schedule.late[p]), 2),
+            "feasible": bool(schedule.late[p] <= 1e-6),
+        })
+    return report
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+ZipRoute Optimizer Benchmark
+Runs every stop-ordering solver on TSPLIB instances (burma14, ulysses16 and
+the asymmetric br17 are built in; more .tsp/.atsp files can be passed on the
+command line) and
+on synthetic Indian-city delivery routes, and reports tour cost, gap to the
+best-known cost, wall time and peak memory (runs offline). Reports carry
+the git commit, and --baseline compares against an earlier report.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+from route_optimizer import (  # noqa: E402
+    HELD_KARP_MAX_STOPS, build_best_order_multistart, chained_local_search, held_karp, nearest_neighbor_order,
+    shutdown_pool, two_opt_improvement, two_opt_improvement_reference, _path_cost,
+)
+from decomposition import DECOMPOSE_CLUSTER_SIZE, decompose_order, hilbert_order  # noqa: E402
+from approx_matrix import PRIOR_DETOUR, PRIOR_SPEED_KMH, haversine_matrix  # noqa: E402
+
+SEED = 42
+# Wall-clock budget for every time-bounded solver
+SOLVER_BUDGET_SECONDS = 1.0
+# The legacy full-recompute 2-opt is O(n^3) per pass; skip it beyond this size
+LEGACY_MAX_STOPS = 100
+
+# Optimal tour lengths of TSPLIB instances (Reinelt's published optima)
+BEST_KNOWN = {
+    "burma14": 3323, "ulysses16": 6859, "ulysses22": 7013, "att48": 10628, "eil51": 426, "berlin52": 7542,
+    "st70": 675, "eil76": 538, "pr76": 108159, "rat99": 1211, "kroA100": 21282, "ch130": 6110,
+    "a280": 2579, "pcb442": 50778,
+    "br17": 39, "ftv33": 1286, "ftv35": 1473, "p43": 5620, "ry48p": 14422, "ft53": 6905, "ftv70": 1950,
+    "kro124p": 36230, "rbg323": 1326,
+}
+
+BURMA14 = """NAME: burma14
+TYPE: TSP
+COMMENT: 14-Staedte in Burma (Zaw Win)
+DIMENSION: 14
+EDGE_WEIGHT_TYPE: GEO
+EDGE_WEIGHT_FORMAT: FUNCTION
+DISPLAY_DATA_TYPE: COORD_DISPLAY
+NODE_COORD_SECTION
+   1  16.47       96.10
+   2  16.47       94.44
+   3  20.09       92.54
+   4  22.39       93.37
+   5  25.23       97.24
+   6  22.00       96.05
+   7  20.47       97.02
+   8  17.20       96.29
+   9  16.30       97.38
+  10  14.05       98.12
+  11  16.53       97.38
+  12  21.52       95.59
+  13  19.41       97.13
+  14  20.09       94.55
+EOF
+"""
+
+ULYSSES16 = """NAME: ulysses16.tsp
+TYPE: TSP
+COMMENT: Odyssey of Ulysses (Groetschel/Padberg)
+DIMENSION: 16
+EDGE_WEIGHT_TYPE: GEO
+DISPLAY_DATA_TYPE: COORD_DISPLAY
+NODE_COORD_SECTION
+ 1 38.24 20.42
+ 2 39.57 26.15
+ 3 40.56 25.32
+ 4 36.26 23.12
+ 5 33.48 10.54
+ 6 37.56 12.19
+ 7 38.42 13.11
+ 8 37.52 20.44
+ 9 41.23 9.10
+ 10 41.17 13.05
+ 11 36.08 -5.21
+ 12 38.47 15.13
+ 13 38.15 15.35
+ 14 37.51 15.17
+ 15 35.49 14.32
+ 16 39.36 19.56
+EOF
+"""
+
+BR17 = """NAME: br17
+TYPE: ATSP
+COMMENT: 17 city problem (Repetto)
+DIMENSION: 17
+EDGE_WEIGHT_TYPE: EXPLICIT
+EDGE_WEIGHT_FORMAT: FULL_MATRIX
+EDGE_WEIGHT_SECTION
+ 9999    3    5   48   48    8    8    5    5    3    3    0    3    5    8    8    5
+    3 9999    3   48   48    8    8    5    5    0    0    3    0    3    8    8    5
+    5    3 9999   72   72   48   48   24   24    3    3    5    3    0   48   48   24
+   48   48   74 9999    0    6    6   12   12   48   48   48   48   74    6    6   12
+   48   48   74    0 9999    6    6   12   12   48   48   48   48   74    6    6   12
+    8    8   50    6    6 9999    0    8    8    8    8    8    8   50    0    0    8
+    8    8   50    6    6    0 9999    8    8    8    8    8    8   50    0    0    8
+    5    5   26   12   12    8    8 9999    0    5    5    5    5   26    8    8    0
+    5    5   26   12   12    8    8    0 9999    5    5    5    5   26    8    8    0
+    3    0    3   48   48    8    8    5    5 9999    0    3    0    3    8    8    5
+    3    0    3   48   48    8    8    5    5    0 9999    3    0    3    8    8    5
+    0    3    5   48   48    8    8    5    5    3    3 9999    3    5    8    8    5
+    3    0    3   48   48    8    8    5    5    0    0    3 9999    3    8    8    5
+    5    3    0   72   72   48   48   24   24    3    3    5    3 9999   48   48   24
+    8    8   50    6    6    0    0    8    8    8    8    8    8   50 9999    0    8
+    8    8   50    6    6    0    0    8    8    8    8    8    8   50    0 9999    8
+    5    5   26   12   12    8    8    0    0    5    5    5    5   26    8    8 9999
+EOF
+"""
+
+# (name, (lat, lon) of the centre, spread of stops north-south and east-west in km)
+INDIAN_CITIES = [
+    ("bangalore", (12.9716, 77.5946), (9.0, 9.0)),
+    ("mumbai", (19.0760, 72.8777), (16.0, 5.0)),  # long, narrow peninsula
+    ("delhi", (28.6139, 77.2090), (12.0, 12.0)),
+    ("chennai", (13.0827, 80.2707), (12.0, 6.0)),  # along the coast
+    ("hyderabad", (17.3850, 78.4867), (10.0, 10.0)),
+]
+# (city, stops including the depot); routes are open paths from the depot, like the app's
+SYNTHETIC_ROUTES = [("bangalore", 12), ("chennai", 16), ("mumbai", 60), ("delhi", 200), ("hyderabad", 500),
+                    ("bangalore", 1000)]
+# Stops gather around this many delivery hubs per city
+SYNTHETIC_HUBS = 6
+
+@dataclass
+class Instance:
+    """A benchmark problem; tours return to stop 0 when closed, routes end anywhere otherwise"""
+    name: str
+    source: str
+    matrix: np.ndarray
+    closed: bool
+    asymmetric: bool
+    coords: Optional[List[Tuple[float, float]]] = None  # (lat, lon) per stop, for the geometric solvers
+    best_known: Optional[float] = None
+    best_known_source: Optional[str] = None
+
+@dataclass
+class BenchmarkResult:
+    """Data class for one solver run"""
+    instance: str
+    solver: str
+    num_stops: int
+    asymmetric: bool
+    closed: bool
+    seconds: float
+    peak_memory_mb: float
+    cost: float
+    best_known: Optional[float]
+    best_known_source: Optional[str]
+    gap_percent: Optional[float]
+
+def _tsplib_distance(kind: str, coords: np.ndarray) -> np.ndarray:
+    """Integer TSPLIB distances for EUC_2D, CEIL_2D, ATT and GEO coordinates"""
+    if kind == "GEO":
+        deg = np.trunc(coords)
+        rad = math.pi * (deg + 5.0 * (coords - deg) / 3.0) / 180.0
+        lat, lon = rad[:, 0], rad[:, 1]
+        q1 = np.cos(lon[:, None] - lon[None, :])
+        q2 = np.cos(lat[:, None] - lat[None, :])
+        q3 = np.cos(lat[:, None] + lat[None, :])
+        inner = np.clip(0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3), -1.0, 1.0)
+        dist = np.trunc(6378.388 * np.arccos(inner) + 1.0)
+    else:
+        dx = coords[:, None, 0] - coords[None, :, 0]
+        dy = coords[:, None, 1] - coords[None, :, 1]
+        if kind == "EUC_2D":
+            dist = np.floor(np.hypot(dx, dy) + 0.5)
+        elif kind == "CEIL_2D":
+            dist = np.ceil(np.hypot(dx, dy))
+        elif kind == "ATT":
+            r = np.sqrt((dx ** 2 + dy ** 2) / 10.0)
+            t = np.floor(r + 0.5)
+            dist = np.where(t < r, t + 1.0, t)
+        else:
+            raise ValueError(f"Unsupported EDGE_WEIGHT_TYPE {kind}")
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+def _explicit_matrix(fmt: str, n: int, weights: List[float]) -> np.ndarray:
+    """Full matrix from an EDGE_WEIGHT_SECTION in FULL_MATRIX or one of the triangular formats"""
+    if fmt == "FULL_MATRIX":
+        return np.array(weights[:n * n], dtype=float).reshape(n, n)
+    matrix = np.zeros((n, n))
+    values = iter(weights)
+    for i in range(n):
+        if fmt == "UPPER_ROW":
+            cols = range(i + 1, n)
+        elif fmt == "LOWER_ROW":
+            cols = range(i)
+        elif fmt == "UPPER_DIAG_ROW":
+            cols = range(i, n)
+        elif fmt == "LOWER_DIAG_ROW":
+            cols = range(i + 1)
+        else:
+            raise ValueError(f"Unsupported EDGE_WEIGHT_FORMAT {fmt}")
+        for j in cols:
+            matrix[i, j] = matrix[j, i] = next(values)
+    return matrix
+
+def parse_tsplib(text: str) -> Instance:
+    """Parse a TSPLIB .tsp/.atsp file (TSP or ATSP; coordinate or explicit weights)"""
+    spec: Dict[str, str] = {}
+    coords: List[Tuple[float, float]] = []
+    weights: List[float] = []
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line == "EOF":
+            continue
+        if section is None and ":" in line:
+            key, value = line.split(":", 1)
+            spec[key.strip().upper()] = value.strip()
+            continue
+        if line.endswith("_SECTION"):
+            section = line
+            continue
+        if section == "NODE_COORD_SECTION":
+            _, x, y = line.split()[:3]
+            coords.append((float(x), float(y)))
+        elif section == "EDGE_WEIGHT_SECTION":
+            weights.extend(float(v) for v in line.split())
+    name = spec.get("NAME", "unnamed").split(".")[0]
+    n = int(spec["DIMENSION"])
+    kind = spec.get("EDGE_WEIGHT_TYPE", "EXPLICIT").upper()
+    if kind == "EXPLICIT":
+        matrix = _explicit_matrix(spec.get("EDGE_WEIGHT_FORMAT", "FULL_MATRIX").upper(), n, weights)
+        np.fill_diagonal(matrix, 0.0)
+    else:
+        matrix = _tsplib_distance(kind, np.array(coords[:n]))
+    latlon = None
+    if kind == "GEO":
+        # DDD.MM degrees and minutes
+        latlon = [(int(x) + (x - int(x)) * 5.0 / 3.0, int(y) + (y - int(y)) * 5.0 / 3.0) for x, y in coords]
+    elif coords:
+        # Plane coordinates, scaled into a city-sized patch of (lat, lon)
+        xy = np.array(coords[:n])
+        span = float((xy.max(axis=0) - xy.min(axis=0)).max()) or 1.0
+        scaled = (xy - xy.min(axis=0)) / span * 0.5
+        latlon = [(float(y), float(x)) for x, y in scaled]
+    best = BEST_KNOWN.get(name)
+    return Instance(
+        name=name,
+        source="tsplib",
+        matrix=matrix,
+        closed=True,
+        asymmetric=not np.allclose(matrix, matrix.T),
+        coords=latlon,
+        best_known=float(best) if best is not None else None,
+        best_known_source="tsplib" if best is not None else None,
+    )
+
+def make_city_route(city: str, num_stops: int, rng: np.random.Generator) -> Instance:
+    """Travel-time matrix (minutes) for delivery stops around a city's hubs, depot first"""
+    centre, spread_km = next((c, s) for name, c, s in INDIAN_CITIES if name == city)
+    km_per_deg_lon = 111.2 * math.cos(math.radians(centre[0]))
+    hubs = rng.normal(0, 0.6, (SYNTHETIC_HUBS, 2)) * spread_km
+    offsets = hubs[rng.integers(SYNTHETIC_HUBS, size=num_stops)] + rng.normal(0, 1.5, (num_stops, 2))
+    coords = [(centre[0] + dy / 111.2, centre[1] + dx / km_per_deg_lon) for dy, dx in offsets]
+    minutes = haversine_matrix(coords) * PRIOR_DETOUR / PRIOR_SPEED_KMH * 60.0
+    # One-way streets and turn restrictions make A->B and B->A differ
+    minutes = minutes * (1 + 0.25 * rng.random((num_stops, num_stops)))
+    np.fill_diagonal(minutes, 0.0)
+    return Instance(name=f"{city}_{num_stops}", source="synthetic", matrix=minutes, closed=False,
+                    asymmetric=True, coords=coords)
+
+def _as_path(instance: Instance) -> Tuple[np.ndarray, Optional[int]]:
+    """(costs, end) of the path problem: a closed tour becomes a path to a copy of stop 0"""
+    if not instance.closed:
+        return instance.matrix, None
+    n = len(instance.matrix)
+    costs = np.full((n + 1, n + 1), np.inf)
+    costs[:n, :n] = instance.matrix
+    costs[:n, n] = instance.matrix[:, 0]
+    costs[n, n] = 0.0
+    return costs, n
+
+def _nearest_neighbor(costs: np.ndarray, end: Optional[int]) -> List[int]:
+    if end is None:
+        return nearest_neighbor_order(costs, 0)
+    return nearest_neighbor_order(costs[:end, :end], 0) + [end]
+
+def _two_opt(costs: np.ndarray, end: Optional[int]) -> List[int]:
+    return two_opt_improvement(costs, _nearest_neighbor(costs, end), fixed_end=end is not None)
+
+def _legacy_two_opt(costs: np.ndarray, end: Optional[int]) -> List[int]:
+    # Always keeps the last stop in place, so open routes give it a slightly harder problem
+    return two_opt_improvement_reference(costs, _nearest_neighbor(costs, end))
+
+def _chained(costs: np.ndarray, end: Optional[int]) -> List[int]:
+    return chained_local_search(costs, _two_opt(costs, end), time_budget_s=SOLVER_BUDGET_SECONDS,
+                                fixed_end=end is not None)
+
+def _best_order_multistart(costs: np.ndarray, end: Optional[int], workers: int = 1) -> List[int]:
+    # A start at index 0 keeps the app's sequential order, so stops 0 and 1 trade places
+    swap = np.arange(len(costs))
+    swap[[0, 1]] = [1, 0]
+    order = build_best_order_multistart(costs[np.ix_(swap, swap)], 1, SOLVER_BUDGET_SECONDS, workers,
+                                        None if end is None else int(swap[end]))
+    return [int(swap[i]) for i in order]
+
+def _held_karp(costs: np.ndarray, end: Optional[int]) -> List[int]:
+    return held_karp(costs, 0, end)[0]
+
+def _solvers(instance: Instance, workers: int) -> List[Tuple[str, Callable[[], List[int]]]]:
+    """(name, run) for every solver that applies; each run returns an order of the instance's stops"""
+    n = len(instance.matrix)
+    costs, end = _as_path(instance)
+    strip = (lambda order: order[:-1]) if instance.closed else (lambda order: order)
+    solvers = [
+        ("nearest_neighbor", lambda: strip(_nearest_neighbor(costs, end))),
+        ("two_opt", lambda: strip(_two_opt(costs, end))),
+        ("chained_local_search", lambda: strip(_chained(costs, end))),
+        ("build_best_order_multistart", lambda: strip(_best_order_multistart(costs, end, workers))),
+    ]
+    if n <= LEGACY_MAX_STOPS:
+        solvers.insert(2, ("legacy_two_opt", lambda: strip(_legacy_two_opt(costs, end))))
+    if n <= HELD_KARP_MAX_STOPS:
+        solvers.append(("held_karp", lambda: _held_karp(instance.matrix, 0 if instance.closed else None)))
+    if instance.coords is not None:
+        solvers.append(("hilbert", lambda: hilbert_order(instance.coords, 0)))
+        if n > DECOMPOSE_CLUSTER_SIZE:
+            tour_end = 0 if instance.closed else None
+            solvers.append(("decomposition", lambda: decompose_order(
+                instance.matrix, instance.coords, 0, tour_end, SOLVER_BUDGET_SECONDS, workers).order))
+    return solvers
+
+def run_solver(instance: Instance, name: str, run: Callable[[], List[int]]) -> BenchmarkResult:
+    """Time one solver, then run it again under tracemalloc for its peak memory"""
+    t0 = time.perf_counter()
+    order = run()
+    seconds = time.perf_counter() - t0
+    assert sorted(order) == list(range(len(instance.matrix))) and order[0] == 0, f"{name}: invalid order"
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return BenchmarkResult(
+        instance=instance.name,
+        solver=name,
+        num_stops=len(instance.matrix),
+        asymmetric=instance.asymmetric,
+        closed=instance.closed,
+        seconds=round(seconds, 4),
+        peak_memory_mb=round(peak / 2 ** 20, 2),
+        cost=round(_path_cost(instance.matrix, order, instance.closed), 2),
+        best_known=None,
+        best_known_source=None,
+        gap_percent=None,
+    )
+
+def load_instances(paths: List[str]) -> List[Instance]:
+    rng = np.random.default_rng(SEED)
+    instances = [parse_tsplib(BURMA14), parse_tsplib(ULYSSES16), parse_tsplib(BR17)]
+    for path in paths:
+        with open(path) as f:
+            instances.append(parse_tsplib(f.read()))
+    for city, num_stops in SYNTHETIC_ROUTES:
+        instances.append(make_city_route(city, num_stops, rng))
+    return instances
+
+def run_benchmark(instances: List[Instance], workers: int) -> List[BenchmarkResult]:
+    results: List[BenchmarkResult] = []
+    for instance in instances:
+        kind = "ATSP" if instance.asymmetric else "TSP"
+        shape = "tour" if instance.closed else "route"
+        print(f"\n📦 {instance.name} ({len(instance.matrix)} stops, {kind} {shape}, {instance.source})")
+        runs = [run_solver(instance, name, run) for name, run in _solvers(instance, workers)]
+        if instance.best_known is None:
+            exact = next((r for r in runs if r.solver == "held_karp"), None)
+            if exact is not None:
+                instance.best_known, instance.best_known_source = exact.cost, "held_karp"
+            else:
+                instance.best_known, instance.best_known_source = min(r.cost for r in runs), "best_of_run"
+        for r in runs:
+            r.best_known, r.best_known_source = instance.best_known, instance.best_known_source
+            if instance.best_known > 0:
+                r.gap_percent = round(100 * (r.cost - instance.best_known) / instance.best_known, 2)
+            print(f"  {r.solver:28s} cost {r.cost:12.2f}  gap {r.gap_percent:7.2f}%  "
+                  f"{r.seconds:8.3f}s  {r.peak_memory_mb:8.2f} MB")
+        results.extend(runs)
+    return results
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print cost and time changes against a previous report, per instance and solver"""
+    before = {(r["instance"], r["solver"]): r for r in baseline.get("results", [])}
+    print(f"\n📊 Compared with {baseline.get('git_commit') or 'baseline'} ({baseline.get('timestamp')})")
+    for r in report["results"]:
+        old = before.get((r["instance"], r["solver"]))
+        if old is None:
+            continue
+        cost_change = 100 * (r["cost"] - old["cost"]) / old["cost"] if old["cost"] else 0.0
+        flag = "⚠️ " if cost_change > 0.5 else "  "
+        print(f"{flag}{r['instance']:16s} {r['solver']:28s} cost {cost_change:+7.2f}%  "
+              f"time {old['seconds']:8.3f}s -> {r['seconds']:8.3f}s")
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def save_report(report: Dict[str, Any]) -> str:
+    """Save benchmark report to json_files/"""
+    out_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "json_files"))
+    os.makedirs(out_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(out_dir, f"optimizer_benchmark_{timestamp}.json")
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2)
+    return filename
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stop-ordering solvers offline")
+    parser.add_argument("tsplib", nargs="*", help="Extra TSPLIB .tsp/.atsp files")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for the parallel solvers")
+    parser.add_argument("--baseline", help="Earlier optimizer_benchmark_*.json to compare against")
+    args = parser.parse_args()
+
+    print("🚀 ZipRoute Optimizer Benchmark")
+    print("=" * 50)
+    try:
+        results = run_benchmark(load_instances(args.tsplib), args.workers)
+    finally:
+        shutdown_pool()
+    report = {
+        "benchmark": "optimizer",
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": _git_commit(),
+        "seed": SEED,
+        "solver_budget_seconds": SOLVER_BUDGET_SECONDS,
+        "workers": args.workers,
+        "results": [asdict(r) for r in results],
+    }
+    filename = save_report(report)
+    print(f"\n💾 JSON report saved: {filename}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_reports(report, json.load(f))
+
+if __name__ == "__main__":
+    main()